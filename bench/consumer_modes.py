@@ -0,0 +1,191 @@
+"""Benchmark the consumer's threaded and asyncio engines (CONSUMER_MODE) on the send path.
+
+Feeds the same complaint records through each engine's real handler: decode,
+template rendering, MIME serialization and an SMTP transaction over the engine's
+connection pool. Kafka itself is left out (records are handed to the engine
+directly), so the result isolates how many sends each engine keeps in flight and
+what that costs in CPU.
+
+The SMTP sink runs in a separate process and delays its reply to DATA by
+--smtp-latency-ms, standing in for a remote provider's round trip; against a
+local Mailhog every send is near-instant and both engines look alike.
+
+Reports per engine: emails/second and CPU milliseconds per email in the consumer
+process (all threads). The threaded engine has at most --workers sends in
+flight; for the async engine the observed peak is reported.
+
+Example:
+    python bench/consumer_modes.py --messages 2000 --smtp-latency-ms 100 \\
+        --output results/consumer-modes-$(git rev-parse --short HEAD).json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from pipeline import _git_revision
+
+Rec = namedtuple("Rec", "offset partition value headers")
+
+
+async def _serve_smtp(port: int, latency: float, ready) -> None:
+    async def session(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.write(b"220 bench-sink ESMTP\r\n")
+        while line := await reader.readline():
+            verb = line.decode(errors="replace").strip().split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                writer.write(b"250-bench-sink\r\n250 8BITMIME\r\n")
+            elif verb in {"HELO", "MAIL", "RCPT", "RSET", "NOOP"}:
+                writer.write(b"250 OK\r\n")
+            elif verb == "DATA":
+                writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                while (data := await reader.readline()) not in (b".\r\n", b".\n", b""):
+                    pass
+                await asyncio.sleep(latency)
+                writer.write(b"250 OK queued\r\n")
+            elif verb == "QUIT":
+                writer.write(b"221 Bye\r\n")
+                await writer.drain()
+                break
+            else:
+                writer.write(b"502 Command not implemented\r\n")
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(session, "127.0.0.1", port, backlog=1024)
+    ready.set()
+    async with server:
+        await server.serve_forever()
+
+
+def _sink_process(port: int, latency: float, ready) -> None:
+    asyncio.run(_serve_smtp(port, latency, ready))
+
+
+def _records(n: int, partitions: int) -> list[tuple[int, Rec]]:
+    records = []
+    for i in range(n):
+        payload = {
+            "id": f"00000000-0000-4000-8000-{i:012d}", "submitted_at": time.time(), "email_id": f"user{i}@example.com",
+            "first_name": "Ada", "last_name": "Lovelace", "subject": "Billing", "body": "I was charged twice.",
+        }
+        partition = i % partitions
+        records.append((partition, Rec(i // partitions, partition, json.dumps(payload).encode(),
+                                       [("content-type", b"application/json")])))
+    return records
+
+
+def _run_threaded(records, workers: int) -> dict:
+    from kafka.structs import TopicPartition
+    from app import email_sender, main
+    from app.worker_pool import WorkerPool
+
+    # Per-partition bound off: only the worker count limits concurrency, as for async below
+    pool = WorkerPool(main.handle_message, workers=workers, max_in_flight=len(records))
+    cpu, wall = time.process_time(), time.perf_counter()
+    for partition, rec in records:
+        pool.submit(TopicPartition("complaints.v1", partition), rec)
+    pool.drain()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    failed = len(pool.failed())
+    pool.shutdown()
+    email_sender.close_pool()
+    return {"workers": workers, "wall_s": wall, "cpu_s": cpu, "failed_partitions": failed}
+
+
+def _run_async(records, concurrency: int) -> dict:
+    from aiokafka.structs import TopicPartition
+    from app import async_email_sender
+    from app.async_consumer import AsyncConsumerEngine
+
+    async def go():
+        engine = AsyncConsumerEngine(concurrency=concurrency, max_in_flight=concurrency)
+        peak = 0
+        cpu, wall = time.process_time(), time.perf_counter()
+        for partition, rec in records:
+            await engine.submit(TopicPartition("complaints.v1", partition), rec)
+            peak = max(peak, engine.in_flight())
+        await engine.drain()
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        failed = sum(1 for t in engine._trackers.values() if t.first_failed is not None)
+        await async_email_sender.close_pool()
+        return {"concurrency": concurrency, "wall_s": wall, "cpu_s": cpu, "peak_in_flight": peak,
+                "failed_partitions": failed}
+
+    return asyncio.run(go())
+
+
+def _summarize(result: dict, n: int) -> dict:
+    return {
+        **{k: v for k, v in result.items() if k not in ("wall_s", "cpu_s")},
+        "emails_per_s": round(n / result["wall_s"], 1),
+        "cpu_ms_per_email": round(result["cpu_s"] * 1000 / n, 3),
+        "wall_s": round(result["wall_s"], 2),
+    }
+
+
+def main(args):
+    # The engines read their settings at import time
+    os.environ.update({
+        "SMTP_HOST": "127.0.0.1", "SMTP_PORT": str(args.smtp_port), "SMTP_EMAIL": "bench@example.com",
+        "SMTP_STARTTLS": "false", "SMTP_POOL_SIZE": str(args.workers),
+        "SMTP_ASYNC_POOL_SIZE": str(args.concurrency), "SMTP_RATE_LIMIT": "1000000",
+        "SMTP_MAX_MESSAGES_PER_CONNECTION": "1000000",
+        "CONSUMER_DEDUP_ENABLED": "false", "KAFKA_RETRY_ENABLED": "false",
+    })
+    os.environ.pop("DATABASE_URL", None)
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "consumer"))
+    import logging
+    logging.disable(logging.WARNING)   # one INFO line per email would dominate the CPU profile
+
+    ready = multiprocessing.Event()
+    sink = multiprocessing.Process(target=_sink_process, args=(args.smtp_port, args.smtp_latency_ms / 1000, ready),
+                                   daemon=True)
+    sink.start()
+    ready.wait(10)
+    try:
+        records = _records(args.messages, args.partitions)
+        modes = {}
+        if args.mode in ("threaded", "both"):
+            modes["threaded"] = _summarize(_run_threaded(records, args.workers), args.messages)
+        if args.mode in ("async", "both"):
+            modes["async"] = _summarize(_run_async(records, args.concurrency), args.messages)
+    finally:
+        sink.terminate()
+
+    result = {
+        "benchmark": "consumer_modes",
+        "git": _git_revision(),
+        "started_at": datetime.now().astimezone().isoformat(timespec="seconds"),
+        "params": {"messages": args.messages, "partitions": args.partitions,
+                   "smtp_latency_ms": args.smtp_latency_ms, "workers": args.workers, "concurrency": args.concurrency},
+        "modes": modes,
+    }
+    if "threaded" in modes and "async" in modes:
+        result["async_vs_threaded"] = {
+            "throughput_x": round(modes["async"]["emails_per_s"] / modes["threaded"]["emails_per_s"], 2),
+            "cpu_per_email_x": round(modes["async"]["cpu_ms_per_email"] / modes["threaded"]["cpu_ms_per_email"], 2),
+        }
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["threaded", "async", "both"], default="both")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--partitions", type=int, default=6)
+    parser.add_argument("--smtp-latency-ms", type=float, default=100.0, help="sink delay before accepting DATA")
+    parser.add_argument("--smtp-port", type=int, default=2526)
+    parser.add_argument("--workers", type=int, default=4, help="threaded: CONSUMER_WORKERS and SMTP_POOL_SIZE")
+    parser.add_argument("--concurrency", type=int, default=200, help="async: CONSUMER_ASYNC_CONCURRENCY and pool size")
+    parser.add_argument("--output", help="also write the JSON result here")
+    main(parser.parse_args())
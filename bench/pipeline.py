@@ -0,0 +1,300 @@
+"""End-to-end benchmark for the submit -> Kafka -> email pipeline.
+
+Drives POST /submit at a fixed rate (open loop: requests are started on
+schedule whether or not earlier ones have finished), then waits for every
+submitted complaint to arrive as an email and reports:
+
+  * submit latency p50/p95/p99 as seen by the client
+  * end-to-end delivery time (submit start -> email received) p50/p95/p99
+  * consumer drain rate: emails/second between the first and last delivery
+
+Emails are matched to submissions by the ticket id (the record id returned by
+/submit) that the consumer puts in the message body. Two sinks are supported:
+
+  * --sink fake      an SMTP server started by this script on --smtp-port that
+                     accepts everything and timestamps each message on receipt.
+                     Point the consumer at it, e.g. SMTP_HOST=host.docker.internal
+                     SMTP_PORT=2525 SMTP_STARTTLS=false in consumer/.env.
+  * --sink mailhog   a Mailhog instance; delivery time is Mailhog's Created
+                     timestamp, so run the benchmark on the same host.
+
+Results are printed as JSON and optionally written with --output. Pass a
+previous result file with --baseline to include the relative change of the
+key metrics, so runs can be compared.
+
+Example:
+    python bench/pipeline.py --rate 50 --duration 30 --sink fake --smtp-port 2525 \\
+        --output results/pipeline-$(git rev-parse --short HEAD).json
+"""
+import argparse
+import asyncio
+import json
+import re
+import socketserver
+import subprocess
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import httpx
+
+from submit_load import _percentile
+
+TICKET_RE = re.compile(r"ticket number is ([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})")
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: EHLO, MAIL, RCPT, DATA, RSET, NOOP, QUIT."""
+
+    def reply(self, line: str):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 bench-sink ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line.decode(errors="replace").strip().split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.reply("250-bench-sink")
+                self.reply("250 8BITMIME")
+            elif verb in {"HELO", "MAIL", "RCPT", "RSET", "NOOP"}:
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                chunks = []
+                for data in iter(self.rfile.readline, b""):
+                    if data in (b".\r\n", b".\n"):
+                        break
+                    chunks.append(data)
+                self.server.sink.received(b"".join(chunks).decode(errors="replace"))
+                self.reply("250 OK queued")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class FakeSMTPSink:
+    """Threaded SMTP server that records when each ticket id was received."""
+
+    def __init__(self, host: str, port: int):
+        self.deliveries: dict[str, float] = {}
+        self._lock = threading.Lock()
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer((host, port), _SMTPHandler)
+        self._server.daemon_threads = True
+        self._server.sink = self
+        self.port = self._server.server_address[1]
+
+    def received(self, message: str):
+        now = time.time()
+        match = TICKET_RE.search(message)
+        if match:
+            with self._lock:
+                self.deliveries.setdefault(match.group(1), now)
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="bench-smtp").start()
+        return self
+
+    def poll(self) -> dict[str, float]:
+        with self._lock:
+            return dict(self.deliveries)
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _parse_mailhog_time(value: str) -> float:
+    # Mailhog reports nanoseconds; datetime only takes microseconds
+    value = re.sub(r"(\.\d{6})\d+", r"\1", value).replace("Z", "+00:00")
+    return datetime.fromisoformat(value).timestamp()
+
+
+class MailhogSink:
+    """Reads deliveries back from Mailhog's HTTP API."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.deliveries: dict[str, float] = {}
+
+    def start(self):
+        return self
+
+    def poll(self) -> dict[str, float]:
+        start, limit = 0, 250
+        with httpx.Client(timeout=10) as client:
+            while True:
+                page = client.get(f"{self.url}/api/v2/messages", params={"start": start, "limit": limit}).json()
+                for item in page.get("items", []):
+                    match = TICKET_RE.search(item["Content"]["Body"])
+                    if match:
+                        self.deliveries.setdefault(match.group(1), _parse_mailhog_time(item["Created"]))
+                start += limit
+                if start >= page.get("total", 0):
+                    break
+        return dict(self.deliveries)
+
+    def close(self):
+        pass
+
+
+async def _drive(client: httpx.AsyncClient, rate: float, duration: float, concurrency: int, run_id: str):
+    """Start rate*duration submissions on schedule.
+
+    Returns ({ticket_id: submit start time}, latencies, error count, elapsed seconds).
+    """
+    total = max(1, int(rate * duration))
+    submitted: dict[str, float] = {}
+    latencies: list[float] = []
+    errors = 0
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        nonlocal errors
+        async with sem:
+            started_wall, started = time.time(), time.perf_counter()
+            try:
+                resp = await client.post("/submit", json={
+                    "email_id": f"bench+{i}@example.com",
+                    "first_name": "Bench",
+                    "last_name": "Mark",
+                    "subject": f"Pipeline benchmark {run_id} #{i}",
+                    "body": f"Submitted by bench/pipeline.py run {run_id}",
+                })
+                ok = resp.status_code == 201
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if ok:
+                submitted[resp.json()["id"]] = started_wall
+            else:
+                errors += 1
+
+    t0 = time.perf_counter()
+    tasks = []
+    for i in range(total):
+        delay = t0 + i / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(i)))
+    await asyncio.gather(*tasks)
+    return submitted, latencies, errors, time.perf_counter() - t0
+
+
+def _summary(samples: list[float]) -> dict | None:
+    if not samples:
+        return None
+    return {
+        "p50": round(_percentile(samples, 50) * 1000, 1),
+        "p95": round(_percentile(samples, 95) * 1000, 1),
+        "p99": round(_percentile(samples, 99) * 1000, 1),
+        "max": round(max(samples) * 1000, 1),
+    }
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+# (path in the result, True if higher is better)
+COMPARED = [
+    (("submit", "achieved_rps"), True),
+    (("submit", "latency_ms", "p95"), False),
+    (("submit", "latency_ms", "p99"), False),
+    (("delivery", "drain_rate_per_s"), True),
+    (("delivery", "end_to_end_ms", "p50"), False),
+    (("delivery", "end_to_end_ms", "p95"), False),
+    (("delivery", "end_to_end_ms", "p99"), False),
+]
+
+
+def compare(result: dict, baseline: dict) -> dict:
+    """Relative change of the key metrics against a baseline run; positive means better."""
+    changes = {}
+    for path, higher_is_better in COMPARED:
+        new, old = result, baseline
+        for key in path:
+            new = (new or {}).get(key)
+            old = (old or {}).get(key)
+        if new is None or not old:
+            continue
+        change = (new - old) / old * 100
+        changes[".".join(path)] = round(change if higher_is_better else -change, 1) or 0.0
+    return changes
+
+
+async def main(args):
+    sink = FakeSMTPSink(args.smtp_host, args.smtp_port).start() if args.sink == "fake" else MailhogSink(args.mailhog_url)
+    run_id = uuid.uuid4().hex[:8]
+    try:
+        async with httpx.AsyncClient(base_url=args.url, timeout=httpx.Timeout(60.0)) as client:
+            submitted, latencies, errors, elapsed = await _drive(client, args.rate, args.duration, args.concurrency, run_id)
+
+        deadline = time.monotonic() + args.drain_timeout
+        delivered: dict[str, float] = {}
+        while time.monotonic() < deadline:
+            delivered = {k: v for k, v in (await asyncio.to_thread(sink.poll)).items() if k in submitted}
+            if len(delivered) == len(submitted):
+                break
+            await asyncio.sleep(args.poll_interval)
+    finally:
+        sink.close()
+
+    end_to_end = [delivered[k] - submitted[k] for k in delivered]
+    window = max(delivered.values()) - min(delivered.values()) if len(delivered) > 1 else 0
+    result = {
+        "benchmark": "pipeline",
+        "run_id": run_id,
+        "git": _git_revision(),
+        "started_at": datetime.now().astimezone().isoformat(timespec="seconds"),
+        "params": {
+            "url": args.url, "sink": args.sink, "rate": args.rate, "duration_s": args.duration,
+            "concurrency": args.concurrency, "drain_timeout_s": args.drain_timeout,
+        },
+        "submit": {
+            "requests": len(latencies),
+            "errors": errors,
+            "achieved_rps": round(len(latencies) / elapsed, 1),
+            "latency_ms": _summary(latencies),
+        },
+        "delivery": {
+            "delivered": len(delivered),
+            "missing": len(submitted) - len(delivered),
+            "drain_rate_per_s": round(len(delivered) / window, 1) if window else None,
+            "end_to_end_ms": _summary(end_to_end),
+        },
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            result["vs_baseline_pct"] = compare(result, json.load(f))
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000", help="producer base URL")
+    parser.add_argument("--rate", type=float, default=20.0, help="submissions per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to keep submitting")
+    parser.add_argument("--concurrency", type=int, default=100, help="max requests in flight")
+    parser.add_argument("--sink", choices=["fake", "mailhog"], default="fake")
+    parser.add_argument("--smtp-host", default="0.0.0.0", help="fake sink bind address")
+    parser.add_argument("--smtp-port", type=int, default=2525, help="fake sink port")
+    parser.add_argument("--mailhog-url", default="http://localhost:8025")
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="seconds to wait for deliveries")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--output", help="also write the JSON result here")
+    parser.add_argument("--baseline", help="previous result file to compare against")
+    asyncio.run(main(parser.parse_args()))
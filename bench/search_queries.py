@@ -0,0 +1,246 @@
+"""Benchmark the complaint listing and search queries with and without their indexes.
+
+Builds a synthetic copy of the emails table with --rows rows in a scratch schema
+(bench_search_<rows>), with the same generated search_vector column, indexes and
+monthly partitions as the real one. Then it runs the queries behind
+GET /complaints and GET /complaints/search, as built by producer/app/search.py,
+in two modes:
+
+  * index  the planner's choice, which uses the (submitted_at, id),
+           (email_id, submitted_at, id) and GIN indexes
+  * scan   index and bitmap scans disabled, i.e. what the queries cost on a
+           table without those indexes: a sequential scan of the whole heap
+
+A deep OFFSET page and an ILIKE substring search are included as the usual
+alternatives to keyset paging and full-text search. 2% of the rows carry a 1.3 KB
+legacy inline attachment (BYTEA) to make the heap as wide as the real one.
+
+Reports per query the rows it matches before LIMIT and, per mode, the median
+and p95 milliseconds over --repeat runs (after one warm-up run) and the plan's
+scan nodes; per table size, load and index build times and relation sizes. Schemas are kept for later runs; --rebuild recreates
+them and --drop removes them afterwards.
+
+Example:
+    DATABASE_URL=postgresql://... python bench/search_queries.py --rows 1000000 10000000 \\
+        --output results/search-$(git rev-parse --short HEAD).json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, func, or_, select, text
+from sqlalchemy.schema import CreateTable
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "producer"))
+from app.models import EmailRecord  # noqa: E402
+from app.partitions import add_months, create_partition  # noqa: E402
+from app.search import Cursor, page_query, search_query  # noqa: E402
+
+from pipeline import _git_revision  # noqa: E402
+from submit_load import _percentile  # noqa: E402
+
+WORDS = (
+    "account billing charged twice refund payment card declined invoice subscription cancel renewal "
+    "order delivery late missing damaged package tracking courier address return exchange warranty "
+    "login password reset locked email verification code app crash error slow outage website portal "
+    "support agent call waiting hold rude response ticket escalate manager complaint service quality "
+    "product broken defective replacement repair technician appointment schedule delay update firmware "
+    "network signal coverage internet speed router modem installation fee overcharge discount promo "
+    "loyalty points balance statement transfer bank fraud unauthorized transaction dispute chargeback "
+    "contract terms privacy data deleted profile settings notification spam unsubscribe language "
+    "mobile tablet laptop printer battery screen keyboard charger cable adapter software license"
+).split()
+
+COLUMNS = (
+    EmailRecord.id, EmailRecord.email_id, EmailRecord.first_name, EmailRecord.last_name, EmailRecord.subject,
+    EmailRecord.body, EmailRecord.attachment_name, EmailRecord.attachment_ref, EmailRecord.attachment_size,
+    EmailRecord.submitted_at,
+)
+
+# Row g is submitted g steps after the start, filling one monthly partition after another
+_START, _STEP = datetime(2024, 1, 1, tzinfo=timezone.utc), timedelta(seconds=3)
+FIRST_MONTH = _START.date()
+
+# Word n of the vocabulary, skewed towards the start like natural language
+_WORD = "(:words)[1 + floor(power(random(), 2) * :nwords)::int]"
+
+_LOAD = text(f"""
+INSERT INTO emails (id, email_id, first_name, last_name, subject, body, attachment_name, attachment_data, submitted_at)
+SELECT
+    gen_random_uuid(),
+    'user' || (g % :addresses) || '@example.com',
+    'Bench', 'User',
+    initcap(array_to_string(ARRAY(SELECT {_WORD} FROM generate_series(1, 3 + g % 3)), ' ')),
+    array_to_string(ARRAY(SELECT {_WORD} FROM generate_series(1, 25 + g % 20)), ' ') || ' ref' || (g % 20011),
+    CASE WHEN g % 50 = 0 THEN 'scan.pdf' END,
+    CASE WHEN g % 50 = 0 THEN convert_to(repeat(md5(g::text), 40), 'UTF8') END,
+    :start_at + g * :step
+FROM generate_series(:start, :stop) AS g
+""")
+
+
+def _load(conn, rows: int, chunk: int = 500_000) -> dict:
+    timings = {}
+    # Without its indexes, which are built after the load below
+    conn.execute(CreateTable(EmailRecord.__table__))
+    conn.execute(text("CREATE TABLE emails_default PARTITION OF emails DEFAULT"))
+    month, last = FIRST_MONTH, (_START + rows * _STEP).date()
+    while month <= last:
+        create_partition(conn, month)
+        month = add_months(month, 1)
+    started = time.perf_counter()
+    for start in range(1, rows + 1, chunk):
+        stop = min(rows, start + chunk - 1)
+        conn.execute(_LOAD, {"words": WORDS, "nwords": len(WORDS), "addresses": max(1, rows // 5),
+                             "start": start, "stop": stop, "start_at": _START, "step": _STEP})
+        conn.commit()
+        print(f"  loaded {stop:,}/{rows:,} rows", file=sys.stderr)
+    timings["load_s"] = round(time.perf_counter() - started, 1)
+    for index in EmailRecord.__table__.indexes:
+        started = time.perf_counter()
+        index.create(conn)
+        conn.commit()
+        timings[f"build_{index.name}_s"] = round(time.perf_counter() - started, 1)
+    with conn.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as vacuum:
+        vacuum.execute(text("VACUUM ANALYZE emails"))
+    return timings
+
+
+def _sizes(conn) -> dict:
+    names = ["emails"] + [index.name for index in EmailRecord.__table__.indexes]
+    return {
+        name: conn.execute(text(
+            "SELECT pg_size_pretty(sum(pg_total_relation_size(relid))) FROM pg_partition_tree(to_regclass(:n))"
+        ), {"n": name}).scalar()
+        for name in names
+    }
+
+
+def _queries(conn, rows: int, depth: int) -> dict:
+    # A cursor as a client would hold it after paging `depth` rows deep
+    at = conn.execute(
+        select(EmailRecord.submitted_at, EmailRecord.id)
+        .order_by(EmailRecord.submitted_at.desc(), EmailRecord.id.desc()).offset(depth).limit(1)
+    ).one()
+    newest_first = (EmailRecord.submitted_at.desc(), EmailRecord.id.desc())
+    return {
+        "recent_first_page": page_query(COLUMNS, 50),
+        "recent_keyset_deep": page_query(COLUMNS, 50, after=Cursor(at.submitted_at, at.id)),
+        "recent_offset_deep": select(*COLUMNS).order_by(*newest_first).offset(depth).limit(51),
+        "by_email": page_query(COLUMNS, 50, email_id=f"user{rows // 10}@example.com"),
+        "search_rare_term": search_query(COLUMNS, "ref4242", 50),
+        "search_common_word": search_query(COLUMNS, "refund", 50),
+        "search_uncommon_word": search_query(COLUMNS, "firmware", 50),
+        "search_phrase": search_query(COLUMNS, '"payment declined"', 50),
+        "search_common_word_rank_all": search_query(COLUMNS, "refund", 50, window=0),
+        "ilike_rare_term": select(*COLUMNS).where(or_(EmailRecord.subject.ilike("%ref4242%"),
+                                                      EmailRecord.body.ilike("%ref4242%")))
+                                           .order_by(*newest_first).limit(51),
+    }
+
+
+def _scan_nodes(plan: dict) -> list[str]:
+    nodes = []
+    if "Scan" in plan["Node Type"]:
+        nodes.append(plan["Node Type"] + (f" ({plan['Index Name']})" if "Index Name" in plan else ""))
+    for child in plan.get("Plans", []):
+        nodes += _scan_nodes(child)
+    return nodes
+
+
+def _measure(conn, stmt, scan: bool, repeat: int) -> dict:
+    compiled = stmt.compile(conn)
+    samples = []
+    with conn.begin():
+        if scan:
+            for setting in ("enable_indexscan", "enable_bitmapscan", "enable_indexonlyscan"):
+                conn.execute(text(f"SET LOCAL {setting} = off"))
+        plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()[0]["Plan"]
+        for i in range(repeat + 1):
+            started = time.perf_counter()
+            conn.execute(stmt).all()
+            if i:   # the first run warms the cache
+                samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "median_ms": round(statistics.median(samples), 2),
+        "p95_ms": round(_percentile(samples, 95), 2),
+        "plan": sorted(set(_scan_nodes(plan))),
+    }
+
+
+def run_size(database_url: str, rows: int, args) -> dict:
+    schema = f"bench_search_{rows}"
+    admin = create_engine(database_url)
+    with admin.begin() as conn:
+        if args.rebuild:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        fresh = conn.execute(text("SELECT to_regnamespace(:s) IS NULL"), {"s": schema}).scalar()
+        conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {schema}"))
+    engine = create_engine(database_url, connect_args={"options": f"-csearch_path={schema}"})
+    result = {"rows": rows}
+    try:
+        with engine.connect() as conn:
+            if fresh:
+                print(f"Building {schema}...", file=sys.stderr)
+                result["build"] = _load(conn, rows)
+                conn.commit()
+            result["sizes"] = _sizes(conn)
+            conn.commit()
+            queries = _queries(conn, rows, min(args.depth, rows - 100))
+            conn.commit()
+            result["queries"] = {}
+            for name, stmt in queries.items():
+                if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                    continue
+                print(f"  {name}", file=sys.stderr)
+                index = _measure(conn, stmt, scan=False, repeat=args.repeat)
+                scan = _measure(conn, stmt, scan=True, repeat=max(1, min(args.repeat, args.scan_repeat)))
+                matches = conn.execute(
+                    select(func.count()).select_from(stmt.limit(None).offset(None).order_by(None).subquery())
+                ).scalar()
+                conn.commit()
+                result["queries"][name] = {
+                    "matching_rows": matches, "index": index, "scan": scan,
+                    "index_speedup_x": round(scan["median_ms"] / max(index["median_ms"], 0.01), 1),
+                }
+    finally:
+        engine.dispose()
+        if args.drop:
+            with admin.begin() as conn:
+                conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        admin.dispose()
+    return result
+
+
+def main(args):
+    database_url = os.environ["DATABASE_URL"]
+    sizes = [run_size(database_url, rows, args) for rows in args.rows]
+    result = {
+        "benchmark": "search_queries",
+        "git": _git_revision(),
+        "started_at": datetime.now().astimezone().isoformat(timespec="seconds"),
+        "params": {"repeat": args.repeat, "scan_repeat": args.scan_repeat, "depth": args.depth},
+        "sizes": sizes,
+    }
+    text_out = json.dumps(result, indent=2)
+    print(text_out)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text_out + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per query with indexes")
+    parser.add_argument("--scan-repeat", type=int, default=3, help="timed runs per query without indexes")
+    parser.add_argument("--depth", type=int, default=100_000, help="rows skipped by the deep-page queries")
+    parser.add_argument("--only", nargs="+", metavar="PREFIX", help="run only the queries with these name prefixes")
+    parser.add_argument("--rebuild", action="store_true", help="recreate the scratch schemas")
+    parser.add_argument("--drop", action="store_true", help="drop the scratch schemas afterwards")
+    parser.add_argument("--output", help="also write the JSON result here")
+    main(parser.parse_args())
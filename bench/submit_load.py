@@ -0,0 +1,205 @@
+"""Concurrent load benchmark for the producer's POST /submit.
+
+Fires N requests with C in flight and reports requests/second and latency
+percentiles. With --batch-size > 1 each request posts that many complaints to
+/submit/batch, and complaints/second is reported alongside.
+
+Two targets are supported:
+
+  * --url http://localhost:8000   a running producer (docker compose stack)
+  * --inprocess                   the app served in-process over ASGI, with the
+                                  Kafka producer replaced by a simulated broker
+                                  that acknowledges after --broker-delay-ms.
+                                  Needs DATABASE_URL pointing at Postgres.
+
+With --retries R every /submit is sent R more times with the same
+Idempotency-Key, as a client retrying after a timeout would; the retries
+count as requests, and the replies the producer replayed instead of storing
+are reported as "replayed".
+
+Requests refused by admission control (429/503 with Retry-After) are counted
+as "shed" rather than errors, and latency percentiles are also given for the
+accepted requests alone. In-process, the per-client and per-address rate limits
+are off unless set in the environment, since every request comes from one
+client and one address; --db-delay-ms makes each save that much slower, like
+a struggling Postgres, to see the in-flight limit shed load.
+
+The in-process mode isolates event-loop blocking: with a slow broker a
+blocking submit serialises every request behind the slowest acknowledgement,
+while a non-blocking one overlaps them. The app lifespan is not run, so the
+outbox relay stays idle and only the request path is measured.
+
+Example:
+    cd producer && DATABASE_URL=... python ../bench/submit_load.py --inprocess \\
+        --requests 200 --concurrency 50 --broker-delay-ms 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+import httpx
+
+PAYLOAD = {
+    "email_id": "bench@example.com",
+    "first_name": "Bench",
+    "last_name": "Mark",
+    "subject": "Load test",
+    "body": "Submitted by bench/submit_load.py",
+}
+
+
+class _SimulatedBroker:
+    """Stands in for KafkaProducer: every send() is acknowledged after a fixed delay."""
+
+    def __init__(self, delay_s: float):
+        self.delay_s = delay_s
+
+    def send(self, topic, value=None, **kwargs):
+        from kafka.future import Future
+
+        fut = Future()
+        done = threading.Event()
+        fut.add_both(lambda _: done.set())
+
+        def get(timeout=None):
+            done.wait(timeout)
+            if fut.exception:
+                raise fut.exception
+            return fut.value
+
+        fut.get = get
+        timer = threading.Timer(self.delay_s, fut.success, args=(None,))
+        timer.daemon = True
+        timer.start()
+        return fut
+
+    def flush(self, timeout=None):
+        pass
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+async def _run(client: httpx.AsyncClient, total: int, concurrency: int, batch_size: int = 1, retries: int = 0):
+    latencies, accepted = [], []
+    errors = replayed = shed = 0
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(headers=None):
+        nonlocal errors, replayed, shed
+        async with sem:
+            start = time.perf_counter()
+            try:
+                if batch_size > 1:
+                    resp = await client.post("/submit/batch", json=[PAYLOAD] * batch_size)
+                else:
+                    resp = await client.post("/submit", json=PAYLOAD, headers=headers)
+                ok = resp.status_code == 201
+                replayed += "idempotent-replayed" in resp.headers
+                if resp.status_code in (429, 503) and "retry-after" in resp.headers:
+                    shed += 1
+                    ok = None
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if ok:
+                accepted.append(latencies[-1])
+            elif ok is False:
+                errors += 1
+
+    async def with_retries():
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        for _ in range(retries + 1):
+            await one(headers)
+
+    started = time.perf_counter()
+    if retries:
+        await asyncio.gather(*(with_retries() for _ in range(total // (retries + 1))))
+    else:
+        await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    return latencies, accepted, errors, replayed, shed, elapsed
+
+
+def _client(args) -> httpx.AsyncClient:
+    timeout = httpx.Timeout(60.0)
+    if not args.inprocess:
+        return httpx.AsyncClient(base_url=args.url, timeout=timeout)
+
+    sys.path.insert(0, os.getcwd())
+    os.environ.setdefault("SUBMIT_RATE_PER_CLIENT", "0")
+    os.environ.setdefault("SUBMIT_RATE_PER_EMAIL", "0")
+    from app import kafka_producer, main
+    from app.main import app
+
+    if args.db_delay_ms:
+        save_records = main._save_records
+
+        def slow_save(*save_args):
+            time.sleep(args.db_delay_ms / 1000)
+            save_records(*save_args)
+
+        main._save_records = slow_save
+
+    broker = _SimulatedBroker(args.broker_delay_ms / 1000)
+    kafka_producer._get_producer = lambda: broker
+    logging_level = os.getenv("BENCH_LOG_LEVEL", "WARNING")
+    import logging
+    logging.getLogger().setLevel(logging_level)
+    logging.getLogger("producer").setLevel(logging_level)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=timeout)
+
+
+async def main(args):
+    async with _client(args) as client:
+        latencies, accepted, errors, replayed, shed, elapsed = await _run(
+            client, args.requests, args.concurrency, args.batch_size, args.retries
+        )
+    result = {
+        "target": "inprocess" if args.inprocess else args.url,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "batch_size": args.batch_size,
+        "broker_delay_ms": args.broker_delay_ms if args.inprocess else None,
+        "db_delay_ms": args.db_delay_ms if args.inprocess else None,
+        "retries": args.retries,
+        "errors": errors,
+        "replayed": replayed,
+        "shed": shed,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+        "complaints_per_s": round((len(accepted) - replayed) * args.batch_size / elapsed, 1),
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 50) * 1000, 1),
+            "p95": round(_percentile(latencies, 95) * 1000, 1),
+            "p99": round(_percentile(latencies, 99) * 1000, 1),
+            "mean": round(statistics.fmean(latencies) * 1000, 1),
+        },
+        "accepted_latency_ms": {
+            "p50": round(_percentile(accepted, 50) * 1000, 1),
+            "p99": round(_percentile(accepted, 99) * 1000, 1),
+        } if accepted else None,
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--inprocess", action="store_true")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--broker-delay-ms", type=float, default=50.0)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--db-delay-ms", type=float, default=0.0, help="in-process: extra time spent in each save")
+    parser.add_argument("--retries", type=int, default=0, help="resend each /submit this often with its Idempotency-Key")
+    asyncio.run(main(parser.parse_args()))
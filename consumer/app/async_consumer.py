@@ -0,0 +1,361 @@
+"""asyncio consumer engine, selected with CONSUMER_MODE=async.
+
+The threaded engine in app.main hands each record to a worker thread that blocks
+in smtplib, so sends in flight are capped by CONSUMER_WORKERS. Here records are
+fetched with aiokafka and sent with aiosmtplib on the FastAPI event loop, with
+up to CONSUMER_ASYNC_CONCURRENCY sends in flight on a single thread.
+
+Delivery semantics are the threaded engine's: offsets are only committed past
+finished messages (app.worker_pool.OffsetTracker), failures go to the retry
+topics, a partition whose failure could not be routed (or that was throttled) is
+rewound and paused, and revoked partitions are drained and committed before they
+move on. The blocking pieces shared with the threaded engine (dedup lookups and
+retry routing) run in the default thread pool.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+
+from aiokafka import AIOKafkaConsumer
+from aiokafka.abc import ConsumerRebalanceListener
+
+from app import metrics
+from app.backoff import Backoff
+from app.async_email_sender import send_email_async
+from app.commit_manager import CONSUMER_COMMIT_EVERY, CONSUMER_COMMIT_INTERVAL_MS, CommitStats, commit_stats
+from app.liveness import liveness_stats
+from app.main import (
+    CONSUMER_MAX_POLL_RECORDS,
+    CONSUMER_METRICS_INTERVAL_MS,
+    CONSUMER_RETRY_BACKOFF_MS,
+    complaint_email_args,
+    consumer_config,
+    get_dedup_store,
+    get_retry_router,
+    hold_until_due,
+    hold_while_throttled,
+    observe_end_to_end_lag,
+    resume_due,
+    route_failure,
+    set_consumer_running,
+)
+from app.rate_limiter import SMTPThrottled, smtp_limiter
+from app.rebalance import CONSUMER_REVOKE_DRAIN_MS, RebalanceStats, rebalance_stats
+from app.serialization import decode
+from app.worker_pool import OffsetTracker
+
+logger = logging.getLogger(__name__)
+
+# Sends in flight across all partitions, and per partition
+CONSUMER_ASYNC_CONCURRENCY = int(os.getenv("CONSUMER_ASYNC_CONCURRENCY", "200"))
+CONSUMER_ASYNC_MAX_IN_FLIGHT = int(os.getenv("CONSUMER_ASYNC_MAX_IN_FLIGHT", "100"))
+
+
+async def send_complaint(payload: dict) -> None:
+    await send_email_async(**complaint_email_args(payload))
+    observe_end_to_end_lag(payload)
+
+
+async def handle_record(record, send=send_complaint) -> None:
+    """handle_message() for coroutines: decode, skip duplicates, send, route failures"""
+    if record.value is None:
+        logger.warning("Received message with null value, skipping...")
+        metrics.MESSAGES.labels(result="skipped").inc()
+        return
+    try:
+        payload = decode(record)
+    except Exception as e:
+        logger.error(f"Cannot decode message at offset {record.offset}, partition {record.partition}: {e}")
+        await asyncio.to_thread(route_failure, record, e, True)
+        return
+    record_id = str(payload["id"]) if isinstance(payload, dict) and payload.get("id") else None
+    store = get_dedup_store() if record_id else None
+    if store is not None and not await asyncio.to_thread(store.begin, record_id):
+        logger.info(f"Skipping complaint {record_id}: already sent")
+        metrics.MESSAGES.labels(result="duplicate").inc()
+        return
+    sent = False
+    try:
+        await send(payload)
+        sent = True
+    except SMTPThrottled:
+        metrics.MESSAGES.labels(result="throttled").inc()
+        raise
+    except Exception as e:
+        await asyncio.to_thread(route_failure, record, e)
+        return
+    finally:
+        if store is not None:
+            await asyncio.to_thread(store.finish, record_id, sent)
+    metrics.MESSAGES.labels(result="processed").inc()
+
+
+class AsyncConsumerEngine:
+    """Poll loop, per-partition offset tracking and batched commits for one AIOKafkaConsumer"""
+
+    def __init__(
+        self,
+        handler=handle_record,
+        concurrency: int = CONSUMER_ASYNC_CONCURRENCY,
+        max_in_flight: int = CONSUMER_ASYNC_MAX_IN_FLIGHT,
+        commit_every: int = CONSUMER_COMMIT_EVERY,
+        commit_interval_ms: int = CONSUMER_COMMIT_INTERVAL_MS,
+        stats: CommitStats = commit_stats,
+    ):
+        self._handler = handler
+        self.concurrency = concurrency
+        self.max_in_flight = max_in_flight
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval_ms / 1000
+        self._stats = stats
+        self.consumer = None
+        self.paused: dict = {}
+        self._trackers: dict = {}
+        self._tasks: dict = {}       # TopicPartition -> set of running tasks
+        self._started: dict = {}     # (TopicPartition, offset) -> monotonic start
+        self._committed: dict = {}
+        self._last_commit = time.monotonic()
+        self._slot_freed = asyncio.Event()
+        self.last_completed_at = None
+
+    def in_flight(self, partitions=None) -> int:
+        return sum(1 for tp, _ in self._started if partitions is None or tp in partitions)
+
+    def oldest_in_flight_seconds(self) -> float:
+        return time.monotonic() - min(self._started.values()) if self._started else 0.0
+
+    async def submit(self, tp, record, stop: threading.Event | None = None) -> bool:
+        """Start handling a record. Returns False if stop was set while waiting for a slot."""
+        tracker = self._trackers.setdefault(tp, OffsetTracker())
+        while tracker.in_flight >= self.max_in_flight or len(self._started) >= self.concurrency:
+            if stop is not None and stop.is_set():
+                return False
+            self._slot_freed.clear()
+            try:
+                await asyncio.wait_for(self._slot_freed.wait(), timeout=0.5)
+            except asyncio.TimeoutError:
+                pass
+        tracker.add(record.offset)
+        self._started[(tp, record.offset)] = time.monotonic()
+        task = asyncio.create_task(self._run(tp, tracker, record))
+        tasks = self._tasks.setdefault(tp, set())
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return True
+
+    async def _run(self, tp, tracker: OffsetTracker, record) -> None:
+        ok = False
+        try:
+            await self._handler(record)
+            ok = True
+        except Exception as e:
+            logger.error(f"Error processing message at {tp.topic}[{tp.partition}]@{record.offset}: {e}")
+        finally:
+            self._started.pop((tp, record.offset), None)
+            self.last_completed_at = time.time()
+            # Ignore results for a partition that was forgotten (rewound or revoked) meanwhile
+            if self._trackers.get(tp) is tracker:
+                if ok:
+                    tracker.complete(record.offset)
+                else:
+                    tracker.fail(record.offset)
+            self._slot_freed.set()
+
+    async def drain(self, timeout: float | None = None, partitions=None) -> bool:
+        """Wait for running sends (on the given partitions, or on any). Returns False on timeout."""
+        tasks = set().union(*(
+            tasks for tp, tasks in self._tasks.items() if partitions is None or tp in partitions
+        ))
+        if not tasks:
+            return True
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        return not pending
+
+    def forget(self, partitions) -> None:
+        for tp in partitions:
+            self._trackers.pop(tp, None)
+            self._committed.pop(tp, None)
+
+    async def commit(self, force: bool = False) -> bool:
+        """Commit positions that moved, once enough messages finished or the interval elapsed (or now with force)"""
+        offsets, messages = {}, 0
+        for tp, tracker in self._trackers.items():
+            previous = self._committed.get(tp)
+            if tracker.position is not None and (previous is None or tracker.position > previous):
+                offsets[tp] = tracker.position
+                messages += tracker.position - previous if previous is not None else 1
+        if not offsets:
+            return False
+        if not force and messages < self.commit_every and time.monotonic() - self._last_commit < self.commit_interval:
+            return False
+        started = time.perf_counter()
+        try:
+            await self.consumer.commit(offsets)
+        except Exception:
+            self._stats.record_failure()
+            raise
+        latency = time.perf_counter() - started
+        self._stats.record(latency, messages)
+        metrics.COMMIT_SECONDS.observe(latency)
+        self._committed.update(offsets)
+        self._last_commit = time.monotonic()
+        return True
+
+    async def rewind_failed(self) -> None:
+        """Seek partitions with a failed message back to it and pause them for a backoff (as app.main.rewind_failed)"""
+        failed = {tp: t.first_failed for tp, t in self._trackers.items() if t.first_failed is not None}
+        if not failed:
+            return
+        await self.drain(timeout=30, partitions=failed)
+        await self.commit(force=True)
+        backoff = max(CONSUMER_RETRY_BACKOFF_MS / 1000, smtp_limiter.blocked_for())
+        resume_at = time.monotonic() + backoff
+        for tp, offset in failed.items():
+            logger.warning(f"Message {tp.topic}[{tp.partition}]@{offset} failed; retrying in {backoff * 1000:.0f} ms")
+            self.consumer.seek(tp, offset)
+            self.consumer.pause(tp)
+            self.paused[tp] = resume_at
+        self.forget(failed)
+
+    async def partition_offsets(self) -> dict:
+        """{TopicPartition: (committed, log_end)}, as app.liveness.partition_offsets"""
+        assigned = self.consumer.assignment()
+        log_end = {tp: self.consumer.highwater(tp) for tp in assigned}
+        missing = [tp for tp, end in log_end.items() if end is None]
+        if missing:
+            log_end.update(await self.consumer.end_offsets(missing))
+        offsets = {}
+        for tp in assigned:
+            committed = self._committed.get(tp)
+            if committed is None:
+                committed = await self.consumer.committed(tp)
+            if committed is None:
+                committed = await self.consumer.position(tp)
+            offsets[tp] = (committed, log_end[tp])
+        return offsets
+
+    async def update_gauges(self) -> None:
+        in_flight = self.in_flight()
+        metrics.IN_FLIGHT.set(in_flight)
+        metrics.PAUSED_PARTITIONS.set(len(self.paused))
+        smtp_limiter.publish_metrics()
+        try:
+            offsets = await self.partition_offsets()
+        except Exception as e:
+            logger.debug(f"Could not compute partition lag: {e}")
+            offsets = liveness_stats.partitions
+        liveness_stats.record_progress(
+            offsets, in_flight, self.oldest_in_flight_seconds(), self.last_completed_at, held=self.paused.keys()
+        )
+
+    async def run(self, stop: threading.Event) -> None:
+        """Consume until stop is set, then let running sends finish and commit"""
+        gauges_at = 0.0
+        liveness_stats.start()
+        while not stop.is_set():
+            batches = await self.consumer.getmany(timeout_ms=1000, max_records=CONSUMER_MAX_POLL_RECORDS)
+            liveness_stats.record_poll()
+            for tp, records in batches.items():
+                for record in records:
+                    if (tp in self.paused or hold_until_due(self.consumer, tp, record, self.paused)
+                            or hold_while_throttled(self.consumer, tp, record, self.paused)):
+                        break
+                    if not await self.submit(tp, record, stop=stop):
+                        break
+            await self.rewind_failed()
+            resume_due(self.consumer, self.paused)
+            await self.commit()
+            if time.monotonic() - gauges_at >= CONSUMER_METRICS_INTERVAL_MS / 1000:
+                await self.update_gauges()
+                gauges_at = time.monotonic()
+
+        if not await self.drain(timeout=10):
+            logger.warning("Timed out waiting for in-flight messages; they will be redelivered")
+        await self.commit(force=True)
+
+
+class AsyncRebalanceListener(ConsumerRebalanceListener):
+    """app.rebalance.RebalanceListener for the asyncio engine"""
+
+    def __init__(self, engine: AsyncConsumerEngine, drain_timeout_ms: int = CONSUMER_REVOKE_DRAIN_MS,
+                 stats: RebalanceStats = rebalance_stats):
+        self._engine = engine
+        self.drain_timeout = drain_timeout_ms / 1000
+        self._stats = stats
+
+    async def on_partitions_revoked(self, revoked):
+        revoked = set(revoked)
+        if not revoked:
+            return
+        abandoned = 0
+        if not await self._engine.drain(timeout=self.drain_timeout, partitions=revoked):
+            abandoned = self._engine.in_flight(revoked)
+            logger.warning(f"Revoke drain timed out; in-flight messages on {len(revoked)} partition(s) will be redelivered")
+        if self._engine.consumer is not None:
+            try:
+                await self._engine.commit(force=True)
+            except Exception as e:
+                logger.warning(f"Commit on revoke failed: {e}")
+        self._engine.forget(revoked)
+        for tp in revoked:
+            self._engine.paused.pop(tp, None)
+        self._stats.record_revoked(revoked, abandoned)
+        metrics.REBALANCES.labels(event="revoked").inc()
+        logger.info(f"Partitions revoked: {sorted(revoked)}")
+
+    async def on_partitions_assigned(self, assigned):
+        self._stats.record_assigned(assigned)
+        metrics.ASSIGNED_PARTITIONS.set(len(assigned))
+        metrics.REBALANCES.labels(event="assigned").inc()
+        logger.info(f"Partitions assigned: {sorted(assigned)}")
+
+
+async def run_async_consumer(broker: str, topic: str, group_id: str, stop: threading.Event) -> None:
+    """Reconnecting consumer loop, run as a task from the FastAPI lifespan"""
+    # Both connect on first use (the retry producer, the dedup table); do that off the event loop
+    router = await asyncio.to_thread(get_retry_router)
+    await asyncio.to_thread(get_dedup_store)
+    topics = [topic] + (router.topics if router else [])
+    backoff = Backoff()
+    while not stop.is_set():
+        consumer = None
+        try:
+            engine = AsyncConsumerEngine()
+            consumer = AIOKafkaConsumer(**consumer_config(broker, group_id))
+            consumer.subscribe(topics=topics, listener=AsyncRebalanceListener(engine))
+            rebalance_stats.record_joining()
+            await consumer.start()
+            engine.consumer = consumer
+            logger.info(f"Async consumer started, up to {engine.concurrency} sends in flight")
+            set_consumer_running(True)
+            backoff.reset()
+            await engine.run(stop)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Async consumer error: {e}")
+        finally:
+            set_consumer_running(False)
+            liveness_stats.reset()
+            rebalance_stats.record_left()
+            if consumer is not None:
+                try:
+                    await consumer.stop()
+                except Exception as e:
+                    logger.warning(f"Error closing consumer: {e}")
+        if not stop.is_set():
+            delay = backoff.next()
+            metrics.CONSUMER_RECONNECTS.inc()
+            logger.info(f"Waiting {delay:.2f} seconds before reconnecting...")
+            await asyncio.to_thread(stop.wait, delay)
+
+
+def start_async_consumer(stop: threading.Event) -> asyncio.Task:
+    """Start the consumer as a task on the running event loop"""
+    broker = os.getenv("KAFKA_BROKER", "kafka:9092")
+    topic = os.getenv("KAFKA_TOPIC", "complaints.v1")
+    group = os.getenv("KAFKA_GROUP", "emailer-group")
+    logger.info(f"Starting async Kafka consumer: broker={broker}, topic={topic}, group={group}")
+    return asyncio.create_task(run_async_consumer(broker, topic, group, stop), name="KafkaConsumer")
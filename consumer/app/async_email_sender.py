@@ -0,0 +1,195 @@
+"""send_email() for the asyncio consumer engine (CONSUMER_MODE=async), over aiosmtplib.
+
+Messages are rendered and serialized exactly as in app.email_sender; only the
+transport differs. Each connection carries one transaction at a time, so the
+pool size is the number of sends that can be in flight at once.
+"""
+import os
+import time
+import asyncio
+import logging
+
+import aiosmtplib
+
+from app import metrics
+from app.email_sender import (
+    FROM_ADDR,
+    SMTP_HOST,
+    SMTP_IDLE_TIMEOUT,
+    SMTP_KEEPALIVE_AFTER,
+    SMTP_MAX_MESSAGES_PER_CONNECTION,
+    SMTP_PASSWORD,
+    SMTP_PORT,
+    SMTP_STARTTLS,
+    SMTP_TIMEOUT,
+    SMTP_USERNAME,
+    compose_email,
+)
+from app.rate_limiter import AdaptiveRateLimiter, SMTPThrottled, smtp_limiter, throttle_code
+
+logger = logging.getLogger(__name__)
+
+# Open SMTP connections; lower it for providers that cap concurrent connections
+SMTP_ASYNC_POOL_SIZE = int(os.getenv("SMTP_ASYNC_POOL_SIZE", "100"))
+
+
+async def _open_connection() -> aiosmtplib.SMTP:
+    """Connect, upgrade to TLS and authenticate according to the SMTP_* settings."""
+    smtp = aiosmtplib.SMTP(hostname=SMTP_HOST, port=SMTP_PORT, timeout=SMTP_TIMEOUT, start_tls=False)
+    await smtp.connect()
+    try:
+        if SMTP_STARTTLS:
+            try:
+                await smtp.starttls()
+            except aiosmtplib.SMTPException as e:
+                logger.warning(f"STARTTLS failed: {e}")
+        if SMTP_USERNAME and SMTP_PASSWORD:
+            await smtp.login(SMTP_USERNAME, SMTP_PASSWORD)
+    except Exception:
+        smtp.close()
+        raise
+    return smtp
+
+
+class _PooledConnection:
+    def __init__(self, smtp: aiosmtplib.SMTP):
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
+class AsyncSMTPPool:
+    """SMTPConnectionPool for coroutines: same reuse, keepalive and rate-limit rules.
+
+    Only used from the event loop, so the idle list needs no lock.
+    """
+
+    def __init__(
+        self,
+        factory=_open_connection,
+        size: int = SMTP_ASYNC_POOL_SIZE,
+        max_messages: int = SMTP_MAX_MESSAGES_PER_CONNECTION,
+        idle_timeout: float = SMTP_IDLE_TIMEOUT,
+        keepalive_after: float = SMTP_KEEPALIVE_AFTER,
+        limiter: AdaptiveRateLimiter | None = None,
+    ):
+        self._factory = factory
+        self._limiter = limiter
+        self.size = size
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+        self.keepalive_after = keepalive_after
+        self._slots = asyncio.Semaphore(size)
+        self._idle: list[_PooledConnection] = []
+        self.opened = 0
+
+    async def _connect(self) -> _PooledConnection:
+        conn = _PooledConnection(await self._factory())
+        self.opened += 1
+        return conn
+
+    @staticmethod
+    async def _close(conn: _PooledConnection) -> None:
+        try:
+            await conn.smtp.quit()
+        except Exception:
+            conn.smtp.close()
+
+    async def _is_alive(self, conn: _PooledConnection) -> bool:
+        try:
+            return (await conn.smtp.noop()).code == 250
+        except Exception:
+            return False
+
+    async def _acquire(self) -> _PooledConnection:
+        await self._slots.acquire()
+        try:
+            while self._idle:
+                conn = self._idle.pop()
+                idle_for = time.monotonic() - conn.last_used
+                if idle_for > self.idle_timeout or (idle_for > self.keepalive_after and not await self._is_alive(conn)):
+                    await self._close(conn)
+                    continue
+                return conn
+            return await self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def _release(self, conn: _PooledConnection, reusable: bool) -> None:
+        try:
+            if reusable and conn.sent < self.max_messages:
+                conn.last_used = time.monotonic()
+                self._idle.append(conn)
+            else:
+                await self._close(conn)
+        finally:
+            self._slots.release()
+
+    async def sendmail(self, from_addr: str, to_addr: str, data: bytes) -> None:
+        """Send a serialized message over a pooled connection, reconnecting once if the server had dropped it."""
+        if self._limiter is not None and not await self._limiter.acquire_async():
+            metrics.SMTP_THROTTLED.labels(code="timeout").inc()
+            raise SMTPThrottled("No SMTP send slot within the rate limiter's wait limit")
+        started = time.perf_counter()
+        conn = await self._acquire()
+        try:
+            try:
+                await conn.smtp.sendmail(from_addr, [to_addr], data)
+            except aiosmtplib.SMTPServerDisconnected as e:
+                logger.warning(f"SMTP connection dropped ({e}); reconnecting")
+                metrics.SMTP_RECONNECTS.inc()
+                conn.smtp.close()
+                conn = await self._connect()
+                await conn.smtp.sendmail(from_addr, [to_addr], data)
+        except Exception as e:
+            # Don't reuse a connection in an unknown state
+            await self._release(conn, reusable=False)
+            code = throttle_code(e) if self._limiter is not None else None
+            if code is not None:
+                self._limiter.record_throttle(code)
+                raise SMTPThrottled(f"SMTP server throttled the send: {e}", code) from e
+            metrics.SMTP_FAILURES.inc()
+            raise
+        if self._limiter is not None:
+            self._limiter.record_success()
+        metrics.SMTP_SEND_SECONDS.observe(time.perf_counter() - started)
+        conn.sent += 1
+        await self._release(conn, reusable=True)
+
+    async def close(self) -> None:
+        """Close all idle connections; connections in use are closed when released."""
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await self._close(conn)
+
+    def stats(self) -> dict:
+        return {"size": self.size, "idle": len(self._idle), "opened": self.opened}
+
+
+_pool = AsyncSMTPPool(limiter=smtp_limiter)
+
+
+async def close_pool() -> None:
+    """Close pooled SMTP connections (called on shutdown)."""
+    await _pool.close()
+
+
+async def send_email_async(to_addr: str, *args, attachment_path: str | None = None, pool: AsyncSMTPPool | None = None,
+                           **kwargs) -> None:
+    """send_email() on the event loop; takes the same arguments.
+
+    Blob attachments are read in a worker thread, and held in memory for the
+    send, since aiosmtplib takes the message as a whole.
+    """
+    subject, chunks = compose_email(to_addr, *args, attachment_path=attachment_path, **kwargs)
+    if attachment_path:
+        data = await asyncio.to_thread(lambda: b"".join(chunks()))
+    else:
+        data = b"".join(chunks())
+    try:
+        await (pool or _pool).sendmail(FROM_ADDR, to_addr, data)
+        logger.info(f"Sent email to {to_addr} with subject '{subject}'")
+    except Exception:
+        logger.exception(f"Failed to send email to {to_addr}")
+        raise
@@ -0,0 +1,32 @@
+"""Reconnect delays: exponential backoff with jitter.
+
+Delays double from CONSUMER_RECONNECT_BACKOFF_MS up to the cap, and each one is
+drawn from the upper half of its step, so replicas that lost the broker together
+do not all reconnect in the same instant.
+"""
+import os
+import random
+
+# First reconnect delay, doubled after every failed attempt up to the maximum
+CONSUMER_RECONNECT_BACKOFF_MS = int(os.getenv("CONSUMER_RECONNECT_BACKOFF_MS", "200"))
+CONSUMER_RECONNECT_MAX_BACKOFF_MS = int(os.getenv("CONSUMER_RECONNECT_MAX_BACKOFF_MS", "30000"))
+
+
+class Backoff:
+    """Successive delays for one reconnect loop; reset() once connected again"""
+
+    def __init__(self, base_ms: int = CONSUMER_RECONNECT_BACKOFF_MS, max_ms: int = CONSUMER_RECONNECT_MAX_BACKOFF_MS,
+                 rng=random.random):
+        self.base = base_ms / 1000
+        self.max = max_ms / 1000
+        self._rng = rng
+        self.attempts = 0
+
+    def next(self) -> float:
+        """Seconds to wait before the next attempt"""
+        step = min(self.max, self.base * 2 ** min(self.attempts, 32))
+        self.attempts += 1
+        return step / 2 + self._rng() * step / 2
+
+    def reset(self):
+        self.attempts = 0
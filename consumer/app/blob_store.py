@@ -0,0 +1,15 @@
+import os
+import re
+
+# Read side of the producer's content-addressed blob store (same directory or volume).
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "/data/blobs")
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def blob_path(ref: str, root: str | None = None) -> str:
+    """Filesystem path of a blob reference ("sha256:<hex>")"""
+    digest = ref[len("sha256:"):] if ref.startswith("sha256:") else ref
+    if not _DIGEST_RE.match(digest):
+        raise ValueError(f"Invalid blob reference: {ref!r}")
+    return os.path.join(root or BLOB_STORE_DIR, digest[:2], digest[2:4], digest)
@@ -0,0 +1,134 @@
+import os
+import time
+import logging
+import threading
+
+from app import metrics
+from app.worker_pool import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+# Commit once this many messages have completed, or this long after the last
+# commit, whichever comes first.
+CONSUMER_COMMIT_EVERY = int(os.getenv("CONSUMER_COMMIT_EVERY", "100"))
+CONSUMER_COMMIT_INTERVAL_MS = int(os.getenv("CONSUMER_COMMIT_INTERVAL_MS", "5000"))
+
+
+class CommitStats:
+    """Thread-safe commit counters and latency, read by the health endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.commits = 0
+            self.failures = 0
+            self.messages = 0
+            self.total_latency = 0.0
+            self.max_latency = 0.0
+            self.last_latency = None
+            self.last_commit_at = None
+
+    def record(self, latency: float, messages: int):
+        with self._lock:
+            self.commits += 1
+            self.messages += messages
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.last_latency = latency
+            self.last_commit_at = time.time()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "commits": self.commits,
+                "failures": self.failures,
+                "messages_committed": self.messages,
+                "last_latency_ms": round(self.last_latency * 1000, 2) if self.last_latency is not None else None,
+                "avg_latency_ms": round(self.total_latency / self.commits * 1000, 2) if self.commits else None,
+                "max_latency_ms": round(self.max_latency * 1000, 2),
+                "last_commit_at": self.last_commit_at,
+            }
+
+
+commit_stats = CommitStats()
+
+
+class CommitManager:
+    """Commits processed offsets for one consumer, in batches.
+
+    Only positions reported by the worker pool are committed, and the pool never
+    reports a position past a message that is in flight or failed, so delivery is
+    at-least-once: anything not yet sent is redelivered after a restart or rebalance.
+    """
+
+    def __init__(
+        self,
+        consumer,
+        pool: WorkerPool,
+        every: int = CONSUMER_COMMIT_EVERY,
+        interval_ms: int = CONSUMER_COMMIT_INTERVAL_MS,
+        stats: CommitStats = commit_stats,
+        clock=time.monotonic,
+    ):
+        self._consumer = consumer
+        self._pool = pool
+        self.every = every
+        self.interval = interval_ms / 1000
+        self._stats = stats
+        self._clock = clock
+        self._committed: dict = {}
+        self._last_commit = clock()
+
+    def _pending(self) -> tuple[dict, int]:
+        """Offsets that moved since the last commit, and how many messages that covers"""
+        offsets, messages = {}, 0
+        for tp, meta in self._pool.committable_offsets().items():
+            previous = self._committed.get(tp)
+            if previous is None or meta.offset > previous:
+                offsets[tp] = meta
+                # Before the first commit we don't know where the partition started; count it as one
+                messages += meta.offset - previous if previous is not None else 1
+        return offsets, messages
+
+    def maybe_commit(self) -> bool:
+        """Commit if enough messages completed or the interval elapsed. Returns True if it committed."""
+        offsets, messages = self._pending()
+        if not offsets:
+            return False
+        if messages < self.every and self._clock() - self._last_commit < self.interval:
+            return False
+        return self._commit(offsets, messages)
+
+    def commit(self) -> bool:
+        """Commit whatever is pending now, regardless of cadence."""
+        offsets, messages = self._pending()
+        if not offsets:
+            return False
+        return self._commit(offsets, messages)
+
+    def _commit(self, offsets: dict, messages: int) -> bool:
+        started = time.perf_counter()
+        try:
+            self._consumer.commit(offsets)
+        except Exception:
+            self._stats.record_failure()
+            raise
+        latency = time.perf_counter() - started
+        self._stats.record(latency, messages)
+        metrics.COMMIT_SECONDS.observe(latency)
+        self._committed.update({tp: meta.offset for tp, meta in offsets.items()})
+        self._last_commit = self._clock()
+        logger.debug(f"Committed {messages} message(s) in {latency * 1000:.1f} ms: {offsets}")
+        return True
+
+    def forget(self, partitions) -> None:
+        """Stop tracking partitions that were rewound or revoked"""
+        for tp in partitions:
+            self._committed.pop(tp, None)
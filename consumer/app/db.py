@@ -0,0 +1,57 @@
+import os
+import logging
+from contextlib import contextmanager
+from typing import Iterator
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker
+
+logger = logging.getLogger(__name__)
+
+# Same database as the producer. Prefer a full DATABASE_URL; otherwise build it from
+# the individual POSTGRES_* variables. Without either, DB-backed features are off.
+DATABASE_URL = os.getenv("DATABASE_URL")
+if not DATABASE_URL and all(os.getenv(v) for v in ("POSTGRES_USER", "POSTGRES_PASSWORD", "POSTGRES_DB")):
+    DATABASE_URL = (
+        f"postgresql+psycopg2://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}"
+        f"@{os.getenv('POSTGRES_HOST', 'postgres')}:{os.getenv('POSTGRES_PORT', '5432')}/{os.getenv('POSTGRES_DB')}"
+    )
+
+# The consumer only does small key lookups and upserts from its worker threads
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "4"))
+
+safe_url = make_url(DATABASE_URL).render_as_string(hide_password=True) if DATABASE_URL else None
+
+if DATABASE_URL:
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+    )
+    SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    logger.info(f"Database configured: {safe_url}")
+else:
+    engine = None
+    SessionLocal = None
+    logger.info("Database not configured (set DATABASE_URL or POSTGRES_*)")
+
+
+@contextmanager
+def get_db() -> Iterator[Session]:
+    """Session that is always closed; errors are logged and re-raised"""
+    db = None
+    try:
+        db = SessionLocal()
+        yield db
+    except Exception as e:
+        logger.error(f"Database session error: {e}")
+        if db is not None:
+            db.rollback()
+        raise
+    finally:
+        if db is not None:
+            db.close()
@@ -0,0 +1,111 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+CONSUMER_DEDUP_ENABLED = os.getenv("CONSUMER_DEDUP_ENABLED", "true").lower() in {"1", "true", "yes", "on"}
+# Ids of sent emails kept in memory; older ones are still found in the table
+CONSUMER_DEDUP_CACHE_SIZE = int(os.getenv("CONSUMER_DEDUP_CACHE_SIZE", "100000"))
+
+SENT = "sent"
+
+# Plain SQL that runs on Postgres and SQLite alike
+_LOOKUP = text("SELECT status FROM sent_emails WHERE id = :id")
+_MARK = text(
+    "INSERT INTO sent_emails (id, status, sent_at) VALUES (:id, :status, CURRENT_TIMESTAMP) "
+    "ON CONFLICT (id) DO UPDATE SET status = excluded.status, sent_at = excluded.sent_at"
+)
+
+
+class DedupStore:
+    """Remembers which complaint ids have already been emailed.
+
+    Sent ids are recorded in the sent_emails table, so they survive restarts and
+    are shared by all consumer instances, and the most recent ones are kept in an
+    in-memory LRU so redeliveries are usually rejected without a query. An id is
+    also held while its email is being sent, so a duplicate arriving meanwhile on
+    another worker is skipped.
+
+    Database errors never block sending: a failed lookup counts as not sent
+    (at worst a duplicate email, as before), and a failed write is only logged.
+    """
+
+    def __init__(self, session_factory=None, cache_size: int = CONSUMER_DEDUP_CACHE_SIZE):
+        self._session_factory = session_factory
+        self.cache_size = cache_size
+        self._sent = OrderedDict()
+        self._sending = set()
+        self._lock = threading.Lock()
+
+    def _remember(self, record_id: str) -> None:
+        # Caller holds the lock
+        self._sent[record_id] = True
+        self._sent.move_to_end(record_id)
+        while len(self._sent) > self.cache_size:
+            self._sent.popitem(last=False)
+
+    def _lookup(self, record_id: str) -> bool:
+        if self._session_factory is None:
+            return False
+        try:
+            db = self._session_factory()
+            try:
+                status = db.execute(_LOOKUP, {"id": record_id}).scalar()
+            finally:
+                db.close()
+        except Exception as e:
+            metrics.DEDUP_LOOKUPS.labels(result="error").inc()
+            logger.warning(f"Dedup lookup failed for {record_id}, sending anyway: {e}")
+            return False
+        return status == SENT
+
+    def begin(self, record_id: str) -> bool:
+        """Claim a record for sending. Returns False if it was already sent or is being sent."""
+        with self._lock:
+            if record_id in self._sent:
+                self._sent.move_to_end(record_id)
+                metrics.DEDUP_LOOKUPS.labels(result="cache_hit").inc()
+                return False
+            if record_id in self._sending:
+                metrics.DEDUP_LOOKUPS.labels(result="in_progress").inc()
+                return False
+            self._sending.add(record_id)
+        if self._lookup(record_id):
+            with self._lock:
+                self._sending.discard(record_id)
+                self._remember(record_id)
+            metrics.DEDUP_LOOKUPS.labels(result="db_hit").inc()
+            return False
+        metrics.DEDUP_LOOKUPS.labels(result="miss").inc()
+        return True
+
+    def finish(self, record_id: str, sent: bool) -> None:
+        """Release a claim from begin(), recording the record as sent if it was"""
+        if sent and self._session_factory is not None:
+            try:
+                db = self._session_factory()
+                try:
+                    db.execute(_MARK, {"id": record_id, "status": SENT})
+                    db.commit()
+                finally:
+                    db.close()
+            except Exception as e:
+                logger.warning(f"Could not record {record_id} as sent: {e}")
+        with self._lock:
+            self._sending.discard(record_id)
+            if sent:
+                self._remember(record_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "persistent": self._session_factory is not None,
+                "cached": len(self._sent),
+                "in_progress": len(self._sending),
+            }
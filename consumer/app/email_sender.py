@@ -1,7 +1,19 @@
 import os
+import time
+import uuid
+import base64
 import smtplib
 import logging
-from email.message import EmailMessage
+import threading
+from typing import Callable, Iterator
+from email import policy
+from email.header import Header
+from email.message import EmailMessage, MIMEPart
+from email.utils import formatdate
+
+from app import metrics
+from app.rate_limiter import AdaptiveRateLimiter, SMTPThrottled, smtp_limiter, throttle_code
+from app.templating import get_template_store
 
 SMTP_HOST = os.getenv("SMTP_HOST","mailhog")
 SMTP_PORT = int(os.getenv("SMTP_PORT","1025"))
@@ -12,6 +24,340 @@ SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
 SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "false").lower() in {"1", "true", "yes", "on"}
 SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "10"))
 
+# Connection pool settings
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "60"))
+SMTP_KEEPALIVE_AFTER = float(os.getenv("SMTP_KEEPALIVE_AFTER", "15"))
+
+
+def _open_connection() -> smtplib.SMTP:
+    """Connect, upgrade to TLS and authenticate according to the SMTP_* settings."""
+    s = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    try:
+        if SMTP_STARTTLS:
+            try:
+                s.ehlo()
+                s.starttls()
+                s.ehlo()
+            except smtplib.SMTPException as e:
+                logging.warning("STARTTLS failed: %s", e)
+        if SMTP_USERNAME and SMTP_PASSWORD:
+            s.login(SMTP_USERNAME, SMTP_PASSWORD)
+    except Exception:
+        s.close()
+        raise
+    return s
+
+
+class _PooledConnection:
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPConnectionPool:
+    """Keeps authenticated SMTP connections open between sends.
+
+    A fresh connection costs a TCP connect, EHLO and optionally STARTTLS and AUTH,
+    which is most of the time spent sending a short message. Connections are
+    reused up to max_messages sends, probed with NOOP once idle longer than
+    keepalive_after, and closed once idle longer than idle_timeout. At most
+    `size` connections are open at once; callers block for a free one.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], smtplib.SMTP],
+        size: int = SMTP_POOL_SIZE,
+        max_messages: int = SMTP_MAX_MESSAGES_PER_CONNECTION,
+        idle_timeout: float = SMTP_IDLE_TIMEOUT,
+        keepalive_after: float = SMTP_KEEPALIVE_AFTER,
+        limiter: AdaptiveRateLimiter | None = None,
+    ):
+        self._factory = factory
+        self._limiter = limiter
+        self.size = size
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+        self.keepalive_after = keepalive_after
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle: list[_PooledConnection] = []
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def _connect(self) -> _PooledConnection:
+        conn = _PooledConnection(self._factory())
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    @staticmethod
+    def _close(conn: _PooledConnection) -> None:
+        try:
+            conn.smtp.quit()
+        except Exception:
+            try:
+                conn.smtp.close()
+            except Exception:
+                pass
+
+    def _is_alive(self, conn: _PooledConnection) -> bool:
+        try:
+            code, _ = conn.smtp.noop()
+            return code == 250
+        except Exception:
+            return False
+
+    def _acquire(self) -> _PooledConnection:
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    conn = self._idle.pop() if self._idle else None
+                if conn is None:
+                    return self._connect()
+                idle_for = time.monotonic() - conn.last_used
+                if idle_for > self.idle_timeout or (idle_for > self.keepalive_after and not self._is_alive(conn)):
+                    self._close(conn)
+                    continue
+                return conn
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, conn: _PooledConnection, reusable: bool) -> None:
+        try:
+            if reusable and conn.sent < self.max_messages:
+                conn.last_used = time.monotonic()
+                with self._lock:
+                    self._idle.append(conn)
+            else:
+                self._close(conn)
+            self.evict_idle()
+        finally:
+            self._slots.release()
+
+    def send_message(self, msg: EmailMessage) -> None:
+        """Send over a pooled connection, reconnecting once if the server had dropped it."""
+        self.send(lambda smtp: smtp.send_message(msg))
+
+    def sendmail(self, from_addr: str, to_addr: str, data: bytes) -> None:
+        """Send an already serialized message (CRLF line endings) over a pooled connection."""
+        self.send(lambda smtp: smtp.sendmail(from_addr, [to_addr], data))
+
+    def send(self, deliver: Callable[[smtplib.SMTP], None]) -> None:
+        """Run deliver(smtp) on a pooled connection, retrying once on a fresh one if the server had dropped it.
+
+        With a rate limiter, waits for a send slot first, and a throttle reply
+        from the server is raised as SMTPThrottled after slowing the limiter down.
+        """
+        if self._limiter is not None and not self._limiter.acquire():
+            metrics.SMTP_THROTTLED.labels(code="timeout").inc()
+            raise SMTPThrottled("No SMTP send slot within the rate limiter's wait limit")
+        started = time.perf_counter()
+        conn = self._acquire()
+        try:
+            try:
+                deliver(conn.smtp)
+            except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                logging.warning("SMTP connection dropped (%s); reconnecting", e)
+                metrics.SMTP_RECONNECTS.inc()
+                self._close(conn)
+                conn = self._connect()
+                deliver(conn.smtp)
+        except Exception as e:
+            # Don't reuse a connection in an unknown state
+            self._release(conn, reusable=False)
+            code = throttle_code(e) if self._limiter is not None else None
+            if code is not None:
+                self._limiter.record_throttle(code)
+                raise SMTPThrottled(f"SMTP server throttled the send: {e}", code) from e
+            metrics.SMTP_FAILURES.inc()
+            raise
+        if self._limiter is not None:
+            self._limiter.record_success()
+        metrics.SMTP_SEND_SECONDS.observe(time.perf_counter() - started)
+        conn.sent += 1
+        self._release(conn, reusable=True)
+
+    def evict_idle(self) -> None:
+        """Close idle connections that exceeded idle_timeout."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [c for c in self._idle if now - c.last_used > self.idle_timeout]
+            self._idle = [c for c in self._idle if c not in expired]
+        for conn in expired:
+            self._close(conn)
+
+    def close(self) -> None:
+        """Close all idle connections; connections in use are closed when released."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": self.size, "idle": len(self._idle), "opened": self.opened}
+
+
+_pool = SMTPConnectionPool(_open_connection, limiter=smtp_limiter)
+
+# Attachments are read and base64-encoded this many bytes at a time; a multiple of
+# 57 bytes, so every chunk encodes to whole 76-character lines.
+ATTACHMENT_READ_SIZE = 57 * 1024
+
+# Messages are serialized directly to bytes from the rendered template instead of
+# through EmailMessage, whose content manager and generator cost ~1-2 ms per email.
+# Every part is base64, so no line of the output starts with "." and it needs no
+# dot-stuffing in the DATA phase.
+
+
+def _header_value(value: str) -> str:
+    """Header text without line breaks, RFC 2047-encoded if it isn't plain ASCII"""
+    value = " ".join(str(value).splitlines())
+    if value.isascii() and len(value) < 900:
+        return value
+    # Folded lines must end in CRLF like every other line; servers reject bare LFs
+    return Header(value, "utf-8").encode(linesep="\r\n")
+
+
+def _b64(data: bytes) -> bytes:
+    return base64.encodebytes(data).replace(b"\n", b"\r\n")
+
+
+def _text_part(text: str, subtype: str) -> bytes:
+    return (
+        f"Content-Type: text/{subtype}; charset=\"utf-8\"\r\n"
+        "Content-Transfer-Encoding: base64\r\n\r\n"
+    ).encode() + _b64(text.encode("utf-8"))
+
+
+def _body_entity(text: str, html: str | None) -> bytes:
+    """The message body: text/plain, or multipart/alternative with an HTML version"""
+    if html is None:
+        return _text_part(text, "plain")
+    boundary = f"=_alt_{uuid.uuid4().hex}"
+    return b"".join((
+        f'Content-Type: multipart/alternative; boundary="{boundary}"\r\n\r\n--{boundary}\r\n'.encode(),
+        _text_part(text, "plain"),
+        f"--{boundary}\r\n".encode(),
+        _text_part(html, "html"),
+        f"--{boundary}--\r\n".encode(),
+    ))
+
+
+def _envelope_headers(from_addr: str, to_addr: str, subject: str) -> bytes:
+    domain = from_addr.rpartition("@")[2] or "localhost"
+    return (
+        f"From: {_header_value(from_addr)}\r\n"
+        f"To: {_header_value(to_addr)}\r\n"
+        f"Subject: {_header_value(subject)}\r\n"
+        f"Date: {formatdate()}\r\n"
+        f"Message-ID: <{uuid.uuid4().hex}@{domain}>\r\n"
+        "MIME-Version: 1.0\r\n"
+    ).encode()
+
+
+def _mime_message(headers: bytes, body: bytes, attachment_name: str | None = None,
+                  content_type: str = "application/octet-stream", attachment: Iterator[bytes] | None = None
+                  ) -> Iterator[bytes]:
+    """Serialize a message, a chunk at a time; the attachment chunks are base64-encoded as they go"""
+    if attachment is None:
+        yield headers + body
+        return
+    boundary = f"=_mixed_{uuid.uuid4().hex}"
+    disposition = MIMEPart(policy=policy.SMTP)
+    disposition.add_header("Content-Disposition", "attachment", filename=attachment_name)
+    yield b"".join((
+        headers,
+        f'Content-Type: multipart/mixed; boundary="{boundary}"\r\n\r\n--{boundary}\r\n'.encode(),
+        body,
+        f"\r\n--{boundary}\r\n".encode(),
+        f"Content-Type: {_header_value(content_type)}\r\nContent-Transfer-Encoding: base64\r\n".encode(),
+        disposition.as_bytes(),
+    ))
+    for chunk in attachment:
+        yield _b64(chunk)
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def _read_chunks(path: str) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while chunk := f.read(ATTACHMENT_READ_SIZE):
+            yield chunk
+
+
+def _send_streamed(smtp: smtplib.SMTP, from_addr: str, to_addr: str, chunks: Iterator[bytes]) -> None:
+    """smtplib.sendmail() for a message produced incrementally instead of held in memory."""
+    smtp.ehlo_or_helo_if_needed()
+    code, resp = smtp.mail(from_addr)
+    if code != 250:
+        smtp.rset()
+        raise smtplib.SMTPSenderRefused(code, resp, from_addr)
+    code, resp = smtp.rcpt(to_addr)
+    if code not in (250, 251):
+        smtp.rset()
+        raise smtplib.SMTPRecipientsRefused({to_addr: (code, resp)})
+    code, resp = smtp.docmd("data")
+    if code != 354:
+        smtp.rset()
+        raise smtplib.SMTPDataError(code, resp)
+    for chunk in chunks:
+        smtp.send(chunk)
+    smtp.send(b".\r\n")
+    code, resp = smtp.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, resp)
+
+
+def close_pool() -> None:
+    """Close pooled SMTP connections (called on shutdown)."""
+    _pool.close()
+
+def compose_email(
+    to_addr: str,
+    first_name: str,
+    subject: str,
+    body: str,
+    ticket_id: str,
+    attachment_name: str | None = None,
+    attachment_bytes: bytes | None = None,
+    attachment_path: str | None = None,
+    attachment_content_type: str = "application/octet-stream",
+    locale: str | None = None,
+    template: str = "ack",
+    last_name: str = "",
+) -> tuple[str, Callable[[], Iterator[bytes]]]:
+    """Render and serialize an email: returns (subject, chunks), where chunks()
+    yields the message bytes afresh on every call (so a send can be retried).
+
+    Raises FileNotFoundError for a missing attachment blob before anything is sent.
+    """
+    rendered = get_template_store().render(template, {
+        "first_name": first_name,
+        "last_name": last_name,
+        "subject": subject,
+        "body": body,
+        "ticket_id": ticket_id,
+        "email_id": to_addr,
+    }, locale=locale)
+    headers = _envelope_headers(FROM_ADDR, to_addr, rendered.subject)
+    body_entity = _body_entity(rendered.text, rendered.html)
+
+    if attachment_path:
+        if not os.path.isfile(attachment_path):
+            raise FileNotFoundError(f"Attachment blob not found: {attachment_path}")
+        name = attachment_name or os.path.basename(attachment_path)
+        return rendered.subject, lambda: _mime_message(
+            headers, body_entity, name, attachment_content_type, _read_chunks(attachment_path))
+    if attachment_name and attachment_bytes is not None:
+        return rendered.subject, lambda: _mime_message(
+            headers, body_entity, attachment_name, "application/octet-stream", iter([attachment_bytes]))
+    return rendered.subject, lambda: iter([headers + body_entity])
+
 def send_email(
     to_addr: str,
     first_name: str,
@@ -20,10 +366,25 @@ def send_email(
     ticket_id: str,
     attachment_name: str | None = None,
     attachment_bytes: bytes | None = None,
+    attachment_path: str | None = None,
+    attachment_content_type: str = "application/octet-stream",
+    locale: str | None = None,
+    template: str = "ack",
+    last_name: str = "",
 ) -> None:
     """Send an email (optionally with a single attachment) via SMTP.
 
+    The text comes from the compiled `template` (see app.templating), picked by
+    locale and subject, and is sent as plain text or, if the template has an
+    HTML version, as multipart/alternative.
+
+    An attachment is either given inline as attachment_bytes or, for blob-store
+    attachments, as attachment_path; a file is streamed into the SMTP DATA phase
+    so memory use does not depend on its size.
+
     Uses MailHog by default but supports STARTTLS and AUTH if configured via env vars.
+    Connections come from a shared pool and stay open between sends, so the
+    connect/STARTTLS/AUTH handshake is paid once per connection, not per email.
 
     Env vars:
       - SMTP_HOST (default: "mailhog")
@@ -33,51 +394,25 @@ def send_email(
       - SMTP_PASSWORD (optional)
       - SMTP_STARTTLS (true/false; default: false)
       - SMTP_TIMEOUT (seconds; default: 10)
-    """
-    msg = EmailMessage()
-    msg["From"] = FROM_ADDR
-    msg["To"] = to_addr
-    msg["Subject"] = subject
-
-    formatted_body = f"""Hello {first_name},
-
-Thank you for reaching out to us. We have successfully received your request regarding:
-
-"{subject}"
-
-Our team will review the details you provided:
-
-{body}
-
-Your reference ticket number is {ticket_id}.
-You will receive further updates as soon as possible.
-
-Best regards,
-CANON Support Team
-"""
-    msg.set_content(formatted_body)
-
-    if attachment_name and attachment_bytes is not None:
-        msg.add_attachment(
-            attachment_bytes,
-            maintype="application",
-            subtype="octet-stream",
-            filename=attachment_name,
-        )
+      - SMTP_POOL_SIZE (max open connections; default: 4)
+      - SMTP_MAX_MESSAGES_PER_CONNECTION (default: 100)
+      - SMTP_IDLE_TIMEOUT (seconds before an idle connection is closed; default: 60)
+      - SMTP_KEEPALIVE_AFTER (idle seconds before a NOOP check on reuse; default: 15)
+      - SMTP_RATE_LIMIT (max emails per second across all workers; default: 50)
 
+    Raises SMTPThrottled if the server answered 421/450/452 or no send slot freed up in time.
+    """
+    # Fail before the DATA phase (on a missing blob) so the pooled connection stays usable
+    rendered_subject, chunks = compose_email(
+        to_addr, first_name, subject, body, ticket_id, attachment_name, attachment_bytes,
+        attachment_path, attachment_content_type, locale, template, last_name,
+    )
     try:
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT) as s:
-            if SMTP_STARTTLS:
-                try:
-                    s.ehlo()
-                    s.starttls()
-                    s.ehlo()
-                except smtplib.SMTPException as e:
-                    logging.warning("STARTTLS failed: %s", e)
-            if SMTP_USERNAME and SMTP_PASSWORD:
-                s.login(SMTP_USERNAME, SMTP_PASSWORD)
-            s.send_message(msg)
-            logging.info("Sent email to %s with subject '%s'", to_addr, subject)
+        if attachment_path:
+            _pool.send(lambda smtp: _send_streamed(smtp, FROM_ADDR, to_addr, chunks()))
+        else:
+            _pool.sendmail(FROM_ADDR, to_addr, b"".join(chunks()))
+        logging.info("Sent email to %s with subject '%s'", to_addr, rendered_subject)
     except Exception:
         logging.exception("Failed to send email to %s", to_addr)
-        raise
\ No newline at end of file
+        raise
@@ -0,0 +1,181 @@
+"""Consumer liveness: lag against the log end, progress of the workers and readiness.
+
+consumer_running only says the poll loop was started; these signals say whether
+it is still getting through the backlog. The poll loop refreshes them every
+CONSUMER_METRICS_INTERVAL_MS, and the time-based ones are computed when read,
+so they keep growing even if the loop itself is stuck.
+"""
+import os
+import time
+import logging
+import threading
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# /ready fails once any of these is exceeded; 0 disables a check
+CONSUMER_READY_MAX_LAG = int(os.getenv("CONSUMER_READY_MAX_LAG", "10000"))
+# No message finished for this long while messages are waiting or in flight
+CONSUMER_READY_MAX_IDLE_SECONDS = float(os.getenv("CONSUMER_READY_MAX_IDLE_SECONDS", "300"))
+# One message has been with a worker this long, e.g. stuck in an SMTP call
+CONSUMER_READY_MAX_IN_FLIGHT_SECONDS = float(os.getenv("CONSUMER_READY_MAX_IN_FLIGHT_SECONDS", "120"))
+# The poll loop has not come around for this long
+CONSUMER_READY_MAX_POLL_GAP_SECONDS = float(os.getenv("CONSUMER_READY_MAX_POLL_GAP_SECONDS", "60"))
+
+
+def partition_offsets(consumer) -> dict:
+    """{TopicPartition: (committed, log_end)} for every assigned partition.
+
+    The committed offset comes from the consumer's own cache, updated on each
+    commit. The log end is the high watermark from the last fetch, with a single
+    ListOffsets request for partitions not fetched yet (e.g. paused ones).
+    Before the first commit the consumer position stands in for the committed offset.
+    """
+    assigned = consumer.assignment()
+    log_end = {tp: consumer.highwater(tp) for tp in assigned}
+    missing = [tp for tp, end in log_end.items() if end is None]
+    if missing:
+        log_end.update(consumer.end_offsets(missing))
+    offsets = {}
+    for tp in assigned:
+        committed = consumer.committed(tp)
+        if committed is None:
+            committed = consumer.position(tp)
+        offsets[tp] = (committed, log_end[tp])
+    return offsets
+
+
+class LivenessStats:
+    """Thread-safe progress signals, written by the poll loop and read by /health and /ready"""
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything; the time-based checks stay off until start()"""
+        with self._lock:
+            self.partitions = {}
+            self.held = frozenset()
+            self.in_flight = 0
+            self.oldest_started_at = None
+            self.last_processed_at = None
+            self.last_poll_at = None
+            self.started_at = None
+            self.updated_at = None
+
+    def start(self):
+        """Begin tracking a newly created consumer"""
+        self.reset()
+        with self._lock:
+            self.started_at = self._clock()
+
+    def record_poll(self):
+        with self._lock:
+            self.last_poll_at = self._clock()
+
+    def record_progress(
+        self, offsets: dict, in_flight: int, oldest_in_flight: float, last_processed_at: float | None, held=(),
+    ):
+        """Store a refresh from the poll loop and update the per-partition gauges.
+
+        held are the partitions paused on purpose (a retry not due yet, a failed
+        message backing off, the SMTP limiter cooling down); their lag still
+        counts towards max_lag, but not as work waiting for the idle check.
+        """
+        now = self._clock()
+        with self._lock:
+            self.partitions = dict(offsets)
+            self.held = frozenset(held)
+            self.in_flight = in_flight
+            self.oldest_started_at = now - oldest_in_flight if in_flight else None
+            if last_processed_at is not None:
+                self.last_processed_at = max(last_processed_at, self.last_processed_at or 0.0)
+            self.updated_at = now
+        for gauge in (metrics.PARTITION_COMMITTED_OFFSET, metrics.PARTITION_LOG_END_OFFSET, metrics.PARTITION_COMMITTED_LAG):
+            gauge.clear()
+        for tp, (committed, log_end) in offsets.items():
+            labels = {"topic": tp.topic, "partition": str(tp.partition)}
+            metrics.PARTITION_COMMITTED_OFFSET.labels(**labels).set(committed)
+            metrics.PARTITION_LOG_END_OFFSET.labels(**labels).set(log_end)
+            metrics.PARTITION_COMMITTED_LAG.labels(**labels).set(max(0, log_end - committed))
+        metrics.CONSUMER_LAG.set(self.total_lag())
+
+    def total_lag(self) -> int:
+        with self._lock:
+            return sum(max(0, end - committed) for committed, end in self.partitions.values())
+
+    def waiting_lag(self) -> int:
+        """Lag on the partitions the consumer is free to read, i.e. not held"""
+        with self._lock:
+            return sum(
+                max(0, end - committed) for tp, (committed, end) in self.partitions.items() if tp not in self.held
+            )
+
+    def seconds_since_last_message(self) -> float:
+        """Since the last message finished, or since the consumer started if none has"""
+        with self._lock:
+            since = self.last_processed_at or self.started_at
+            return self._clock() - since if since is not None else 0.0
+
+    def seconds_since_last_poll(self) -> float:
+        with self._lock:
+            since = self.last_poll_at or self.started_at
+            return self._clock() - since if since is not None else 0.0
+
+    def oldest_in_flight_seconds(self) -> float:
+        with self._lock:
+            return self._clock() - self.oldest_started_at if self.oldest_started_at is not None else 0.0
+
+    def problems(
+        self,
+        max_lag: int = CONSUMER_READY_MAX_LAG,
+        max_idle: float = CONSUMER_READY_MAX_IDLE_SECONDS,
+        max_in_flight_age: float = CONSUMER_READY_MAX_IN_FLIGHT_SECONDS,
+        max_poll_gap: float = CONSUMER_READY_MAX_POLL_GAP_SECONDS,
+    ) -> list[str]:
+        """Thresholds currently exceeded, as readable reasons (empty when ready)"""
+        reasons = []
+        lag = self.total_lag()
+        if max_lag and lag > max_lag:
+            reasons.append(f"lag {lag} > {max_lag}")
+        idle = self.seconds_since_last_message()
+        waiting_lag = self.waiting_lag()
+        with self._lock:
+            waiting = self.in_flight > 0 or waiting_lag > 0
+        if max_idle and waiting and idle > max_idle:
+            reasons.append(f"no message finished for {idle:.0f}s with work waiting")
+        age = self.oldest_in_flight_seconds()
+        if max_in_flight_age and age > max_in_flight_age:
+            reasons.append(f"a message has been in flight for {age:.0f}s")
+        gap = self.seconds_since_last_poll()
+        if max_poll_gap and gap > max_poll_gap:
+            reasons.append(f"poll loop idle for {gap:.0f}s")
+        return reasons
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            partitions = [
+                {"topic": tp.topic, "partition": tp.partition, "committed": committed,
+                 "log_end": end, "lag": max(0, end - committed)}
+                for tp, (committed, end) in sorted(self.partitions.items())
+            ]
+            in_flight, updated_at = self.in_flight, self.updated_at
+        return {
+            "partitions": partitions,
+            "total_lag": sum(p["lag"] for p in partitions),
+            "in_flight": in_flight,
+            "oldest_in_flight_seconds": round(self.oldest_in_flight_seconds(), 1),
+            "seconds_since_last_message": round(self.seconds_since_last_message(), 1),
+            "seconds_since_last_poll": round(self.seconds_since_last_poll(), 1),
+            "updated_at": updated_at,
+        }
+
+
+liveness_stats = LivenessStats()
+
+# Computed at scrape time, so a stalled poll loop still shows up in the metrics
+metrics.SECONDS_SINCE_LAST_MESSAGE.set_function(liveness_stats.seconds_since_last_message)
+metrics.OLDEST_IN_FLIGHT_SECONDS.set_function(liveness_stats.oldest_in_flight_seconds)
@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import threading
 import time
@@ -6,8 +7,23 @@ import traceback
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, Response
 from kafka import KafkaConsumer
+from kafka.structs import OffsetAndMetadata, TopicPartition
 from kafka.errors import KafkaError, NoBrokersAvailable, CommitFailedError, NotCoordinatorForGroupError
+from app.worker_pool import WorkerPool
+from app.blob_store import blob_path
+from app import db, metrics
+from app.backoff import Backoff
+from app.commit_manager import CommitManager, commit_stats
+from app.dedup import CONSUMER_DEDUP_ENABLED, DedupStore
+from app.liveness import liveness_stats, partition_offsets
+from app.models import SentEmail
+from app.rate_limiter import SMTPThrottled, smtp_limiter
+from app.rebalance import RebalanceListener, rebalance_stats
+from app.retry import KAFKA_RETRY_ENABLED, RetryRouter, retry_due_at
+from app.serialization import UnsupportedEncoding, decode
+from app.templating import get_template_store
 
 # Configure logging
 logging.basicConfig(
@@ -20,6 +36,29 @@ logger = logging.getLogger(__name__)
 consumer_running = False
 consumer_lock = threading.Lock()
 consumer_thread = None
+consumer_task = None
+consumer_stop = threading.Event()
+
+# Email sending concurrency: messages are handled on a pool of worker threads, with
+# at most CONSUMER_MAX_IN_FLIGHT messages per partition outstanding at a time.
+CONSUMER_WORKERS = int(os.getenv("CONSUMER_WORKERS", "4"))
+CONSUMER_MAX_IN_FLIGHT = int(os.getenv("CONSUMER_MAX_IN_FLIGHT", "16"))
+CONSUMER_MAX_POLL_RECORDS = int(os.getenv("CONSUMER_MAX_POLL_RECORDS", "100"))
+# A partition whose message failed is rewound to it and paused this long before retrying
+CONSUMER_RETRY_BACKOFF_MS = int(os.getenv("CONSUMER_RETRY_BACKOFF_MS", "5000"))
+# "threaded" (worker threads around kafka-python and smtplib) or "async" (aiokafka and
+# aiosmtplib on the event loop, see app.async_consumer)
+CONSUMER_MODE = os.getenv("CONSUMER_MODE", "threaded").lower()
+# How often the poll loop refreshes the in-flight and partition lag gauges
+CONSUMER_METRICS_INTERVAL_MS = int(os.getenv("CONSUMER_METRICS_INTERVAL_MS", "5000"))
+
+# Failed messages are forwarded to retry topics / the dead-letter topic (see app.retry)
+retry_router = None
+retry_router_lock = threading.Lock()
+
+# Complaint ids already emailed, so redeliveries are not sent twice (see app.dedup)
+dedup_store = None
+dedup_store_lock = threading.Lock()
 
 def set_consumer_running(val: bool):
     """Thread-safe setter for consumer running state"""
@@ -34,12 +73,48 @@ def get_consumer_running() -> bool:
     with consumer_lock:
         return consumer_running
 
+def get_retry_router() -> RetryRouter | None:
+    """Shared retry router, or None when retry topics are disabled"""
+    global retry_router
+    if not KAFKA_RETRY_ENABLED:
+        return None
+    with retry_router_lock:
+        if retry_router is None:
+            retry_router = RetryRouter(
+                os.getenv("KAFKA_BROKER", "kafka:9092"),
+                os.getenv("KAFKA_TOPIC", "complaints.v1"),
+            )
+        return retry_router
+
+def get_dedup_store() -> DedupStore | None:
+    """Shared dedup store, or None when deduplication is disabled"""
+    global dedup_store
+    if not CONSUMER_DEDUP_ENABLED:
+        return None
+    with dedup_store_lock:
+        if dedup_store is None:
+            session_factory = db.SessionLocal
+            if session_factory is not None:
+                try:
+                    SentEmail.__table__.create(db.engine, checkfirst=True)
+                except Exception as e:
+                    logger.warning(f"Could not create the sent_emails table: {e}")
+            else:
+                logger.warning("No database configured; duplicate detection only covers this process's lifetime")
+            dedup_store = DedupStore(session_factory)
+        return dedup_store
+
 def wait_for_kafka(broker: str, max_wait_time: int = 60) -> bool:
-    """Wait for Kafka to be available before creating consumer"""
+    """Wait for Kafka to be available, retrying with exponential backoff and jitter
+
+    The consumer loops don't call this: creating the consumer already fails fast
+    with NoBrokersAvailable, and they reconnect with the same backoff.
+    """
     logger.info(f"Waiting for Kafka broker {broker} to be ready...")
-    start_time = time.time()
+    deadline = time.monotonic() + max_wait_time
+    backoff = Backoff()
     
-    while time.time() - start_time < max_wait_time:
+    while True:
         try:
             # Try to create a temporary consumer to test connection
             test_consumer = KafkaConsumer(
@@ -51,13 +126,16 @@ def wait_for_kafka(broker: str, max_wait_time: int = 60) -> bool:
             return True
         except Exception as e:
             logger.debug(f"Kafka not ready yet: {e}")
-            time.sleep(2)
+            delay = backoff.next()
+            if time.monotonic() + delay > deadline:
+                break
+            time.sleep(delay)
     
     logger.warning(f"Kafka broker {broker} not ready after {max_wait_time} seconds")
     return False
 
-def create_consumer(broker: str, topic: str, group_id: str) -> KafkaConsumer:
-    """Create and configure Kafka consumer with optimal settings"""
+def consumer_config(broker: str, group_id: str) -> dict:
+    """Consumer settings, shared by kafka-python and aiokafka (CONSUMER_MODE=async)"""
     # Ensure group_id is not None or empty
     if not group_id or group_id.strip() == "":
         group_id = "emailer-group"
@@ -65,13 +143,14 @@ def create_consumer(broker: str, topic: str, group_id: str) -> KafkaConsumer:
     
     logger.info(f"Creating consumer with group_id: '{group_id}'")
     
-    consumer_config = {
+    config = {
         'bootstrap_servers': broker,
         'group_id': group_id,
-        'value_deserializer': lambda v: json.loads(v.decode("utf-8")) if v else None,
+        # Values stay raw bytes; handle_message decodes them by their content-type header
         'auto_offset_reset': os.getenv("KAFKA_OFFSET", "latest"),
-        'enable_auto_commit': True,
-        'auto_commit_interval_ms': 5000,
+        # Offsets are committed by the poll loop, and only past messages a worker has finished
+        'enable_auto_commit': False,
+        'max_poll_records': CONSUMER_MAX_POLL_RECORDS,
         
         # Connection and session settings for stability
         'session_timeout_ms': 30000,           # 30 seconds
@@ -92,13 +171,52 @@ def create_consumer(broker: str, topic: str, group_id: str) -> KafkaConsumer:
     
     # Add SASL settings if configured
     if os.getenv("KAFKA_SASL_MECHANISM"):
-        consumer_config.update({
+        config.update({
             'sasl_mechanism': os.getenv("KAFKA_SASL_MECHANISM"),
             'sasl_plain_username': os.getenv("KAFKA_SASL_USERNAME"),
             'sasl_plain_password': os.getenv("KAFKA_SASL_PASSWORD"),
         })
-    
-    return KafkaConsumer(topic, **consumer_config)
+    return config
+
+def create_consumer(broker: str, topic: str | list[str], group_id: str, listener=None) -> KafkaConsumer:
+    """Create and configure Kafka consumer with optimal settings
+
+    A rebalance listener, if given, is registered with the subscription.
+    """
+    topics = [topic] if isinstance(topic, str) else list(topic)
+    config = consumer_config(broker, group_id)
+    if listener is None:
+        return KafkaConsumer(*topics, **config)
+    consumer = KafkaConsumer(**config)
+    consumer.subscribe(topics=topics, listener=listener)
+    return consumer
+
+def complaint_email_args(message: dict) -> dict:
+    """send_email() keyword arguments for a complaint payload"""
+    attachment_name = message.get("attachment_name")
+    # Attachments uploaded to the producer travel as a blob-store reference
+    attachment = message.get("attachment") or {}
+    attachment_path = blob_path(attachment["ref"]) if attachment.get("ref") else None
+    if attachment_path:
+        attachment_name = attachment.get("name")
+    return dict(
+        to_addr=message.get('email_id', ''),
+        first_name=message.get("first_name", "Customer"),
+        last_name=message.get("last_name", ""),
+        subject=message.get('subject', 'No Subject'),
+        body=message.get('body', ''),
+        ticket_id=message.get('id', 'unknown'),
+        attachment_name=attachment_name,
+        attachment_bytes=message.get("attachment_data"),
+        attachment_path=attachment_path,
+        attachment_content_type=attachment.get("content_type") or "application/octet-stream",
+        locale=message.get("locale"),
+    )
+
+def observe_end_to_end_lag(message: dict) -> None:
+    submitted_at = message.get("submitted_at")
+    if submitted_at:
+        metrics.END_TO_END_LAG_SECONDS.observe(max(0.0, time.time() - submitted_at))
 
 def process_complaint_message(message: dict):
     """
@@ -108,29 +226,155 @@ def process_complaint_message(message: dict):
         from app.email_sender import send_email
 
         complaint_id = message.get('id', 'unknown')
-        subject = message.get('subject', 'No Subject')
-        body = message.get('body', '')
-        email_id = message.get('email_id', '')
-        first_name = message.get("first_name", "Customer")
-        attachment_name = message.get("attachment_name")
-        attachment_data = message.get("attachment_data")
-
-        logger.info(f"Processing complaint {complaint_id} for {email_id}")
-        send_email(
-            to_addr=email_id,
-            first_name=first_name,
-            subject=subject,
-            body=body,
-            ticket_id=complaint_id,
-            attachment_name=attachment_name,
-            attachment_bytes=attachment_data
-        )
-        logger.info(f"Successfully processed complaint {complaint_id}")
+        logger.debug(f"Processing complaint {complaint_id} for {message.get('email_id', '')}")
+        send_email(**complaint_email_args(message))
+        observe_end_to_end_lag(message)
+        logger.debug(f"Successfully processed complaint {complaint_id}")
 
     except Exception as e:
         logger.error(f"Error processing complaint message: {e}")
         raise
 
+def handle_message(message):
+    """Worker-pool entry point for a single Kafka record"""
+    if message.value is None:
+        logger.warning("Received message with null value, skipping...")
+        metrics.MESSAGES.labels(result="skipped").inc()
+        return
+    logger.debug(f"Processing message: offset={message.offset}, partition={message.partition}")
+    try:
+        payload = decode(message)
+    except Exception as e:
+        # Retrying cannot fix an undecodable value, so it goes straight to the dead-letter topic
+        logger.error(f"Cannot decode message at offset {message.offset}, partition {message.partition}: {e}")
+        route_failure(message, e, dead_letter=True)
+        return
+    # Redeliveries and producer retries can repeat an id that was already emailed
+    record_id = str(payload["id"]) if isinstance(payload, dict) and payload.get("id") else None
+    store = get_dedup_store() if record_id else None
+    if store is not None and not store.begin(record_id):
+        logger.info(f"Skipping complaint {record_id}: already sent")
+        metrics.MESSAGES.labels(result="duplicate").inc()
+        return
+    sent = False
+    try:
+        process_complaint_message(payload)
+        sent = True
+    except SMTPThrottled:
+        # Not the message's fault: the partition is rewound and paused until the limiter allows sending
+        metrics.MESSAGES.labels(result="throttled").inc()
+        raise
+    except Exception as e:
+        route_failure(message, e)
+        return
+    finally:
+        if store is not None:
+            store.finish(record_id, sent)
+    metrics.MESSAGES.labels(result="processed").inc()
+
+def route_failure(message, error: Exception, dead_letter: bool = False) -> None:
+    """Park a failed message on the next retry tier so the partition keeps moving
+
+    If there is no router or the publish fails, the error propagates and the
+    partition is rewound.
+    """
+    router = get_retry_router()
+    if router is None:
+        metrics.MESSAGES.labels(result="failed").inc()
+        raise error
+    try:
+        router.route(message, error, dead_letter=dead_letter)
+    except Exception:
+        metrics.MESSAGES.labels(result="failed").inc()
+        raise
+    metrics.MESSAGES.labels(result="dead_lettered" if dead_letter else "retried").inc()
+
+def hold_until_due(consumer, tp, message, paused: dict) -> bool:
+    """Pause a retry partition whose next message is not due yet.
+
+    Each retry topic has a single delay, so its messages become due in offset
+    order and the head of the partition is always the next one due.
+    """
+    due_at = retry_due_at(message)
+    if due_at is None:
+        return False
+    wait = due_at - time.time()
+    if wait <= 0:
+        return False
+    consumer.seek(tp, message.offset)
+    consumer.pause(tp)
+    paused[tp] = time.monotonic() + wait
+    return True
+
+def hold_while_throttled(consumer, tp, message, paused: dict) -> bool:
+    """Pause a partition instead of handing out more work while the SMTP server is throttling us"""
+    blocked = smtp_limiter.blocked_for()
+    if blocked <= 0:
+        return False
+    consumer.seek(tp, message.offset)
+    consumer.pause(tp)
+    paused[tp] = time.monotonic() + blocked
+    return True
+
+def rewind_failed(consumer, pool: WorkerPool, commits: CommitManager, paused: dict) -> None:
+    """Seek partitions with a failed message back to it and pause them for a backoff.
+
+    The commit position never passed the failed offset, so the message is fetched
+    again once the partition resumes. Messages after it that already succeeded are
+    redelivered as well (at-least-once).
+    """
+    failed = pool.failed()
+    if not failed:
+        return
+    # Settle in-flight work first so the commit below covers everything before the failure
+    pool.drain(timeout=30)
+    commits.commit()
+    # A throttled send fails its message too; don't resume before the SMTP cooldown is over
+    backoff = max(CONSUMER_RETRY_BACKOFF_MS / 1000, smtp_limiter.blocked_for())
+    resume_at = time.monotonic() + backoff
+    for tp, offset in failed.items():
+        logger.warning(f"Message {tp.topic}[{tp.partition}]@{offset} failed; retrying in {backoff * 1000:.0f} ms")
+        consumer.seek(tp, offset)
+        consumer.pause(tp)
+        paused[tp] = resume_at
+    pool.forget(failed.keys())
+
+def update_gauges(consumer, pool: WorkerPool, paused: dict) -> None:
+    """Refresh the in-flight, paused-partition, SMTP limiter and lag gauges, and the liveness stats"""
+    in_flight = pool.in_flight()
+    metrics.IN_FLIGHT.set(in_flight)
+    metrics.PAUSED_PARTITIONS.set(len(paused))
+    smtp_limiter.publish_metrics()
+    try:
+        metrics.record_partition_lag(consumer)
+        offsets = partition_offsets(consumer)
+    except Exception as e:
+        logger.debug(f"Could not compute partition lag: {e}")
+        offsets = liveness_stats.partitions
+    liveness_stats.record_progress(
+        offsets, in_flight, pool.oldest_in_flight_seconds(), pool.last_completed_at, held=paused.keys()
+    )
+
+def readiness_problems() -> list[str]:
+    """Why the consumer is not ready (empty when it is)"""
+    if not get_consumer_running():
+        return ["consumer not running"]
+    if not rebalance_stats.joined:
+        # Connected, but the group has not handed out partitions yet
+        return ["waiting for partition assignment"]
+    return liveness_stats.problems()
+
+metrics.READY.set_function(lambda: 0.0 if readiness_problems() else 1.0)
+
+def resume_due(consumer, paused: dict) -> None:
+    """Resume partitions whose retry backoff has elapsed"""
+    now = time.monotonic()
+    due = [tp for tp, resume_at in paused.items() if resume_at <= now]
+    if due:
+        consumer.resume(*due)
+        for tp in due:
+            del paused[tp]
+
 def start_kafka_consumer() -> threading.Thread:
     """Start the Kafka consumer with robust error handling and reconnection logic"""
     # Get configuration from environment
@@ -144,54 +388,64 @@ def start_kafka_consumer() -> threading.Thread:
     group_id = group.strip() if group and group.strip() else "emailer-group"
     logger.info(f"Using group_id: '{group_id}'")
     
+    router = get_retry_router()
+    topics = [topic] + (router.topics if router else [])
+    
     def run():
-        backoff = 1
-        max_backoff = 60
+        # Connect straight away; if the broker isn't up yet, creating the consumer
+        # fails fast and the loop retries with exponential backoff and jitter
+        backoff = Backoff()
         consecutive_errors = 0
-        max_consecutive_errors = 5
-        
-        # Wait for Kafka to be ready
-        if not wait_for_kafka(broker, max_wait_time=120):
-            logger.error("Failed to connect to Kafka broker initially, but will keep trying...")
         
-        while True:
+        while not consumer_stop.is_set():
             consumer = None
+            pool = None
             try:
                 logger.info(f"Creating Kafka consumer (attempt after {consecutive_errors} consecutive errors)")
                 
-                # Create consumer with retry logic
-                consumer = create_consumer(broker, topic, group_id)
+                # Create consumer with retry logic; the listener settles in-flight work
+                # on partitions that move to another group member
+                pool = WorkerPool(handle_message, workers=CONSUMER_WORKERS, max_in_flight=CONSUMER_MAX_IN_FLIGHT)
+                paused = {}
+                listener = RebalanceListener(pool, paused)
+                rebalance_stats.record_joining()
+                consumer = create_consumer(broker, topics, group_id, listener=listener)
                 
                 # Log partition assignment for debugging
                 logger.info(f"Consumer assigned to partitions: {consumer.assignment()}")
                 
-                logger.info("Successfully created Kafka consumer, starting message consumption...")
+                logger.info(f"Successfully created Kafka consumer, starting message consumption with {CONSUMER_WORKERS} worker(s)...")
                 set_consumer_running(True)
                 consecutive_errors = 0
-                backoff = 1
+                backoff.reset()
                 
-                # Main message consumption loop
-                for message in consumer:
-                    try:
-                        if message.value is None:
-                            logger.warning("Received message with null value, skipping...")
-                            continue
-                            
-                        logger.debug(f"Processing message: offset={message.offset}, partition={message.partition}")
-                        
-                        # Process the complaint message
-                        process_complaint_message(message.value)
-                        
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Failed to decode JSON message: {e}")
-                        logger.debug(f"Raw message value: {message.value}")
-                        
-                    except Exception as e:
-                        logger.error(f"Error processing message: {e}")
-                        traceback.print_exc()
-                        
-                        # Don't break the loop for message processing errors
-                        # The message will be committed and we'll continue
+                commits = listener.commits = CommitManager(consumer, pool)
+                gauges_at = 0.0
+                liveness_stats.start()
+                
+                # Main message consumption loop: fan records out to the worker pool,
+                # rewind partitions with failures and commit processed offsets in batches
+                while not consumer_stop.is_set():
+                    records = consumer.poll(timeout_ms=1000)
+                    liveness_stats.record_poll()
+                    for tp, messages in records.items():
+                        for message in messages:
+                            if (tp in paused or hold_until_due(consumer, tp, message, paused)
+                                    or hold_while_throttled(consumer, tp, message, paused)):
+                                break
+                            if not pool.submit(tp, message, stop=consumer_stop):
+                                break
+                    rewind_failed(consumer, pool, commits, paused)
+                    resume_due(consumer, paused)
+                    commits.maybe_commit()
+                    if time.monotonic() - gauges_at >= CONSUMER_METRICS_INTERVAL_MS / 1000:
+                        update_gauges(consumer, pool, paused)
+                        gauges_at = time.monotonic()
+                
+                # Graceful stop: let in-flight sends finish so their offsets get committed
+                if not pool.drain(timeout=10):
+                    logger.warning("Timed out waiting for in-flight messages; they will be redelivered")
+                commits.commit()
                         
             except NotCoordinatorForGroupError as e:
                 consecutive_errors += 1
@@ -221,25 +475,27 @@ def start_kafka_consumer() -> threading.Thread:
                 
             finally:
                 # Clean up consumer resources
+                if pool:
+                    pool.shutdown(wait=False)
                 if consumer:
                     try:
                         logger.info("Closing Kafka consumer...")
-                        consumer.close()
+                        consumer.close(autocommit=False)
                     except Exception as e:
                         logger.warning(f"Error closing consumer: {e}")
                 
                 set_consumer_running(False)
+                liveness_stats.reset()
+                rebalance_stats.record_left()
             
-            # Backoff logic with circuit breaker pattern
-            if consecutive_errors >= max_consecutive_errors:
-                logger.warning(f"Too many consecutive errors ({consecutive_errors}), increasing backoff time")
-                backoff = min(backoff * 2, max_backoff)
-            
-            if consecutive_errors > 0:
-                logger.info(f"Waiting {backoff} seconds before reconnecting... (consecutive errors: {consecutive_errors})")
-                time.sleep(backoff)
+            if consecutive_errors > 0 and not consumer_stop.is_set():
+                delay = backoff.next()
+                metrics.CONSUMER_RECONNECTS.inc()
+                logger.info(f"Waiting {delay:.2f} seconds before reconnecting... (consecutive errors: {consecutive_errors})")
+                consumer_stop.wait(delay)
     
     # Start consumer in daemon thread
+    consumer_stop.clear()
     consumer_thread = threading.Thread(target=run, daemon=True, name="KafkaConsumer")
     consumer_thread.start()
     logger.info("Kafka consumer thread started")
@@ -250,29 +506,48 @@ def start_kafka_consumer() -> threading.Thread:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application lifecycle - start/stop Kafka consumer"""
-    global consumer_thread
+    global consumer_thread, consumer_task
     
     # Startup
     logger.info("Starting up FastAPI application...")
     
-    # Add startup delay for Kafka coordination stabilization
-    logger.info("Waiting for Kafka coordination to stabilize...")
-    await asyncio.sleep(10)
-    
-    consumer_thread = start_kafka_consumer()
+    # Compile email templates now, so a broken template fails the deploy instead of the first send
+    get_template_store()
     
-    # Wait a moment to let consumer initialize
-    await asyncio.sleep(2)
+    # The consumer starts in the background; /ready reports it once the group has assigned partitions
+    if CONSUMER_MODE == "async":
+        from app.async_consumer import start_async_consumer
+        consumer_stop.clear()
+        consumer_task = start_async_consumer(consumer_stop)
+    else:
+        consumer_thread = start_kafka_consumer()
     
     yield
     
     # Shutdown
     logger.info("Shutting down FastAPI application...")
+    consumer_stop.set()
     set_consumer_running(False)
     
     if consumer_thread and consumer_thread.is_alive():
         logger.info("Waiting for consumer thread to finish...")
         consumer_thread.join(timeout=10)
+    if consumer_task is not None:
+        try:
+            await asyncio.wait_for(consumer_task, timeout=15)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            logger.warning("Async consumer did not stop in time; cancelled")
+        consumer_task = None
+    
+    # Close pooled SMTP connections if the sender was ever loaded
+    email_sender = sys.modules.get("app.email_sender")
+    if email_sender is not None:
+        email_sender.close_pool()
+    async_email_sender = sys.modules.get("app.async_email_sender")
+    if async_email_sender is not None:
+        await async_email_sender.close_pool()
+    if retry_router is not None:
+        retry_router.close()
 
 # Create FastAPI app with lifespan management
 app = FastAPI(
@@ -295,23 +570,39 @@ async def health_check():
 @app.get("/health/consumer")
 async def consumer_health_check():
     """Detailed consumer health check"""
+    problems = readiness_problems()
     return {
-        "status": "healthy" if get_consumer_running() else "unhealthy",
+        "status": "unhealthy" if problems else "healthy",
         "consumer_running": get_consumer_running(),
+        "problems": problems,
         "timestamp": time.time(),
+        "liveness": liveness_stats.snapshot(),
+        "commits": commit_stats.snapshot(),
+        "assignment": rebalance_stats.snapshot(),
+        "retries": retry_router.stats() if retry_router else {},
+        "dedup": dedup_store.stats() if dedup_store else None,
+        "smtp_limiter": smtp_limiter.state(),
         "kafka_broker": os.getenv("KAFKA_BROKER", "kafka:9092"),
         "kafka_topic": os.getenv("KAFKA_TOPIC", "complaints.v1"),
         "kafka_group": os.getenv("KAFKA_GROUP", "emailer-group")
     }
 
-# /ready endpoint as requested
+@app.get("/metrics", response_class=Response)
+async def prometheus_metrics():
+    """Prometheus metrics in the text exposition format"""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+# /ready endpoint as requested; 503 past the CONSUMER_READY_* thresholds (see app.liveness)
 @app.get("/ready")
 async def ready_endpoint():
-    return {
-        "status": "healthy" if get_consumer_running() else "unhealthy",
+    problems = readiness_problems()
+    return JSONResponse(status_code=503 if problems else 200, content={
+        "status": "unhealthy" if problems else "healthy",
         "consumer_running": get_consumer_running(),
+        "problems": problems,
         "timestamp": time.time()
-    }
+    })
 
 @app.get("/")
 async def root():
@@ -332,11 +623,66 @@ async def debug_env():
 # Add asyncio import for the lifespan function
 import asyncio
 
+from fastapi import Body
+
+@app.post("/test-email")
+async def test_email(
+    to: str = Body(...),
+    subject: str = Body(...),
+    body: str = Body(...)
+):
+    """Send a test email through the same pooled SMTP connections the consumer uses"""
+    try:
+        from app import email_sender
+        await asyncio.to_thread(
+            email_sender.send_email,
+            to_addr=to,
+            first_name="Test",
+            subject=subject,
+            body=body,
+            ticket_id="TEST123",
+            attachment_name=None,
+            attachment_bytes=None,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to send test email: {e}")
+    return {"status": "success", "message": f"Email sent to {to}"}
+
+@app.post("/dlq/replay")
+async def replay_dead_letters(max_messages: int = Body(100, embed=True, ge=1, le=10000)):
+    """Move dead-lettered messages back onto the main topic for another attempt"""
+    router = get_retry_router()
+    if router is None:
+        raise HTTPException(status_code=409, detail="Retry topics are disabled (KAFKA_RETRY_ENABLED=false)")
+    group = os.getenv("KAFKA_GROUP", "emailer-group").strip() or "emailer-group"
+    try:
+        replayed = await asyncio.to_thread(router.replay_dlq, group, max_messages)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to replay dead letters: {e}")
+    return {"status": "success", "replayed": replayed, "from": router.dlq, "to": router.topic}
+
+@app.get("/templates")
+async def list_templates():
+    """Loaded email templates and when they were compiled"""
+    return get_template_store().stats()
+
+@app.post("/templates/reload")
+async def reload_templates():
+    """Recompile email templates now instead of waiting for the periodic check"""
+    store = get_template_store()
+    try:
+        await asyncio.to_thread(store.reload, True)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Templates not reloaded: {e}")
+    return {"status": "success", **store.stats()}
+
 # Compatibility function for existing imports - matches original API
 def start_consumer(handler):
     """
     Compatibility function that maintains the original start_consumer(handler) API
-    This runs in the calling thread, matching the original behavior
+    This runs in the calling thread, matching the original behavior.
+    Messages are handled one at a time and each offset is committed once its
+    handler returned or failed; a failed message is logged and not retried.
     """
     # Get configuration from environment
     broker = os.getenv("KAFKA_BROKER", "kafka:9092")
@@ -349,14 +695,8 @@ def start_consumer(handler):
     group_id = group.strip() if group and group.strip() else "emailer-group"
     logger.info(f"Using group_id: '{group_id}'")
     
-    backoff = 1
-    max_backoff = 60
+    backoff = Backoff()
     consecutive_errors = 0
-    max_consecutive_errors = 5
-    
-    # Wait for Kafka to be ready
-    if not wait_for_kafka(broker, max_wait_time=120):
-        logger.error("Failed to connect to Kafka broker initially, but will keep trying...")
     
     while True:
         consumer = None
@@ -372,7 +712,7 @@ def start_consumer(handler):
             logger.info("Successfully created Kafka consumer, starting message consumption...")
             set_consumer_running(True)
             consecutive_errors = 0
-            backoff = 1
+            backoff.reset()
             
             # Main message consumption loop
             for message in consumer:
@@ -384,10 +724,10 @@ def start_consumer(handler):
                     logger.debug(f"Processing message: offset={message.offset}, partition={message.partition}")
                     
                     # Call the provided handler function
-                    handler(message.value)
+                    handler(decode(message))
                     
-                except json.JSONDecodeError as e:
-                    logger.error(f"Failed to decode JSON message: {e}")
+                except (json.JSONDecodeError, UnsupportedEncoding) as e:
+                    logger.error(f"Failed to decode message: {e}")
                     logger.debug(f"Raw message value: {message.value}")
                     
                 except Exception as e:
@@ -396,6 +736,13 @@ def start_consumer(handler):
                     
                     # Don't break the loop for handler errors
                     # The message will be committed and we'll continue
+
+                finally:
+                    # Auto-commit is off (see create_consumer), so commit explicitly, or every
+                    # restart and rebalance would deliver everything handled here again
+                    consumer.commit({
+                        TopicPartition(message.topic, message.partition): OffsetAndMetadata(message.offset + 1, None)
+                    })
                     
         except NotCoordinatorForGroupError as e:
             consecutive_errors += 1
@@ -434,11 +781,7 @@ def start_consumer(handler):
             
             set_consumer_running(False)
         
-        # Backoff logic with circuit breaker pattern
-        if consecutive_errors >= max_consecutive_errors:
-            logger.warning(f"Too many consecutive errors ({consecutive_errors}), increasing backoff time")
-            backoff = min(backoff * 2, max_backoff)
-        
         if consecutive_errors > 0:
-            logger.info(f"Waiting {backoff} seconds before reconnecting... (consecutive errors: {consecutive_errors})")
-            time.sleep(backoff)
\ No newline at end of file
+            delay = backoff.next()
+            logger.info(f"Waiting {delay:.2f} seconds before reconnecting... (consecutive errors: {consecutive_errors})")
+            time.sleep(delay)
\ No newline at end of file
@@ -0,0 +1,156 @@
+"""Prometheus metrics for the consumer, served at GET /metrics."""
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Submit-to-email lag includes retry-topic delays, so it runs up to tens of minutes
+LAG_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+MESSAGES = Counter(
+    "consumer_messages_total",
+    "Kafka messages handled, by outcome (processed, retried, dead_lettered, duplicate, throttled, failed, skipped)",
+    ["result"],
+)
+SMTP_SEND_SECONDS = Histogram(
+    "consumer_smtp_send_seconds",
+    "Time to hand one email to the SMTP server, including waiting for a pooled connection",
+    buckets=LATENCY_BUCKETS,
+)
+SMTP_FAILURES = Counter(
+    "consumer_smtp_failures_total",
+    "Emails the SMTP server did not accept",
+)
+SMTP_RECONNECTS = Counter(
+    "consumer_smtp_reconnects_total",
+    "Sends retried on a fresh connection after the server dropped a pooled one",
+)
+SMTP_THROTTLED = Counter(
+    "consumer_smtp_throttled_total",
+    "Throttle replies from the SMTP server (or send-slot timeouts), by reply code",
+    ["code"],
+)
+SMTP_RATE_LIMIT = Gauge(
+    "consumer_smtp_rate_limit",
+    "Emails per second the adaptive limiter currently allows",
+)
+SMTP_SEND_RATE = Gauge(
+    "consumer_smtp_send_rate",
+    "Emails per second actually accepted over the last 10 seconds",
+)
+SMTP_LIMITER_BLOCKED = Gauge(
+    "consumer_smtp_limiter_blocked",
+    "1 while sending is paused after a throttle reply",
+)
+SMTP_RATE_WAIT_SECONDS = Histogram(
+    "consumer_smtp_rate_wait_seconds",
+    "Time a worker waited for a send slot from the rate limiter",
+    buckets=LATENCY_BUCKETS,
+)
+END_TO_END_LAG_SECONDS = Histogram(
+    "consumer_end_to_end_lag_seconds",
+    "Time from submission on the producer to the email being sent",
+    buckets=LAG_BUCKETS,
+)
+RETRY_ROUTED = Counter(
+    "consumer_retry_routed_total",
+    "Failed messages forwarded to a retry or dead-letter topic",
+    ["topic"],
+)
+DEDUP_LOOKUPS = Counter(
+    "consumer_dedup_lookups_total",
+    "Already-sent checks, by result (cache_hit, db_hit, in_progress, miss, error)",
+    ["result"],
+)
+TEMPLATE_RELOADS = Counter(
+    "consumer_template_reloads_total",
+    "Email template directory reloads, by result (ok, error)",
+    ["result"],
+)
+COMMIT_SECONDS = Histogram(
+    "consumer_commit_seconds",
+    "Offset commit latency",
+    buckets=LATENCY_BUCKETS,
+)
+IN_FLIGHT = Gauge(
+    "consumer_in_flight_messages",
+    "Messages handed to workers and not finished yet",
+)
+PAUSED_PARTITIONS = Gauge(
+    "consumer_paused_partitions",
+    "Partitions paused for a retry backoff or a not-yet-due retry message",
+)
+PARTITION_LAG = Gauge(
+    "consumer_partition_lag",
+    "Messages between the consumer position and the partition high watermark",
+    ["topic", "partition"],
+)
+PARTITION_COMMITTED_OFFSET = Gauge(
+    "consumer_partition_committed_offset",
+    "Last committed offset of the consumer group, per assigned partition",
+    ["topic", "partition"],
+)
+PARTITION_LOG_END_OFFSET = Gauge(
+    "consumer_partition_log_end_offset",
+    "Log end offset (high watermark), per assigned partition",
+    ["topic", "partition"],
+)
+PARTITION_COMMITTED_LAG = Gauge(
+    "consumer_partition_committed_lag",
+    "Messages between the committed offset and the log end, per assigned partition",
+    ["topic", "partition"],
+)
+CONSUMER_LAG = Gauge(
+    "consumer_lag_messages",
+    "Committed lag summed over the partitions assigned to this consumer (for autoscaling)",
+)
+SECONDS_SINCE_LAST_MESSAGE = Gauge(
+    "consumer_seconds_since_last_message",
+    "Seconds since a worker last finished a message (since startup if none has)",
+)
+OLDEST_IN_FLIGHT_SECONDS = Gauge(
+    "consumer_oldest_in_flight_seconds",
+    "Age of the longest-running message still with a worker",
+)
+READY = Gauge(
+    "consumer_ready",
+    "1 while /ready reports the consumer ready, 0 otherwise",
+)
+REBALANCES = Counter(
+    "consumer_rebalance_events_total",
+    "Consumer group rebalance callbacks, by event (assigned, revoked)",
+    ["event"],
+)
+ASSIGNED_PARTITIONS = Gauge(
+    "consumer_assigned_partitions",
+    "Partitions currently assigned to this consumer",
+)
+GROUP_JOIN_SECONDS = Gauge(
+    "consumer_group_join_seconds",
+    "Seconds from creating the consumer to its first partition assignment, for the latest (re)connect",
+)
+CONSUMER_RECONNECTS = Counter(
+    "consumer_reconnects_total",
+    "Times the poll loop lost its Kafka consumer and reconnected after a backoff",
+)
+
+
+def record_partition_lag(consumer) -> dict:
+    """Refresh the lag gauge from the consumer's last fetch and return {TopicPartition: lag}.
+
+    Uses the high watermark reported with fetched records, so it costs no extra
+    broker request; partitions that have not been fetched yet are left out.
+    """
+    lags = {}
+    for tp in consumer.assignment():
+        highwater = consumer.highwater(tp)
+        if highwater is None:
+            continue
+        lags[tp] = max(0, highwater - consumer.position(tp))
+    PARTITION_LAG.clear()
+    for tp, lag in lags.items():
+        PARTITION_LAG.labels(topic=tp.topic, partition=str(tp.partition)).set(lag)
+    return lags
+
+
+def render() -> tuple[bytes, str]:
+    """Current metrics in the Prometheus text format, with its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
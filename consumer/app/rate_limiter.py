@@ -0,0 +1,203 @@
+import os
+import time
+import asyncio
+import logging
+import smtplib
+import threading
+from collections import deque
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# Starting (and maximum) send rate in emails per second, shared by all workers. Set it
+# near the provider's limit; the limiter only ever lowers it on throttle replies.
+SMTP_RATE_LIMIT = float(os.getenv("SMTP_RATE_LIMIT", "50"))
+SMTP_RATE_BURST = float(os.getenv("SMTP_RATE_BURST", str(max(1.0, SMTP_RATE_LIMIT))))
+SMTP_RATE_MIN = float(os.getenv("SMTP_RATE_MIN", "0.1"))
+# After a throttle response the rate is multiplied by this and sending stops for the cooldown,
+# which doubles on each consecutive throttle up to the maximum
+SMTP_RATE_BACKOFF = float(os.getenv("SMTP_RATE_BACKOFF", "0.5"))
+SMTP_THROTTLE_COOLDOWN = float(os.getenv("SMTP_THROTTLE_COOLDOWN", "30"))
+SMTP_THROTTLE_MAX_COOLDOWN = float(os.getenv("SMTP_THROTTLE_MAX_COOLDOWN", "600"))
+# Each accepted email raises the rate by this much (emails per second), back up to SMTP_RATE_LIMIT
+SMTP_RATE_RECOVERY_STEP = float(os.getenv("SMTP_RATE_RECOVERY_STEP", "0.05"))
+# Longest a worker waits for a send slot before giving the message back to the poll loop
+SMTP_RATE_MAX_WAIT = float(os.getenv("SMTP_RATE_MAX_WAIT", "60"))
+SMTP_THROTTLE_CODES = frozenset(int(c) for c in os.getenv("SMTP_THROTTLE_CODES", "421,450,452").split(",") if c.strip())
+
+RATE_WINDOW_SECONDS = 10
+
+
+class SMTPThrottled(Exception):
+    """The SMTP server asked us to slow down, or no send slot freed up in time.
+
+    Not a failure of the message: it is rewound and sent again once the limiter
+    allows, rather than being routed to a retry topic.
+    """
+
+    def __init__(self, message: str, code: int | None = None):
+        super().__init__(message)
+        self.code = code
+
+
+def throttle_code(error: Exception) -> int | None:
+    """The SMTP reply code if error is a throttle response (421/450/452 by default)"""
+    codes = []
+    if isinstance(error, smtplib.SMTPResponseException):
+        codes.append(error.smtp_code)
+    elif isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes.extend(code for code, _ in error.recipients.values())
+    else:
+        # aiosmtplib errors carry .code, and refused recipients as a list of such errors
+        codes.append(getattr(error, "code", None))
+        codes.extend(getattr(r, "code", None) for r in getattr(error, "recipients", None) or [])
+    for code in codes:
+        if code in SMTP_THROTTLE_CODES:
+            return code
+    return None
+
+
+class AdaptiveRateLimiter:
+    """Token bucket shared by all email workers, adapting to throttle responses.
+
+    Workers take a token before each send. A throttle reply halves the rate
+    (AIMD) and blocks sending for a cooldown; every accepted email then adds a
+    small step back, up to the configured maximum. While blocked, the poll loop
+    pauses its partitions instead of handing out more messages.
+    """
+
+    def __init__(
+        self,
+        rate: float = SMTP_RATE_LIMIT,
+        burst: float = SMTP_RATE_BURST,
+        min_rate: float = SMTP_RATE_MIN,
+        backoff: float = SMTP_RATE_BACKOFF,
+        cooldown: float = SMTP_THROTTLE_COOLDOWN,
+        max_cooldown: float = SMTP_THROTTLE_MAX_COOLDOWN,
+        recovery_step: float = SMTP_RATE_RECOVERY_STEP,
+        clock=time.monotonic,
+    ):
+        self.max_rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.backoff = backoff
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.recovery_step = recovery_step
+        self._clock = clock
+        self._cond = threading.Condition()
+        self.rate = rate
+        self._tokens = burst
+        self._refilled_at = clock()
+        self.blocked_until = 0.0
+        self._cooldown = cooldown
+        self.throttles = 0
+        self._sent = deque()
+
+    def _refill(self, now: float) -> None:
+        # Caller holds the lock
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def blocked_for(self) -> float:
+        """Seconds until sending may resume after a throttle response (0 if not blocked)"""
+        with self._cond:
+            return max(0.0, self.blocked_until - self._clock())
+
+    def _take(self, now: float) -> float:
+        """Take a token if one is free. Returns 0 if taken, else seconds until one may be.
+
+        Caller holds the lock.
+        """
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def acquire(self, timeout: float | None = SMTP_RATE_MAX_WAIT) -> bool:
+        """Wait for a send slot. Returns False if none was free within timeout."""
+        started = self._clock()
+        deadline = None if timeout is None else started + timeout
+        with self._cond:
+            while (wait := self._take(self._clock())) > 0:
+                if deadline is not None:
+                    now = self._clock()
+                    if now >= deadline:
+                        return False
+                    wait = min(wait, deadline - now)
+                self._cond.wait(timeout=wait)
+        metrics.SMTP_RATE_WAIT_SECONDS.observe(self._clock() - started)
+        return True
+
+    async def acquire_async(self, timeout: float | None = SMTP_RATE_MAX_WAIT) -> bool:
+        """acquire() for coroutines: sleeps on the event loop instead of blocking a thread"""
+        started = self._clock()
+        deadline = None if timeout is None else started + timeout
+        while True:
+            with self._cond:
+                wait = self._take(self._clock())
+            if wait <= 0:
+                break
+            if deadline is not None:
+                now = self._clock()
+                if now >= deadline:
+                    return False
+                wait = min(wait, deadline - now)
+            await asyncio.sleep(wait)
+        metrics.SMTP_RATE_WAIT_SECONDS.observe(self._clock() - started)
+        return True
+
+    def record_success(self) -> None:
+        with self._cond:
+            now = self._clock()
+            self._sent.append(now)
+            while self._sent and self._sent[0] < now - RATE_WINDOW_SECONDS:
+                self._sent.popleft()
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.recovery_step)
+            self._cooldown = self.base_cooldown
+
+    def record_throttle(self, code: int) -> None:
+        with self._cond:
+            now = self._clock()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * self.backoff)
+            self._tokens = min(self._tokens, 0.0)
+            # A burst of rejections from the same episode counts once
+            if now >= self.blocked_until:
+                self.blocked_until = now + self._cooldown
+                self._cooldown = min(self.max_cooldown, self._cooldown * 2)
+            self.throttles += 1
+            self._cond.notify_all()
+        metrics.SMTP_THROTTLED.labels(code=str(code)).inc()
+        self.publish_metrics()
+        logger.warning(f"SMTP throttled ({code}); rate now {self.rate:.2f}/s, sending paused for {self.blocked_for():.0f}s")
+
+    def state(self) -> dict:
+        with self._cond:
+            now = self._clock()
+            self._refill(now)
+            recent = sum(1 for t in self._sent if t >= now - RATE_WINDOW_SECONDS)
+            return {
+                "rate_limit": round(self.rate, 3),
+                "max_rate": self.max_rate,
+                "send_rate": round(recent / RATE_WINDOW_SECONDS, 3),
+                "tokens": round(self._tokens, 2),
+                "blocked_for": round(max(0.0, self.blocked_until - now), 1),
+                "throttles": self.throttles,
+            }
+
+    def publish_metrics(self) -> dict:
+        """Refresh the limiter gauges and return the state they were set from"""
+        state = self.state()
+        metrics.SMTP_RATE_LIMIT.set(state["rate_limit"])
+        metrics.SMTP_SEND_RATE.set(state["send_rate"])
+        metrics.SMTP_LIMITER_BLOCKED.set(1 if state["blocked_for"] > 0 else 0)
+        return state
+
+
+smtp_limiter = AdaptiveRateLimiter()
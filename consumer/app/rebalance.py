@@ -0,0 +1,125 @@
+import os
+import time
+import logging
+import threading
+
+from kafka import ConsumerRebalanceListener
+
+from app import metrics
+from app.worker_pool import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+# How long a revoke waits for in-flight sends on the revoked partitions. Must stay
+# well under max_poll_interval_ms, or the consumer is dropped from the group.
+CONSUMER_REVOKE_DRAIN_MS = int(os.getenv("CONSUMER_REVOKE_DRAIN_MS", "20000"))
+
+
+class RebalanceStats:
+    """Thread-safe view of the current assignment, read by the health endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.assigned = set()
+            self.rebalances = 0
+            self.last_rebalance_at = None
+            self.abandoned = 0
+            self.joined = False
+            self.joining_since = None
+
+    def record_joining(self):
+        """A new consumer is joining the group; it is not ready until its first assignment"""
+        with self._lock:
+            self.assigned = set()
+            self.joined = False
+            self.joining_since = time.monotonic()
+
+    def record_left(self):
+        """The consumer was closed and no longer holds any partitions"""
+        with self._lock:
+            self.assigned = set()
+            self.joined = False
+            self.joining_since = None
+        metrics.ASSIGNED_PARTITIONS.set(0)
+
+    def record_assigned(self, partitions):
+        join_seconds = None
+        with self._lock:
+            self.assigned = set(partitions)
+            self.rebalances += 1
+            self.last_rebalance_at = time.time()
+            if not self.joined and self.joining_since is not None:
+                join_seconds = time.monotonic() - self.joining_since
+            self.joined = True
+        if join_seconds is not None:
+            metrics.GROUP_JOIN_SECONDS.set(join_seconds)
+            logger.info(f"Joined the consumer group {join_seconds:.2f}s after connecting")
+
+    def record_revoked(self, partitions, abandoned: int = 0):
+        with self._lock:
+            self.assigned -= set(partitions)
+            self.abandoned += abandoned
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "assigned_partitions": sorted(f"{tp.topic}[{tp.partition}]" for tp in self.assigned),
+                "rebalances": self.rebalances,
+                "last_rebalance_at": self.last_rebalance_at,
+                "abandoned_in_flight": self.abandoned,
+                "joined": self.joined,
+            }
+
+
+rebalance_stats = RebalanceStats()
+
+
+class RebalanceListener(ConsumerRebalanceListener):
+    """Hands partitions over cleanly when the group rebalances.
+
+    On revoke, in-flight messages on the revoked partitions are given time to
+    finish and their offsets are committed while this consumer still owns them,
+    so the next owner starts right after the last email sent instead of
+    redelivering everything since the previous periodic commit. Both callbacks
+    run on the poll thread, inside consumer.poll().
+    """
+
+    def __init__(self, pool: WorkerPool, paused: dict, drain_timeout_ms: int = CONSUMER_REVOKE_DRAIN_MS,
+                 stats: RebalanceStats = rebalance_stats):
+        self._pool = pool
+        self._paused = paused
+        self.drain_timeout = drain_timeout_ms / 1000
+        self._stats = stats
+        self.commits = None  # the CommitManager, set once the consumer exists
+
+    def on_partitions_revoked(self, revoked):
+        revoked = set(revoked)
+        if not revoked:
+            return
+        abandoned = 0
+        if not self._pool.drain(timeout=self.drain_timeout, partitions=revoked):
+            abandoned = self._pool.in_flight(revoked)
+            logger.warning(f"Revoke drain timed out; in-flight messages on {len(revoked)} partition(s) will be redelivered")
+        if self.commits is not None:
+            try:
+                self.commits.commit()
+            except Exception as e:
+                # The new owner resumes from the last successful commit (at-least-once)
+                logger.warning(f"Commit on revoke failed: {e}")
+            self.commits.forget(revoked)
+        self._pool.forget(revoked)
+        for tp in revoked:
+            self._paused.pop(tp, None)
+        self._stats.record_revoked(revoked, abandoned)
+        metrics.REBALANCES.labels(event="revoked").inc()
+        logger.info(f"Partitions revoked: {sorted(revoked)}")
+
+    def on_partitions_assigned(self, assigned):
+        self._stats.record_assigned(assigned)
+        metrics.ASSIGNED_PARTITIONS.set(len(assigned))
+        metrics.REBALANCES.labels(event="assigned").inc()
+        logger.info(f"Partitions assigned: {sorted(assigned)}")
@@ -0,0 +1,167 @@
+import os
+import time
+import logging
+import threading
+from collections import Counter
+
+from kafka import KafkaConsumer, KafkaProducer
+
+from app import metrics
+from app.serialization import encoding_headers
+
+logger = logging.getLogger(__name__)
+
+# Failed messages move through one topic per delay tier, then to the dead-letter topic:
+#   complaints.v1 -> complaints.v1.retry.1m -> complaints.v1.retry.10m -> complaints.v1.dlq
+KAFKA_RETRY_ENABLED = os.getenv("KAFKA_RETRY_ENABLED", "true").lower() in {"1", "true", "yes", "on"}
+KAFKA_RETRY_DELAYS = os.getenv("KAFKA_RETRY_DELAYS", "1m,10m")
+
+ATTEMPT_HEADER = "x-attempt"
+RETRY_AT_HEADER = "x-retry-at"
+ERROR_HEADER = "x-error"
+ORIGIN_HEADER = "x-origin"
+
+_UNITS = {"s": 1, "m": 60, "h": 3600}
+
+
+def parse_delays(spec: str) -> list[tuple[str, int]]:
+    """Parse "30s,1m,10m" into [("30s", 30), ("1m", 60), ("10m", 600)]"""
+    tiers = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        unit = part[-1]
+        if unit not in _UNITS or not part[:-1].isdigit():
+            raise ValueError(f"Invalid retry delay '{part}'; use e.g. 30s, 1m or 2h")
+        tiers.append((part, int(part[:-1]) * _UNITS[unit]))
+    return tiers
+
+
+def retry_topics(topic: str, delays: str = KAFKA_RETRY_DELAYS) -> list[str]:
+    return [f"{topic}.retry.{label}" for label, _ in parse_delays(delays)]
+
+
+def dlq_topic(topic: str) -> str:
+    return f"{topic}.dlq"
+
+
+def get_header(message, name: str) -> str | None:
+    for key, value in getattr(message, "headers", None) or []:
+        if key == name:
+            return value.decode("utf-8") if isinstance(value, bytes) else value
+    return None
+
+
+def retry_due_at(message) -> float | None:
+    """Epoch seconds at which a retry-topic message may be processed, or None if it isn't one"""
+    value = get_header(message, RETRY_AT_HEADER)
+    return float(value) / 1000 if value else None
+
+
+class RetryRouter:
+    """Forwards failed messages to the next retry tier or to the dead-letter topic.
+
+    The attempt count and the time the message becomes due travel in headers, so
+    the consumer can hold a retry partition until its head message is due instead
+    of retrying inline and blocking the partition.
+    """
+
+    def __init__(self, broker: str, topic: str, delays: str = KAFKA_RETRY_DELAYS):
+        self.broker = broker
+        self.topic = topic
+        self.tiers = [(name, seconds) for name, (_, seconds) in zip(retry_topics(topic, delays), parse_delays(delays))]
+        self.dlq = dlq_topic(topic)
+        self._producer = None
+        self._lock = threading.Lock()
+        self.routed = Counter()
+
+    @property
+    def topics(self) -> list[str]:
+        """Topics the consumer must subscribe to, besides the main one"""
+        return [name for name, _ in self.tiers]
+
+    def _get_producer(self) -> KafkaProducer:
+        with self._lock:
+            if self._producer is None:
+                self._producer = KafkaProducer(
+                    bootstrap_servers=self.broker,
+                    acks="all",
+                )
+            return self._producer
+
+    def _send(self, topic: str, message, headers: list[tuple[str, bytes]]) -> None:
+        # The value is forwarded as the original bytes, along with the headers that say how to decode it
+        headers = encoding_headers(message) + headers
+        try:
+            self._get_producer().send(topic, message.value, key=message.key, headers=headers).get(timeout=10)
+        except Exception:
+            with self._lock:
+                self._producer = None
+            raise
+
+    def route(self, message, error: Exception, dead_letter: bool = False) -> str:
+        """Publish a failed message to its next destination and return that topic.
+
+        dead_letter skips the remaining retry tiers. Raises if the publish fails,
+        in which case the message stays uncommitted.
+        """
+        attempt = int(get_header(message, ATTEMPT_HEADER) or 0)
+        origin = get_header(message, ORIGIN_HEADER) or f"{message.topic}/{message.partition}/{message.offset}"
+        headers = [
+            (ATTEMPT_HEADER, str(attempt + 1).encode()),
+            (ERROR_HEADER, str(error)[:500].encode()),
+            (ORIGIN_HEADER, origin.encode()),
+        ]
+        if attempt < len(self.tiers) and not dead_letter:
+            destination, delay = self.tiers[attempt]
+            headers.append((RETRY_AT_HEADER, str(int((time.time() + delay) * 1000)).encode()))
+        else:
+            destination = self.dlq
+        self._send(destination, message, headers)
+        self.routed[destination] += 1
+        metrics.RETRY_ROUTED.labels(topic=destination).inc()
+        logger.warning(f"Message {origin} failed (attempt {attempt + 1}): {error}; sent to {destination}")
+        return destination
+
+    def replay_dlq(self, group_id: str, max_messages: int = 100, timeout_ms: int = 5000) -> int:
+        """Re-publish up to max_messages dead-lettered messages to the main topic.
+
+        Uses its own consumer group so each dead letter is replayed once; replayed
+        messages start again from attempt zero.
+        """
+        consumer = KafkaConsumer(
+            self.dlq,
+            bootstrap_servers=self.broker,
+            group_id=f"{group_id}-dlq-replay",
+            auto_offset_reset="earliest",
+            enable_auto_commit=False,
+            max_poll_records=max_messages,
+        )
+        replayed = 0
+        try:
+            deadline = time.monotonic() + timeout_ms / 1000
+            while replayed < max_messages and time.monotonic() < deadline:
+                records = consumer.poll(timeout_ms=1000, max_records=max_messages - replayed)
+                if not records:
+                    continue
+                for messages in records.values():
+                    for message in messages:
+                        origin = get_header(message, ORIGIN_HEADER) or ""
+                        self._send(self.topic, message, [(ORIGIN_HEADER, origin.encode()), ("x-replayed", b"1")])
+                        replayed += 1
+                consumer.commit()
+        finally:
+            consumer.close(autocommit=False)
+        self.routed["replayed"] += replayed
+        logger.info(f"Replayed {replayed} message(s) from {self.dlq} to {self.topic}")
+        return replayed
+
+    def stats(self) -> dict:
+        return dict(self.routed)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._producer is not None:
+                self._producer.close(timeout=5)
+                self._producer = None
@@ -0,0 +1,58 @@
+import json
+
+import msgpack
+
+# Must match producer/app/serialization.py
+CONTENT_TYPE_HEADER = "content-type"
+SCHEMA_ID_HEADER = "schema-id"
+
+# Field order per schema id; add new ids here before any producer uses them
+SCHEMAS = {
+    1: ("id", "submitted_at", "email_id", "first_name", "last_name", "subject", "body", "attachment"),
+}
+
+# Headers describing the value encoding; kept when a message is forwarded to another topic
+ENCODING_HEADERS = (CONTENT_TYPE_HEADER, SCHEMA_ID_HEADER)
+
+
+class UnsupportedEncoding(ValueError):
+    pass
+
+
+def _header(headers, name: str) -> bytes | None:
+    for key, value in headers or []:
+        if key == name:
+            return value
+    return None
+
+
+def encoding_headers(message) -> list[tuple[str, bytes]]:
+    return [(k, v) for k, v in getattr(message, "headers", None) or [] if k in ENCODING_HEADERS]
+
+
+def _decode_msgpack(value: bytes, schema_id: bytes | None) -> dict:
+    try:
+        fields = SCHEMAS[int(schema_id)]
+    except (TypeError, ValueError, KeyError):
+        raise UnsupportedEncoding(f"Unknown schema id {schema_id!r}")
+    values = msgpack.unpackb(value, raw=False)
+    payload = dict(zip(fields, values))
+    if len(values) > len(fields) and isinstance(values[len(fields)], dict):
+        payload.update(values[len(fields)])
+    return payload
+
+
+def decode_value(value: bytes, headers=None) -> dict | None:
+    """Decode a message value according to its content-type header (JSON if absent)"""
+    if value is None or isinstance(value, dict):
+        return value
+    content_type = _header(headers, CONTENT_TYPE_HEADER)
+    if content_type in (None, b"application/json"):
+        return json.loads(value.decode("utf-8"))
+    if content_type == b"application/msgpack":
+        return _decode_msgpack(value, _header(headers, SCHEMA_ID_HEADER))
+    raise UnsupportedEncoding(f"Unsupported content-type {content_type!r}")
+
+
+def decode(message) -> dict | None:
+    return decode_value(message.value, getattr(message, "headers", None))
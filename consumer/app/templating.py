@@ -0,0 +1,237 @@
+"""Email templates, compiled once and reloaded when the template directory changes.
+
+Layout of EMAIL_TEMPLATE_DIR:
+
+    <locale>/<name>.txt                 plain-text body (required)
+    <locale>/<name>.html                HTML alternative (optional)
+    <locale>/<name>.<variant>.txt|html  per-subject variant, e.g. ack.billing.txt
+
+The variant is the complaint subject lowercased with runs of other characters
+turned into "-" ("Billing issue!" -> "billing-issue"). A .txt template may start
+with a "Subject: ..." line and a blank line to override the subject.
+
+Placeholders use string.Template syntax ($first_name or ${first_name}); values
+are HTML-escaped in .html templates. Unknown placeholders are rejected at load
+time, so a broken edit never reaches a customer: the previous templates stay
+active and the error is logged.
+"""
+import os
+import re
+import html
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from string import Template
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+EMAIL_TEMPLATE_DIR = os.getenv("EMAIL_TEMPLATE_DIR", os.path.join(os.path.dirname(__file__), "templates"))
+EMAIL_TEMPLATE_LOCALE = os.getenv("EMAIL_TEMPLATE_LOCALE", "en")
+# How often a render checks the directory for edits; 0 disables hot reload
+EMAIL_TEMPLATE_RELOAD_SECONDS = float(os.getenv("EMAIL_TEMPLATE_RELOAD_SECONDS", "5"))
+
+PLACEHOLDERS = frozenset({"first_name", "last_name", "subject", "body", "ticket_id", "email_id"})
+DEFAULT_VARIANT = ""
+
+_SUBJECT_LINE = re.compile(r"\ASubject:[ \t]*([^\r\n]*)\r?\n\r?\n")
+_SLUG = re.compile(r"[^a-z0-9]+")
+
+
+class TemplateError(ValueError):
+    pass
+
+
+class CompiledTemplate:
+    """A template split into literal text and placeholder names at load time.
+
+    Rendering is a single join over the pieces, with no parsing per message.
+    """
+
+    def __init__(self, source: str, origin: str = "<string>", escape: bool = False):
+        self.escape = escape
+        self._pieces: list[tuple[bool, str]] = []   # (is_placeholder, literal text or name)
+        pos = 0
+        for match in Template.pattern.finditer(source):
+            self._pieces.append((False, source[pos:match.start()]))
+            name = match.group("named") or match.group("braced")
+            if match.group("escaped") is not None:
+                self._pieces.append((False, "$"))
+            elif name is not None:
+                if name not in PLACEHOLDERS:
+                    raise TemplateError(f"{origin}: unknown placeholder ${name}; use one of {sorted(PLACEHOLDERS)}")
+                self._pieces.append((True, name))
+            else:
+                raise TemplateError(f"{origin}: invalid placeholder at offset {match.start()}")
+            pos = match.end()
+        self._pieces.append((False, source[pos:]))
+        self._pieces = [p for p in self._pieces if p[0] or p[1]]
+
+    def render(self, values: dict) -> str:
+        if self.escape:
+            return "".join(html.escape(str(values.get(v, ""))) if is_name else v for is_name, v in self._pieces)
+        return "".join(str(values.get(v, "")) if is_name else v for is_name, v in self._pieces)
+
+
+@dataclass
+class Rendered:
+    subject: str
+    text: str
+    html: str | None
+
+
+@dataclass
+class _Entry:
+    text: CompiledTemplate
+    html: CompiledTemplate | None
+    subject: CompiledTemplate | None
+
+
+def subject_variant(subject: str) -> str:
+    return _SLUG.sub("-", (subject or "").lower()).strip("-")
+
+
+def _read(path: str) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def load_templates(root: str) -> dict[tuple[str, str, str], _Entry]:
+    """Compile every template under root into {(locale, name, variant): entry}"""
+    files: dict[tuple[str, str, str], dict[str, str]] = {}
+    for locale in sorted(os.listdir(root)):
+        locale_dir = os.path.join(root, locale)
+        if not os.path.isdir(locale_dir):
+            continue
+        for filename in os.listdir(locale_dir):
+            stem, ext = os.path.splitext(filename)
+            if ext not in (".txt", ".html"):
+                continue
+            name, _, variant = stem.partition(".")
+            files.setdefault((locale.lower(), name, variant), {})[ext] = os.path.join(locale_dir, filename)
+
+    templates = {}
+    for key, paths in files.items():
+        if ".txt" not in paths:
+            raise TemplateError(f"{paths['.html']}: HTML template without a plain-text version")
+        text_source = _read(paths[".txt"])
+        subject = None
+        match = _SUBJECT_LINE.match(text_source)
+        if match:
+            subject = CompiledTemplate(match.group(1).strip(), paths[".txt"])
+            text_source = text_source[match.end():]
+        templates[key] = _Entry(
+            text=CompiledTemplate(text_source, paths[".txt"]),
+            html=CompiledTemplate(_read(paths[".html"]), paths[".html"], escape=True) if ".html" in paths else None,
+            subject=subject,
+        )
+    return templates
+
+
+def _signature(root: str) -> tuple:
+    """Cheap fingerprint of the template files, to notice edits without re-reading them"""
+    entries = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            st = os.stat(os.path.join(dirpath, filename))
+            entries.append((dirpath, filename, st.st_mtime_ns, st.st_size))
+    return tuple(sorted(entries))
+
+
+class TemplateStore:
+    """Compiled templates for one directory, hot-reloaded when its files change"""
+
+    def __init__(self, root: str = EMAIL_TEMPLATE_DIR, default_locale: str = EMAIL_TEMPLATE_LOCALE,
+                 reload_seconds: float = EMAIL_TEMPLATE_RELOAD_SECONDS):
+        self.root = root
+        self.default_locale = default_locale.lower()
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        self._templates = load_templates(root)
+        self._signature = _signature(root)
+        self._checked_at = time.monotonic()
+        self.loaded_at = time.time()
+
+    def reload(self, force: bool = False) -> bool:
+        """Recompile if the directory changed (or always with force). Returns True if reloaded.
+
+        A template that fails to compile leaves the current set in place.
+        """
+        signature = _signature(self.root)
+        if not force and signature == self._signature:
+            return False
+        try:
+            templates = load_templates(self.root)
+        except Exception as e:
+            metrics.TEMPLATE_RELOADS.labels(result="error").inc()
+            logger.error(f"Keeping current email templates; reload failed: {e}")
+            self._signature = signature   # don't retry until the files change again
+            if force:
+                raise
+            return False
+        with self._lock:
+            self._templates, self._signature = templates, signature
+            self.loaded_at = time.time()
+        metrics.TEMPLATE_RELOADS.labels(result="ok").inc()
+        logger.info(f"Loaded {len(templates)} email template(s) from {self.root}")
+        return True
+
+    def _maybe_reload(self) -> None:
+        if self.reload_seconds <= 0 or time.monotonic() - self._checked_at < self.reload_seconds:
+            return
+        self._checked_at = time.monotonic()
+        try:
+            self.reload()
+        except OSError as e:
+            logger.warning(f"Could not check email templates for changes: {e}")
+
+    def _locales(self, locale: str | None) -> list[str]:
+        candidates = []
+        if locale:
+            locale = locale.lower().replace("_", "-")
+            candidates += [locale, locale.split("-")[0]]
+        candidates.append(self.default_locale)
+        return list(dict.fromkeys(candidates))
+
+    def lookup(self, name: str, locale: str | None = None, subject: str | None = None) -> _Entry:
+        """Most specific template: subject variant before default, requested locale before default locale"""
+        self._maybe_reload()
+        variant = subject_variant(subject) if subject else DEFAULT_VARIANT
+        templates = self._templates
+        for loc in self._locales(locale):
+            for var in dict.fromkeys((variant, DEFAULT_VARIANT)):
+                entry = templates.get((loc, name, var))
+                if entry is not None:
+                    return entry
+        raise TemplateError(f"No email template '{name}' for locale {locale or self.default_locale!r}")
+
+    def render(self, name: str, values: dict, locale: str | None = None) -> Rendered:
+        entry = self.lookup(name, locale, values.get("subject"))
+        return Rendered(
+            subject=entry.subject.render(values) if entry.subject else str(values.get("subject", "")),
+            text=entry.text.render(values),
+            html=entry.html.render(values) if entry.html else None,
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "dir": self.root,
+                "templates": sorted("/".join(filter(None, key)) for key in self._templates),
+                "loaded_at": self.loaded_at,
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_template_store() -> TemplateStore:
+    """Shared store, compiled on first use (the consumer warms it at startup)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TemplateStore()
+        return _store
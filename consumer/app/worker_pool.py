@@ -0,0 +1,152 @@
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from kafka.structs import OffsetAndMetadata, TopicPartition
+
+logger = logging.getLogger(__name__)
+
+
+class OffsetTracker:
+    """Tracks in-flight offsets for one partition.
+
+    Messages may finish out of order, but the committable position only advances
+    past a contiguous run of completed offsets, so a commit never skips a message
+    that is still being processed or that failed.
+    """
+
+    def __init__(self):
+        self._pending = deque()   # offsets in arrival (= offset) order
+        self._done = set()
+        self._failed = set()
+        self.position = None      # next offset to consume, i.e. what Kafka expects in a commit
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending) - len(self._done) - len(self._failed)
+
+    @property
+    def first_failed(self) -> int | None:
+        return min(self._failed) if self._failed else None
+
+    def add(self, offset: int) -> None:
+        self._pending.append(offset)
+
+    def complete(self, offset: int) -> None:
+        self._done.add(offset)
+        while self._pending and self._pending[0] in self._done:
+            head = self._pending.popleft()
+            self._done.discard(head)
+            self.position = head + 1
+
+    def fail(self, offset: int) -> None:
+        """Mark a message as finished but not processed; the position will not move past it."""
+        self._failed.add(offset)
+
+
+class WorkerPool:
+    """Runs a message handler on a fixed pool of threads.
+
+    Each partition may have at most max_in_flight messages being handled at once;
+    submit() blocks the poll loop when that limit is reached, which is the
+    backpressure that keeps a slow SMTP server from piling up fetched records.
+    """
+
+    def __init__(self, handler: Callable, workers: int = 4, max_in_flight: int = 16):
+        self._handler = handler
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="email-worker")
+        self._cond = threading.Condition()
+        self._trackers: dict[TopicPartition, OffsetTracker] = {}
+        self._started: dict[tuple[TopicPartition, int], float] = {}   # monotonic start of each running message
+        self.last_completed_at = None   # wall-clock time the last message finished, either way
+
+    def submit(self, tp: TopicPartition, message, stop: threading.Event | None = None) -> bool:
+        """Hand a message to a worker. Returns False if stop was set while waiting for a slot."""
+        with self._cond:
+            tracker = self._trackers.setdefault(tp, OffsetTracker())
+            while tracker.in_flight >= self.max_in_flight:
+                if stop is not None and stop.is_set():
+                    return False
+                self._cond.wait(timeout=0.5)
+            tracker.add(message.offset)
+            self._started[(tp, message.offset)] = time.monotonic()
+        self._executor.submit(self._run, tp, tracker, message)
+        return True
+
+    def _run(self, tp: TopicPartition, tracker: OffsetTracker, message) -> None:
+        ok = False
+        try:
+            self._handler(message)
+            ok = True
+        except Exception as e:
+            logger.error(f"Error processing message at {tp.topic}[{tp.partition}]@{message.offset}: {e}")
+        finally:
+            with self._cond:
+                self._started.pop((tp, message.offset), None)
+                self.last_completed_at = time.time()
+                # Ignore results for a partition that was forgotten (rewound or revoked) meanwhile
+                if self._trackers.get(tp) is tracker:
+                    if ok:
+                        tracker.complete(message.offset)
+                    else:
+                        tracker.fail(message.offset)
+                self._cond.notify_all()
+
+    def in_flight(self, partitions=None) -> int:
+        with self._cond:
+            return sum(
+                t.in_flight for tp, t in self._trackers.items()
+                if partitions is None or tp in partitions
+            )
+
+    def oldest_in_flight_seconds(self) -> float:
+        """How long the longest-running message has been with a worker (0 if none)"""
+        with self._cond:
+            return time.monotonic() - min(self._started.values()) if self._started else 0.0
+
+    def committable_offsets(self) -> dict[TopicPartition, OffsetAndMetadata]:
+        """Current commit position of every partition that has completed at least one message."""
+        with self._cond:
+            return {
+                tp: OffsetAndMetadata(tracker.position, None)
+                for tp, tracker in self._trackers.items()
+                if tracker.position is not None
+            }
+
+    def failed(self) -> dict[TopicPartition, int]:
+        """Lowest failed offset per partition, for partitions with a failed message."""
+        with self._cond:
+            return {
+                tp: tracker.first_failed
+                for tp, tracker in self._trackers.items()
+                if tracker.first_failed is not None
+            }
+
+    def drain(self, timeout: float | None = None, partitions=None) -> bool:
+        """Wait until nothing is in flight (on the given partitions, or on any).
+
+        Returns False if the timeout expired first.
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: all(
+                    t.in_flight == 0 for tp, t in self._trackers.items()
+                    if partitions is None or tp in partitions
+                ),
+                timeout=timeout,
+            )
+
+    def forget(self, partitions) -> None:
+        """Drop tracking for partitions this consumer no longer owns."""
+        with self._cond:
+            for tp in partitions:
+                self._trackers.pop(tp, None)
+            self._cond.notify_all()
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import time
+from collections import namedtuple
+
+import aiosmtplib
+import pytest
+from aiokafka.structs import TopicPartition
+
+from app import async_consumer, async_email_sender
+from app import main as main_mod
+from app.async_consumer import AsyncConsumerEngine, handle_record
+from app.async_email_sender import AsyncSMTPPool
+from app.commit_manager import CommitStats
+from app.rate_limiter import AdaptiveRateLimiter, SMTPThrottled
+
+Rec = namedtuple("Rec", "offset partition value headers")
+TP = TopicPartition("complaints.v1", 0)
+
+
+class FakeConsumer:
+    """Just enough AIOKafkaConsumer: hands out the given batches, then sets stop"""
+
+    def __init__(self, batches, stop):
+        self._batches = list(batches)
+        self._stop = stop
+        self.commits, self.calls = [], []
+
+    async def getmany(self, timeout_ms=0, max_records=None):
+        await asyncio.sleep(0.01)
+        if self._batches:
+            return self._batches.pop(0)
+        self._stop.set()
+        return {}
+
+    async def commit(self, offsets):
+        self.commits.append(dict(offsets))
+
+    def seek(self, tp, offset): self.calls.append(("seek", tp, offset))
+    def pause(self, *tps): self.calls.append(("pause",) + tps)
+    def resume(self, *tps): self.calls.append(("resume",) + tps)
+    def assignment(self): return {TP}
+    def highwater(self, tp): return 10
+
+    async def committed(self, tp): return None
+    async def position(self, tp): return 0
+
+
+def _run_engine(handler, records, **kwargs):
+    stop = threading.Event()
+    engine = AsyncConsumerEngine(handler=handler, commit_every=1, stats=CommitStats(), **kwargs)
+    engine.consumer = FakeConsumer([{TP: records}, {}], stop)
+    asyncio.run(engine.run(stop))
+    return engine
+
+
+def test_engine_runs_sends_concurrently_and_commits_past_finished_messages():
+    running, peak = 0, 0
+
+    async def handler(record):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+
+    started = time.perf_counter()
+    engine = _run_engine(handler, [Rec(i, 0, b"{}", []) for i in range(200)], concurrency=150, max_in_flight=200)
+    assert time.perf_counter() - started < 2      # 200 x 50 ms would take 10 s one at a time
+    assert peak == 150
+    assert engine.consumer.commits[-1] == {TP: 200}
+    assert engine.in_flight() == 0
+
+
+def test_engine_rewinds_and_pauses_partition_with_a_failed_message(monkeypatch):
+    monkeypatch.setattr(async_consumer, "hold_while_throttled", lambda *a: False)
+
+    async def handler(record):
+        if record.offset == 3:
+            raise RuntimeError("smtp down")
+
+    engine = _run_engine(handler, [Rec(i, 0, b"{}", []) for i in range(6)])
+    calls = engine.consumer.calls
+    assert ("seek", TP, 3) in calls and ("pause", TP) in calls
+    assert TP in engine.paused
+    assert engine.consumer.commits[-1] == {TP: 3}
+
+
+def test_handle_record_routes_failures_and_skips_duplicates(monkeypatch):
+    routed = []
+
+    class FakeRouter:
+        def route(self, message, error, dead_letter=False):
+            routed.append((message.offset, str(error), dead_letter))
+
+    class FakeStore:
+        def begin(self, record_id): return record_id != "dup"
+        def finish(self, record_id, sent): routed.append(("finish", record_id, sent))
+
+    async def failing_send(payload):
+        raise RuntimeError("smtp down")
+
+    monkeypatch.setattr(main_mod, "get_retry_router", lambda: FakeRouter())
+    monkeypatch.setattr(async_consumer, "get_dedup_store", lambda: FakeStore())
+    asyncio.run(handle_record(Rec(7, 0, {"id": "a"}, []), send=failing_send))
+    assert routed == [(7, "smtp down", False), ("finish", "a", False)]
+
+    asyncio.run(handle_record(Rec(8, 0, b"not json", []), send=failing_send))
+    assert routed[-1] == (8, routed[-1][1], True)
+
+    routed.clear()
+    asyncio.run(handle_record(Rec(9, 0, {"id": "dup"}, []), send=failing_send))
+    assert routed == []
+
+    async def throttled_send(payload):
+        raise SMTPThrottled("421 try later", 421)
+
+    with pytest.raises(SMTPThrottled):      # not routed: the engine rewinds the partition instead
+        asyncio.run(handle_record(Rec(10, 0, {"id": "b"}, []), send=throttled_send))
+    assert routed == [("finish", "b", False)]
+
+
+class FakeSMTP:
+    def __init__(self):
+        self.sent, self.fail_with = [], None
+
+    async def sendmail(self, sender, recipients, data):
+        await asyncio.sleep(0.01)
+        if self.fail_with is not None:
+            raise self.fail_with
+        self.sent.append((sender, recipients, data))
+
+    async def noop(self):
+        return aiosmtplib.SMTPResponse(250, "OK")
+
+    async def quit(self): pass
+    def close(self): pass
+
+
+def test_async_pool_reuses_connections_and_reports_throttles():
+    conns = []
+
+    async def factory():
+        conns.append(FakeSMTP())
+        return conns[-1]
+
+    async def scenario():
+        limiter = AdaptiveRateLimiter(rate=1000, burst=100, cooldown=30)
+        pool = AsyncSMTPPool(factory, size=2, limiter=limiter)
+        await asyncio.gather(*(pool.sendmail("a@x", "b@x", b"msg") for _ in range(10)))
+        assert pool.opened == 2
+        assert sum(len(c.sent) for c in conns) == 10
+
+        for conn in conns:
+            conn.fail_with = aiosmtplib.SMTPResponseException(421, "slow down")
+        with pytest.raises(SMTPThrottled) as exc:
+            await pool.sendmail("a@x", "b@x", b"msg")
+        assert exc.value.code == 421
+        assert limiter.blocked_for() > 0
+
+    asyncio.run(scenario())
+
+
+def test_send_email_async_renders_like_the_threaded_sender():
+    smtp = FakeSMTP()
+
+    async def factory():
+        return smtp
+
+    async def scenario():
+        pool = AsyncSMTPPool(factory, size=1)
+        await async_email_sender.send_email_async(
+            to_addr="user@example.com", first_name="Ada", subject="Billing", body="Charged twice",
+            ticket_id="T-1", pool=pool,
+        )
+
+    asyncio.run(scenario())
+    (sender, recipients, data), = smtp.sent
+    assert recipients == ["user@example.com"]
+    assert b"Subject: Billing" in data and b"Content-Transfer-Encoding: base64" in data
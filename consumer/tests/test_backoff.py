@@ -0,0 +1,16 @@
+from app.backoff import Backoff
+
+
+def test_delays_double_up_to_the_cap_with_jitter():
+    low = Backoff(base_ms=100, max_ms=1000, rng=lambda: 0.0)
+    high = Backoff(base_ms=100, max_ms=1000, rng=lambda: 1.0)
+    assert [low.next() for _ in range(6)] == [0.05, 0.1, 0.2, 0.4, 0.5, 0.5]
+    assert [high.next() for _ in range(6)] == [0.1, 0.2, 0.4, 0.8, 1.0, 1.0]
+
+
+def test_reset_starts_over_and_large_attempt_counts_stay_capped():
+    backoff = Backoff(base_ms=200, max_ms=30000, rng=lambda: 1.0)
+    backoff.attempts = 10_000
+    assert backoff.next() == 30.0
+    backoff.reset()
+    assert backoff.next() == 0.2
@@ -0,0 +1,79 @@
+from unittest.mock import MagicMock
+
+import pytest
+from kafka.structs import OffsetAndMetadata, TopicPartition
+
+from app.commit_manager import CommitManager, CommitStats
+
+TP0 = TopicPartition("complaints.v1", 0)
+TP1 = TopicPartition("complaints.v1", 1)
+
+
+class FakePool:
+    def __init__(self):
+        self.positions = {}
+    def committable_offsets(self):
+        return {tp: OffsetAndMetadata(pos, None) for tp, pos in self.positions.items()}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def setup():
+    consumer, pool, clock, stats = MagicMock(), FakePool(), Clock(), CommitStats()
+    manager = CommitManager(consumer, pool, every=10, interval_ms=1000, stats=stats, clock=clock)
+    return manager, consumer, pool, clock, stats
+
+
+def test_nothing_to_commit(setup):
+    manager, consumer, *_ = setup
+    assert manager.maybe_commit() is False
+    assert manager.commit() is False
+    consumer.commit.assert_not_called()
+
+
+def test_commits_after_interval(setup):
+    manager, consumer, pool, clock, stats = setup
+    pool.positions = {TP0: 3}
+    assert manager.maybe_commit() is False
+    clock.now = 1.5
+    assert manager.maybe_commit() is True
+    consumer.commit.assert_called_once_with({TP0: OffsetAndMetadata(3, None)})
+    assert stats.snapshot()["commits"] == 1
+
+
+def test_commits_after_message_count_and_only_changed_partitions(setup):
+    manager, consumer, pool, clock, stats = setup
+    pool.positions = {TP0: 5, TP1: 7}
+    manager.commit()
+    pool.positions = {TP0: 16, TP1: 7}   # 11 more messages on TP0, none on TP1
+    assert manager.maybe_commit() is True
+    consumer.commit.assert_called_with({TP0: OffsetAndMetadata(16, None)})
+    assert stats.snapshot()["messages_committed"] == 2 + 11
+
+
+def test_commit_failure_is_counted_and_retried(setup):
+    manager, consumer, pool, clock, stats = setup
+    pool.positions = {TP0: 4}
+    consumer.commit.side_effect = RuntimeError("rebalance")
+    with pytest.raises(RuntimeError):
+        manager.commit()
+    assert stats.snapshot()["failures"] == 1
+    consumer.commit.side_effect = None
+    assert manager.commit() is True
+
+
+def test_stats_snapshot_latency():
+    stats = CommitStats()
+    stats.record(0.002, 5)
+    stats.record(0.004, 5)
+    snap = stats.snapshot()
+    assert snap["commits"] == 2
+    assert snap["avg_latency_ms"] == 3.0
+    assert snap["max_latency_ms"] == 4.0
+    assert snap["last_latency_ms"] == 4.0
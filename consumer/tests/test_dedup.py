@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.dedup import DedupStore
+from app.models import SentEmail
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    SentEmail.__table__.create(engine)
+    return sessionmaker(bind=engine)
+
+
+def test_sent_ids_are_skipped_and_failed_ones_retried(session_factory):
+    store = DedupStore(session_factory)
+    assert store.begin("a")
+    store.finish("a", sent=True)
+    assert not store.begin("a")
+
+    assert store.begin("b")
+    store.finish("b", sent=False)
+    assert store.begin("b")                     # a failed send may be attempted again
+
+
+def test_id_being_sent_is_not_claimed_twice():
+    store = DedupStore()
+    assert store.begin("a")
+    assert not store.begin("a")
+    store.finish("a", sent=False)
+    assert store.begin("a")
+
+
+def test_sent_ids_survive_a_restart(session_factory):
+    first = DedupStore(session_factory)
+    first.begin("a")
+    first.finish("a", sent=True)
+
+    restarted = DedupStore(session_factory)       # empty cache, same table
+    assert not restarted.begin("a")
+    with session_factory() as db:
+        assert db.execute(text("SELECT status FROM sent_emails WHERE id = 'a'")).scalar() == "sent"
+
+
+def test_cache_is_bounded_and_backed_by_the_table(session_factory):
+    store = DedupStore(session_factory, cache_size=2)
+    for record_id in ("a", "b", "c"):
+        store.begin(record_id)
+        store.finish(record_id, sent=True)
+    assert store.stats()["cached"] == 2
+    assert not store.begin("a")                   # evicted from the LRU, found in the table
+
+
+def test_database_errors_fail_open():
+    def broken():
+        raise RuntimeError("db down")
+
+    store = DedupStore(broken)
+    assert store.begin("a")
+    store.finish("a", sent=True)                  # logged, not raised
+    assert not store.begin("a")                   # still remembered in memory
+
+
+def test_concurrent_duplicates_send_once(session_factory):
+    store = DedupStore(session_factory)
+    claimed = []
+    barrier = threading.Barrier(8)
+
+    def worker():
+        barrier.wait()
+        if store.begin("a"):
+            claimed.append(1)
+            store.finish("a", sent=True)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert claimed == [1]
@@ -1,10 +1,25 @@
 import os
+import re
+import email
 import pytest
 import smtplib
 from unittest import mock
+from email import policy
 from email.message import EmailMessage
 from app import email_sender
 
+
+def _sent_message(smtp) -> EmailMessage:
+    """Parse the last message handed to smtp.sendmail()"""
+    return email.message_from_bytes(smtp.sendmail.call_args[0][2], policy=policy.default)
+
+@pytest.fixture(autouse=True)
+def fresh_pool():
+    # Each test patches smtplib.SMTP, so don't reuse connections across tests
+    email_sender.close_pool()
+    yield
+    email_sender.close_pool()
+
 # Base environment for most tests
 BASE_ENV = {
     "SMTP_EMAIL": "testsender@example.com",
@@ -27,15 +42,15 @@ def test_send_email_basic():
             ticket_id="ABC123"
         )
         mock_smtp.assert_called_with("smtp.gmail.com", 587, timeout=15.0)
-        instance = mock_smtp.return_value.__enter__.return_value
+        instance = mock_smtp.return_value
         instance.starttls.assert_called_once()
         instance.login.assert_called_with("testsender@example.com", "fakepassword")
-        instance.send_message.assert_called_once()
-        sent_msg: EmailMessage = instance.send_message.call_args[0][0]
+        instance.sendmail.assert_called_once()
+        sent_msg = _sent_message(instance)
         assert sent_msg["To"] == "recipient@example.com"
         assert sent_msg["From"] == "testsender@example.com"
         assert sent_msg["Subject"] == "Test Subject"
-        assert "ABC123" in sent_msg.get_content()
+        assert "ABC123" in sent_msg.get_body(("plain",)).get_content()
 
 @mock.patch.dict(os.environ, BASE_ENV, clear=True)
 def test_send_email_with_attachment():
@@ -49,8 +64,8 @@ def test_send_email_with_attachment():
             attachment_name="test.txt",
             attachment_bytes=b"filecontent"
         )
-        instance = mock_smtp.return_value.__enter__.return_value
-        sent_msg: EmailMessage = instance.send_message.call_args[0][0]
+        instance = mock_smtp.return_value
+        sent_msg = _sent_message(instance)
         assert len(sent_msg.get_payload()) > 1  # Multipart
         attachment_part = sent_msg.get_payload()[1]
         assert attachment_part.get_filename() == "test.txt"
@@ -67,7 +82,7 @@ def test_send_email_no_starttls():
                 body="Body",
                 ticket_id="ID999"
             )
-            instance = mock_smtp.return_value.__enter__.return_value
+            instance = mock_smtp.return_value
             instance.starttls.assert_not_called()
 
 @mock.patch.dict(os.environ, BASE_ENV, clear=True)
@@ -81,7 +96,7 @@ def test_send_email_without_auth():
                 body="Body",
                 ticket_id="ID000"
             )
-            instance = mock_smtp.return_value.__enter__.return_value
+            instance = mock_smtp.return_value
             # Should not call login if username or password is blank
             try:
                 instance.login.assert_not_called()
@@ -99,4 +114,183 @@ def test_send_email_exception_logged_and_raised():
                 subject="Boom",
                 body="This will fail",
                 ticket_id="FAIL01"
-            )
\ No newline at end of file
+            )
+
+
+def _send(n=1):
+    for i in range(n):
+        email_sender.send_email(
+            to_addr="recipient@example.com",
+            first_name="Pool",
+            subject=f"Pooled {i}",
+            body="Body",
+            ticket_id=f"P{i}"
+        )
+
+
+def test_pool_reuses_connection_across_sends():
+    with mock.patch("smtplib.SMTP") as mock_smtp:
+        _send(3)
+        assert mock_smtp.call_count == 1
+        assert mock_smtp.return_value.sendmail.call_count == 3
+
+
+def test_pool_reconnects_after_server_disconnect():
+    first, second = mock.MagicMock(), mock.MagicMock()
+    with mock.patch("smtplib.SMTP", side_effect=[first, second]):
+        _send(1)
+        first.sendmail.side_effect = smtplib.SMTPServerDisconnected("gone")
+        _send(1)
+    assert second.sendmail.call_count == 1
+
+
+def test_pool_recycles_after_max_messages():
+    pool = email_sender.SMTPConnectionPool(mock.MagicMock, size=1, max_messages=2)
+    for _ in range(5):
+        pool.send_message(EmailMessage())
+    assert pool.opened == 3
+
+
+def test_pool_evicts_idle_and_checks_keepalive():
+    conns = []
+    def factory():
+        conns.append(mock.MagicMock())
+        conns[-1].noop.return_value = (250, b"OK")
+        return conns[-1]
+    pool = email_sender.SMTPConnectionPool(factory, size=1, idle_timeout=60, keepalive_after=10)
+    pool.send_message(EmailMessage())
+    pool._idle[0].last_used -= 20  # idle past keepalive_after: probed with NOOP, still alive
+    pool.send_message(EmailMessage())
+    assert pool.opened == 1
+    conns[0].noop.assert_called_once()
+    pool._idle[0].last_used -= 120  # idle past idle_timeout: evicted
+    pool.evict_idle()
+    assert pool.stats()["idle"] == 0
+    conns[0].quit.assert_called_once()
+
+
+def test_pool_discards_connection_after_send_error():
+    pool = email_sender.SMTPConnectionPool(mock.MagicMock, size=1)
+    with mock.patch.object(pool, "_connect", wraps=pool._connect) as connect:
+        pool.send_message(EmailMessage())
+        pool._idle[0].smtp.send_message.side_effect = smtplib.SMTPRecipientsRefused({})
+        with pytest.raises(smtplib.SMTPRecipientsRefused):
+            pool.send_message(EmailMessage())
+        pool.send_message(EmailMessage())
+        assert connect.call_count == 2
+
+
+class _RecordingSMTP:
+    """Just the smtplib.SMTP calls a streamed send makes, with the DATA bytes kept"""
+
+    def __init__(self):
+        self.data = b""
+        self.envelope = None
+
+    def ehlo_or_helo_if_needed(self): pass
+    def mail(self, sender): self.envelope = [sender]; return 250, b"ok"
+    def rcpt(self, to): self.envelope.append(to); return 250, b"ok"
+    def docmd(self, cmd): return 354, b"go ahead"
+    def send(self, data): self.data += data
+    def getreply(self): return 250, b"queued"
+    def noop(self): return 250, b"ok"
+    def quit(self): pass
+
+
+def test_send_email_streams_blob_attachment(tmp_path):
+    blob = tmp_path / "blob"
+    content = os.urandom(200_000)
+    blob.write_bytes(content)
+    smtp = _RecordingSMTP()
+    with mock.patch.object(email_sender, "_pool", email_sender.SMTPConnectionPool(lambda: smtp)):
+        email_sender.send_email(
+            to_addr="recipient@example.com",
+            first_name="Ada",
+            subject="Report",
+            body=".leading dot survives",
+            ticket_id="T-1",
+            attachment_name="report.pdf",
+            attachment_path=str(blob),
+            attachment_content_type="application/pdf",
+        )
+
+    assert smtp.envelope == [email_sender.FROM_ADDR, "recipient@example.com"]
+    assert smtp.data.endswith(b"\r\n.\r\n")
+    raw = smtp.data[:-len(b".\r\n")].replace(b"\r\n..", b"\r\n.")
+    msg = email.message_from_bytes(raw, policy=policy.default)
+    text, attachment = msg.get_body(("plain",)), next(msg.iter_attachments())
+    assert ".leading dot survives" in text.get_content()
+    assert attachment.get_filename() == "report.pdf"
+    assert attachment.get_content_type() == "application/pdf"
+    assert attachment.get_content() == content
+
+
+def test_send_email_missing_blob_fails_before_data(tmp_path):
+    smtp = _RecordingSMTP()
+    with mock.patch.object(email_sender, "_pool", email_sender.SMTPConnectionPool(lambda: smtp)):
+        with pytest.raises(FileNotFoundError):
+            email_sender.send_email(
+                to_addr="recipient@example.com", first_name="Ada", subject="s", body="b", ticket_id="T-2",
+                attachment_name="gone.pdf", attachment_path=str(tmp_path / "missing"),
+            )
+    assert smtp.envelope is None
+
+
+def test_send_email_renders_text_and_html_alternatives():
+    smtp = mock.MagicMock()
+    with mock.patch.object(email_sender, "_pool", email_sender.SMTPConnectionPool(lambda: smtp)):
+        email_sender.send_email(
+            to_addr="recipient@example.com", first_name="Zoë", subject="Café <crème>", body="a\nb", ticket_id="T-3",
+        )
+    msg = _sent_message(smtp)
+    assert msg["Subject"] == "Café <crème>"
+    assert msg["Message-ID"] and msg["Date"]
+    assert msg.get_content_type() == "multipart/alternative"
+    assert "Hello Zoë," in msg.get_body(("plain",)).get_content()
+    assert "Café &lt;crème&gt;" in msg.get_body(("html",)).get_content()
+
+
+def test_long_non_ascii_headers_fold_with_crlf():
+    subject = "Réclamation " * 20
+    smtp = mock.MagicMock()
+    with mock.patch.object(email_sender, "_pool", email_sender.SMTPConnectionPool(lambda: smtp)):
+        email_sender.send_email(
+            to_addr="recipient@example.com", first_name="Zoë", subject=subject, body="b", ticket_id="T-5",
+        )
+    data = smtp.sendmail.call_args[0][2]
+    assert b"\r\n " in data.split(b"\r\n\r\n")[0]        # the subject was folded
+    assert re.search(rb"(?<!\r)\n", data) is None
+    assert _sent_message(smtp)["Subject"] == subject
+
+
+def test_send_email_fills_in_last_name(tmp_path):
+    from app.templating import TemplateStore
+    (tmp_path / "en").mkdir()
+    (tmp_path / "en" / "ack.txt").write_text("Dear $first_name ${last_name},\n", encoding="utf-8")
+    smtp = mock.MagicMock()
+    with mock.patch.object(email_sender, "_pool", email_sender.SMTPConnectionPool(lambda: smtp)), \
+         mock.patch.object(email_sender, "get_template_store", lambda: TemplateStore(str(tmp_path))):
+        email_sender.send_email(
+            to_addr="recipient@example.com", first_name="Ada", last_name="Lovelace", subject="Hi", body="b",
+            ticket_id="T-4",
+        )
+    assert _sent_message(smtp).get_content() == "Dear Ada Lovelace,\n"
+
+
+def test_pool_reports_throttle_replies_to_the_rate_limiter():
+    from app.rate_limiter import AdaptiveRateLimiter, SMTPThrottled
+
+    limiter = AdaptiveRateLimiter(rate=100, burst=10, cooldown=30)
+    pool = email_sender.SMTPConnectionPool(mock.MagicMock, size=1, limiter=limiter)
+    pool.send_message(EmailMessage())
+    pool._idle[0].smtp.send_message.side_effect = smtplib.SMTPDataError(421, b"slow down")
+    with pytest.raises(SMTPThrottled) as exc:
+        pool.send_message(EmailMessage())
+    assert exc.value.code == 421
+    assert limiter.rate == 50
+    assert limiter.blocked_for() > 0
+
+    # While blocked, no connection is used and the caller gets SMTPThrottled once the wait runs out
+    with mock.patch.object(limiter, "acquire", return_value=False):
+        with pytest.raises(SMTPThrottled):
+            pool.send_message(EmailMessage())
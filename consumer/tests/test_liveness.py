@@ -0,0 +1,105 @@
+from kafka.structs import TopicPartition
+
+from app import metrics
+from app.liveness import LivenessStats, partition_offsets
+
+TP0, TP1 = TopicPartition("complaints.v1", 0), TopicPartition("complaints.v1", 1)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeConsumer:
+    def __init__(self, highwater, committed, position, end_offsets=None):
+        self._highwater, self._committed, self._position = highwater, committed, position
+        self._end_offsets = end_offsets or {}
+        self.end_offset_requests = []
+
+    def assignment(self):
+        return set(self._position)
+
+    def highwater(self, tp):
+        return self._highwater.get(tp)
+
+    def end_offsets(self, partitions):
+        self.end_offset_requests.append(sorted(partitions))
+        return {tp: self._end_offsets[tp] for tp in partitions}
+
+    def committed(self, tp):
+        return self._committed.get(tp)
+
+    def position(self, tp):
+        return self._position[tp]
+
+
+def test_partition_offsets_uses_committed_offset_and_log_end():
+    consumer = FakeConsumer(
+        highwater={TP0: 120}, committed={TP0: 100}, position={TP0: 115, TP1: 30}, end_offsets={TP1: 50},
+    )
+    assert partition_offsets(consumer) == {TP0: (100, 120), TP1: (30, 50)}
+    # Only the partition without a fetched high watermark costs a broker request
+    assert consumer.end_offset_requests == [[TP1]]
+
+
+def test_record_progress_sets_partition_gauges_and_total_lag():
+    stats = LivenessStats(clock=FakeClock())
+    stats.start()
+    stats.record_progress({TP0: (100, 120), TP1: (50, 50)}, in_flight=2, oldest_in_flight=1.5, last_processed_at=999.0)
+
+    snap = stats.snapshot()
+    assert snap["total_lag"] == 20
+    assert snap["partitions"][0] == {"topic": "complaints.v1", "partition": 0, "committed": 100, "log_end": 120, "lag": 20}
+    assert snap["in_flight"] == 2
+    assert snap["oldest_in_flight_seconds"] == 1.5
+    assert snap["seconds_since_last_message"] == 1.0
+    text = metrics.render()[0].decode()
+    assert 'consumer_partition_committed_lag{partition="0",topic="complaints.v1"} 20.0' in text
+    assert 'consumer_partition_log_end_offset{partition="1",topic="complaints.v1"} 50.0' in text
+    assert "consumer_lag_messages 20.0" in text
+
+
+def test_problems_flip_on_thresholds():
+    clock = FakeClock()
+    stats = LivenessStats(clock=clock)
+    assert stats.problems(max_poll_gap=1) == []       # not started: time checks are off
+    stats.start()
+    stats.record_poll()
+    stats.record_progress({TP0: (100, 100)}, in_flight=0, oldest_in_flight=0, last_processed_at=None)
+    clock.now += 400
+    stats.record_poll()
+    assert stats.problems() == []                     # idle, but nothing waiting
+
+    stats.record_progress({TP0: (100, 20100)}, in_flight=1, oldest_in_flight=200, last_processed_at=None)
+    problems = stats.problems(max_lag=10000, max_idle=300, max_in_flight_age=120, max_poll_gap=60)
+    assert problems == [
+        "lag 20000 > 10000",
+        "no message finished for 400s with work waiting",
+        "a message has been in flight for 200s",
+    ]
+    clock.now += 61
+    assert stats.problems(max_lag=0, max_idle=0, max_in_flight_age=0) == ["poll loop idle for 61s"]
+
+    stats.reset()
+    assert stats.problems() == []
+
+
+def test_held_partitions_do_not_count_as_work_waiting():
+    clock = FakeClock()
+    stats = LivenessStats(clock=clock)
+    stats.start()
+    # A quiet consumer whose only backlog is a retry paused until it is due
+    stats.record_progress({TP0: (100, 100), TP1: (7, 8)}, in_flight=0, oldest_in_flight=0,
+                          last_processed_at=None, held={TP1})
+    clock.now += 400
+    stats.record_poll()
+    assert stats.problems(max_idle=300) == []
+    assert stats.snapshot()["total_lag"] == 1
+
+    stats.record_progress({TP0: (100, 101), TP1: (7, 8)}, in_flight=0, oldest_in_flight=0,
+                          last_processed_at=None, held={TP1})
+    assert stats.problems(max_idle=300) == ["no message finished for 400s with work waiting"]
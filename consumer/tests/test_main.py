@@ -15,6 +15,7 @@ client = TestClient(app)
 
 import logging
 import threading
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -30,7 +31,15 @@ def test_health_and_root_endpoints():
     assert response.status_code == 200
     assert response.json() == {"message": "Complaints Consumer Service is running"}
 
-def test_ready_and_consumer_health():
+@pytest.fixture
+def joined_group():
+    from app.rebalance import rebalance_stats
+    rebalance_stats.record_joining()
+    rebalance_stats.record_assigned([])
+    yield rebalance_stats
+    rebalance_stats.record_left()
+
+def test_ready_and_consumer_health(joined_group):
     set_consumer_running(True)
     response = client.get("/health/consumer")
     data = response.json()
@@ -43,6 +52,56 @@ def test_ready_and_consumer_health():
     assert data["status"] == "unhealthy"
     assert data["consumer_running"] is False
 
+def test_ready_returns_503_past_liveness_thresholds(monkeypatch, joined_group):
+    from app import main as main_mod
+
+    set_consumer_running(True)
+    monkeypatch.setattr(main_mod.liveness_stats, "problems", lambda: [])
+    assert client.get("/ready").status_code == 200
+
+    monkeypatch.setattr(main_mod.liveness_stats, "problems", lambda: ["lag 20000 > 10000"])
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["problems"] == ["lag 20000 > 10000"]
+    assert client.get("/health/consumer").json()["status"] == "unhealthy"
+    assert "consumer_ready 0.0" in client.get("/metrics").text
+
+    set_consumer_running(False)
+    assert client.get("/ready").json()["problems"] == ["consumer not running"]
+
+def test_ready_waits_for_partition_assignment(monkeypatch):
+    from app import main as main_mod
+    from app.rebalance import rebalance_stats
+    from kafka.structs import TopicPartition
+
+    monkeypatch.setattr(main_mod.liveness_stats, "problems", lambda: [])
+    set_consumer_running(True)
+    rebalance_stats.record_joining()
+    try:
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["problems"] == ["waiting for partition assignment"]
+
+        rebalance_stats.record_assigned([TopicPartition("complaints.v1", 0)])
+        assert client.get("/ready").status_code == 200
+        assert "consumer_group_join_seconds" in client.get("/metrics").text
+    finally:
+        rebalance_stats.record_left()
+        set_consumer_running(False)
+    assert rebalance_stats.snapshot()["assigned_partitions"] == []
+
+def test_startup_does_not_wait_for_kafka(monkeypatch):
+    from app import main as main_mod
+
+    started = []
+    monkeypatch.setattr(main_mod, "CONSUMER_MODE", "threaded")
+    monkeypatch.setattr(main_mod, "start_kafka_consumer", lambda: started.append(time.monotonic()))
+    begin = time.monotonic()
+    with TestClient(app) as test_client:
+        assert test_client.get("/health").status_code == 200
+        assert time.monotonic() - begin < 2
+    assert started
+
 def test_set_get_consumer_running_toggle():
     set_consumer_running(True)
     assert get_consumer_running() is True
@@ -182,11 +241,21 @@ def test_start_consumer_with_dummy_handler(monkeypatch):
         handled.append(msg)
     # Fake consumer yields one message with .value
     class FakeMsg:
+        topic, partition, offset = "complaints.v1", 0, 41
         value = {"foo": "bar"}
+    committed = []
     class FakeConsumer:
         def __iter__(self):
             yield FakeMsg()
-    monkeypatch.setattr(main_mod, "create_consumer", lambda *a, **kw: FakeConsumer())
+        def commit(self, offsets):
+            committed.append(offsets)
+        def assignment(self):
+            return set()
+        def close(self):
+            pass
+    consumers = iter([FakeConsumer()])
+    # The second connection attempt fails, so the loop backs off into the patched sleep below
+    monkeypatch.setattr(main_mod, "create_consumer", lambda *a, **kw: next(consumers))
     monkeypatch.setattr(main_mod, "wait_for_kafka", lambda *a, **kw: True)
     import time
     orig_sleep = time.sleep
@@ -197,4 +266,272 @@ def test_start_consumer_with_dummy_handler(monkeypatch):
         main_mod.start_consumer(dummy_handler)
     except Exception as e:
         assert str(e) == "break"
-    assert handled and handled[0].value == {"foo": "bar"}
\ No newline at end of file
+    assert handled == [{"foo": "bar"}]
+    # create_consumer turns auto-commit off, so the loop commits what it handled
+    from kafka.structs import OffsetAndMetadata, TopicPartition
+    assert committed == [{TopicPartition("complaints.v1", 0): OffsetAndMetadata(42, None)}]
+
+def test_run_loop_dispatches_to_pool_and_commits(monkeypatch):
+    from collections import namedtuple
+    from kafka.structs import TopicPartition
+    from app import main as main_mod
+
+    Rec = namedtuple("Rec", "offset partition value")
+    tp = TopicPartition("complaints.v1", 0)
+    committed = []
+
+    class FakeConsumer:
+        def __init__(self):
+            self.batches = [{tp: [Rec(0, 0, {"id": "a"}), Rec(1, 0, None), Rec(2, 0, {"id": "c"})]}]
+        def poll(self, timeout_ms=0):
+            if self.batches:
+                return self.batches.pop(0)
+            time.sleep(0.05)
+            return {}
+        def commit(self, offsets):
+            committed.append(offsets)
+        def assignment(self): return {tp}
+        def close(self, autocommit=True): pass
+
+    handled = []
+    monkeypatch.setattr(main_mod, "create_consumer", lambda *a, **kw: FakeConsumer())
+    monkeypatch.setattr(main_mod, "wait_for_kafka", lambda *a, **kw: True)
+    monkeypatch.setattr(main_mod, "process_complaint_message", lambda value: handled.append(value["id"]))
+    monkeypatch.setattr(main_mod, "get_dedup_store", lambda: None)
+
+    t = main_mod.start_kafka_consumer()
+    deadline = time.time() + 3
+    while time.time() < deadline and len(handled) < 2:
+        time.sleep(0.02)
+    main_mod.consumer_stop.set()
+    t.join(timeout=3)
+
+    assert sorted(handled) == ["a", "c"]
+    assert committed[-1][tp].offset == 3
+    assert not t.is_alive()
+
+
+def test_run_loop_rewinds_failed_message(monkeypatch):
+    from collections import namedtuple
+    from kafka.structs import TopicPartition
+    from app import main as main_mod
+
+    Rec = namedtuple("Rec", "offset partition value")
+    tp = TopicPartition("complaints.v1", 0)
+    committed, seeks = [], []
+
+    class FakeConsumer:
+        def __init__(self):
+            self.position = 0
+            self.log = [Rec(0, 0, {"id": "a"}), Rec(1, 0, {"id": "b"}), Rec(2, 0, {"id": "c"})]
+            self.is_paused = False
+        def poll(self, timeout_ms=0):
+            time.sleep(0.02)
+            if self.is_paused or self.position >= len(self.log):
+                return {}
+            batch, self.position = self.log[self.position:], len(self.log)
+            return {tp: batch}
+        def seek(self, partition, offset):
+            seeks.append(offset)
+            self.position = offset
+        def pause(self, *parts): self.is_paused = True
+        def resume(self, *parts): self.is_paused = False
+        def commit(self, offsets): committed.append(offsets[tp].offset)
+        def assignment(self): return {tp}
+        def close(self, autocommit=True): pass
+
+    attempts = {"b": 0}
+    handled = []
+    def process(value):
+        if value["id"] == "b" and attempts["b"] == 0:
+            attempts["b"] += 1
+            raise RuntimeError("smtp down")
+        handled.append(value["id"])
+
+    monkeypatch.setattr(main_mod, "create_consumer", lambda *a, **kw: FakeConsumer())
+    monkeypatch.setattr(main_mod, "wait_for_kafka", lambda *a, **kw: True)
+    monkeypatch.setattr(main_mod, "process_complaint_message", process)
+    monkeypatch.setattr(main_mod, "CONSUMER_RETRY_BACKOFF_MS", 50)
+    # Without retry topics (or when publishing to them fails) the partition is rewound instead
+    monkeypatch.setattr(main_mod, "get_retry_router", lambda: None)
+    monkeypatch.setattr(main_mod, "get_dedup_store", lambda: None)
+
+    t = main_mod.start_kafka_consumer()
+    deadline = time.time() + 5
+    while time.time() < deadline and handled.count("b") < 1:
+        time.sleep(0.02)
+    time.sleep(0.1)
+    main_mod.consumer_stop.set()
+    t.join(timeout=3)
+
+    assert seeks == [1]
+    assert committed[0] == 1          # never past the failed message
+    assert committed[-1] == 3
+    assert handled.count("c") == 2    # redelivered after the rewind
+
+
+def test_handle_message_routes_failure_to_retry_topic(monkeypatch):
+    from collections import namedtuple
+    from app import main as main_mod
+
+    Rec = namedtuple("Rec", "offset partition value")
+    routed = []
+
+    class FakeRouter:
+        def route(self, message, error, dead_letter=False):
+            routed.append((message.offset, str(error), dead_letter))
+
+    def process(value):
+        raise RuntimeError("smtp down")
+
+    monkeypatch.setattr(main_mod, "process_complaint_message", process)
+    monkeypatch.setattr(main_mod, "get_retry_router", lambda: FakeRouter())
+    monkeypatch.setattr(main_mod, "get_dedup_store", lambda: None)
+    main_mod.handle_message(Rec(7, 0, {"id": "a"}))    # does not raise: the message is parked
+    assert routed == [(7, "smtp down", False)]
+
+    main_mod.handle_message(Rec(8, 0, b"not json"))    # undecodable: straight to the DLQ
+    assert routed[-1][0] == 8 and routed[-1][2] is True
+
+
+def test_handle_message_rewinds_throttled_send_instead_of_routing(monkeypatch):
+    from collections import namedtuple
+    from app import main as main_mod
+    from app.rate_limiter import SMTPThrottled
+
+    Rec = namedtuple("Rec", "offset partition value")
+    routed = []
+
+    class FakeRouter:
+        def route(self, message, error, dead_letter=False):
+            routed.append(message.offset)
+
+    def process(value):
+        raise SMTPThrottled("421 try again later", 421)
+
+    monkeypatch.setattr(main_mod, "process_complaint_message", process)
+    monkeypatch.setattr(main_mod, "get_retry_router", lambda: FakeRouter())
+    monkeypatch.setattr(main_mod, "get_dedup_store", lambda: None)
+    with pytest.raises(SMTPThrottled):    # fails the message in the pool, so its partition is rewound
+        main_mod.handle_message(Rec(7, 0, {"id": "a"}))
+    assert routed == []
+
+
+def test_hold_while_throttled_pauses_partition(monkeypatch):
+    from collections import namedtuple
+    from kafka.structs import TopicPartition
+    from app import main as main_mod
+    from app.rate_limiter import AdaptiveRateLimiter
+
+    Rec = namedtuple("Rec", "offset partition value")
+    tp = TopicPartition("complaints.v1", 0)
+    calls = []
+
+    class FakeConsumer:
+        def seek(self, partition, offset): calls.append(("seek", offset))
+        def pause(self, *parts): calls.append(("pause",))
+
+    limiter = AdaptiveRateLimiter(cooldown=30)
+    monkeypatch.setattr(main_mod, "smtp_limiter", limiter)
+    paused = {}
+    assert not main_mod.hold_while_throttled(FakeConsumer(), tp, Rec(4, 0, {}), paused)
+    limiter.record_throttle(421)
+    assert main_mod.hold_while_throttled(FakeConsumer(), tp, Rec(5, 0, {}), paused)
+    assert calls == [("seek", 5), ("pause",)]
+    assert 25 < paused[tp] - time.monotonic() <= 30
+
+
+def test_hold_until_due_pauses_retry_partition():
+    from collections import namedtuple
+    from kafka.structs import TopicPartition
+    from app import main as main_mod
+
+    Rec = namedtuple("Rec", "offset partition value headers")
+    tp = TopicPartition("complaints.v1.retry.1m", 0)
+    calls = []
+
+    class FakeConsumer:
+        def seek(self, partition, offset): calls.append(("seek", offset))
+        def pause(self, *parts): calls.append(("pause",))
+
+    paused = {}
+    future = str(int((time.time() + 60) * 1000)).encode()
+    past = str(int((time.time() - 1) * 1000)).encode()
+
+    assert not main_mod.hold_until_due(FakeConsumer(), tp, Rec(1, 0, {}, []), paused)
+    assert not main_mod.hold_until_due(FakeConsumer(), tp, Rec(2, 0, {}, [("x-retry-at", past)]), paused)
+    assert main_mod.hold_until_due(FakeConsumer(), tp, Rec(3, 0, {}, [("x-retry-at", future)]), paused)
+    assert calls == [("seek", 3), ("pause",)]
+    assert 55 < paused[tp] - time.monotonic() <= 60
+
+
+def test_dlq_replay_endpoint(monkeypatch):
+    from app import main as main_mod
+
+    class FakeRouter:
+        dlq, topic = "complaints.v1.dlq", "complaints.v1"
+        def replay_dlq(self, group_id, max_messages):
+            return min(max_messages, 3)
+
+    monkeypatch.setattr(main_mod, "get_retry_router", lambda: FakeRouter())
+    resp = client.post("/dlq/replay", json={"max_messages": 10})
+    assert resp.status_code == 200
+    assert resp.json()["replayed"] == 3
+
+    monkeypatch.setattr(main_mod, "get_retry_router", lambda: None)
+    assert client.post("/dlq/replay", json={}).status_code == 409
+
+
+def test_metrics_endpoint_counts_handled_messages(monkeypatch):
+    from collections import namedtuple
+    from app import main as main_mod
+
+    Rec = namedtuple("Rec", "offset partition value")
+    sent = []
+    monkeypatch.setattr("app.email_sender.send_email", lambda **kw: sent.append(kw))
+    monkeypatch.setattr(main_mod, "get_dedup_store", lambda: None)
+
+    main_mod.handle_message(Rec(0, 0, {"id": "m1", "email_id": "a@example.com", "submitted_at": time.time() - 2}))
+    assert len(sent) == 1
+
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert 'consumer_messages_total{result="processed"}' in resp.text
+    assert "consumer_end_to_end_lag_seconds_count" in resp.text
+    assert "consumer_smtp_send_seconds_bucket" in resp.text
+
+
+def test_handle_message_skips_already_sent_ids(monkeypatch):
+    from collections import namedtuple
+    from app import main as main_mod
+    from app.dedup import DedupStore
+
+    Rec = namedtuple("Rec", "offset partition value")
+    sent = []
+    store = DedupStore()
+    monkeypatch.setattr("app.email_sender.send_email", lambda **kw: sent.append(kw["ticket_id"]))
+    monkeypatch.setattr(main_mod, "get_dedup_store", lambda: store)
+
+    for offset in range(3):
+        main_mod.handle_message(Rec(offset, 0, {"id": "dup-1", "email_id": "a@example.com"}))
+    main_mod.handle_message(Rec(3, 0, {"id": "dup-2", "email_id": "a@example.com"}))
+    assert sent == ["dup-1", "dup-2"]
+    assert 'consumer_messages_total{result="duplicate"}' in client.get("/metrics").text
+
+
+def test_process_complaint_message_resolves_blob_reference(monkeypatch):
+    from app import main as main_mod
+    from app.blob_store import blob_path
+
+    ref = "sha256:" + "ab" * 32
+    called = {}
+    monkeypatch.setattr("app.email_sender.send_email", lambda **kw: called.update(kw))
+    main_mod.process_complaint_message({
+        "id": "r1", "email_id": "a@example.com", "last_name": "Byron", "subject": "S", "body": "B",
+        "attachment": {"ref": ref, "name": "report.pdf", "size": 10, "content_type": "application/pdf"},
+    })
+    assert called["attachment_path"] == blob_path(ref)
+    assert called["attachment_name"] == "report.pdf"
+    assert called["attachment_content_type"] == "application/pdf"
+    assert called["attachment_bytes"] is None
+    assert called["last_name"] == "Byron"
@@ -0,0 +1,39 @@
+from kafka.structs import TopicPartition
+
+from app import metrics
+
+
+class FakeConsumer:
+    def __init__(self, highwater, position):
+        self._highwater = highwater
+        self._position = position
+
+    def assignment(self):
+        return set(self._position)
+
+    def highwater(self, tp):
+        return self._highwater.get(tp)
+
+    def position(self, tp):
+        return self._position[tp]
+
+
+def test_record_partition_lag_sets_gauge_per_partition():
+    tp0, tp1, tp2 = (TopicPartition("complaints.v1", p) for p in range(3))
+    consumer = FakeConsumer({tp0: 120, tp1: 40}, {tp0: 100, tp1: 40, tp2: 7})
+
+    lags = metrics.record_partition_lag(consumer)
+
+    assert lags == {tp0: 20, tp1: 0}      # tp2 has no high watermark yet
+    text = metrics.render()[0].decode()
+    assert 'consumer_partition_lag{partition="0",topic="complaints.v1"} 20.0' in text
+    assert 'partition="2"' not in text
+
+
+def test_record_partition_lag_drops_revoked_partitions():
+    tp0, tp1 = TopicPartition("complaints.v1", 0), TopicPartition("complaints.v1", 1)
+    metrics.record_partition_lag(FakeConsumer({tp0: 5, tp1: 5}, {tp0: 1, tp1: 1}))
+    metrics.record_partition_lag(FakeConsumer({tp1: 5}, {tp1: 2}))
+    text = metrics.render()[0].decode()
+    assert 'partition="0"' not in text
+    assert 'consumer_partition_lag{partition="1",topic="complaints.v1"} 3.0' in text
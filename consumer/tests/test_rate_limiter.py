@@ -0,0 +1,89 @@
+import smtplib
+
+import pytest
+
+from app.rate_limiter import AdaptiveRateLimiter, throttle_code
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _limiter(clock, **kwargs):
+    defaults = dict(rate=10, burst=2, min_rate=0.5, backoff=0.5, cooldown=30, max_cooldown=120,
+                    recovery_step=1, clock=clock)
+    defaults.update(kwargs)
+    return AdaptiveRateLimiter(**defaults)
+
+
+def test_acquire_spends_burst_then_paces_at_rate():
+    clock = FakeClock()
+    limiter = _limiter(clock)
+    assert limiter.acquire(timeout=0)
+    assert limiter.acquire(timeout=0)
+    assert not limiter.acquire(timeout=0)    # bucket empty
+    clock.now += 0.1                         # one token at 10/s
+    assert limiter.acquire(timeout=0)
+    assert not limiter.acquire(timeout=0)
+
+
+def test_throttle_halves_rate_and_blocks_for_cooldown():
+    clock = FakeClock()
+    limiter = _limiter(clock)
+    limiter.record_throttle(421)
+    assert limiter.rate == 5
+    assert limiter.blocked_for() == 30
+    clock.now += 29
+    assert not limiter.acquire(timeout=0)
+    clock.now += 1.2
+    assert limiter.acquire(timeout=0)
+    assert limiter.state()["throttles"] == 1
+
+
+def test_cooldown_doubles_on_consecutive_throttles_and_resets_after_success():
+    clock = FakeClock()
+    limiter = _limiter(clock)
+    limiter.record_throttle(421)
+    limiter.record_throttle(450)    # same episode: no extra cooldown
+    assert limiter.blocked_for() == 30
+    clock.now += 30
+    limiter.record_throttle(421)
+    assert limiter.blocked_for() == 60
+    clock.now += 60
+    limiter.record_throttle(421)
+    assert limiter.blocked_for() == 120
+    clock.now += 120
+    limiter.record_throttle(421)
+    assert limiter.blocked_for() == 120     # capped at max_cooldown
+    assert limiter.rate == 0.5              # never below min_rate
+
+    clock.now += 120
+    limiter.record_success()
+    limiter.record_throttle(421)
+    assert limiter.blocked_for() == 30
+
+
+def test_success_recovers_rate_up_to_maximum():
+    clock = FakeClock()
+    limiter = _limiter(clock)
+    limiter.record_throttle(421)
+    for _ in range(3):
+        limiter.record_success()
+    assert limiter.rate == 8
+    for _ in range(10):
+        limiter.record_success()
+    assert limiter.rate == 10
+    assert limiter.state()["send_rate"] == pytest.approx(13 / 10)
+
+
+def test_throttle_code_recognises_throttle_replies():
+    assert throttle_code(smtplib.SMTPSenderRefused(421, b"try later", "a@x")) == 421
+    assert throttle_code(smtplib.SMTPDataError(450, b"rate limited")) == 450
+    assert throttle_code(smtplib.SMTPRecipientsRefused({"a@x": (452, b"too many recipients")})) == 452
+    assert throttle_code(smtplib.SMTPRecipientsRefused({"a@x": (550, b"no such user")})) is None
+    assert throttle_code(smtplib.SMTPDataError(554, b"rejected")) is None
+    assert throttle_code(RuntimeError("boom")) is None
@@ -0,0 +1,81 @@
+import threading
+from collections import namedtuple
+from unittest.mock import MagicMock
+
+from kafka.structs import TopicPartition
+
+from app.commit_manager import CommitManager, CommitStats
+from app.rebalance import RebalanceListener, RebalanceStats
+from app.worker_pool import WorkerPool
+
+Msg = namedtuple("Msg", "offset value")
+TP0 = TopicPartition("complaints.v1", 0)
+TP1 = TopicPartition("complaints.v1", 1)
+
+
+def make_listener(handler, drain_timeout_ms=2000):
+    pool = WorkerPool(handler, workers=2, max_in_flight=10)
+    consumer = MagicMock()
+    paused = {TP0: 0.0}
+    stats = RebalanceStats()
+    listener = RebalanceListener(pool, paused, drain_timeout_ms=drain_timeout_ms, stats=stats)
+    listener.commits = CommitManager(consumer, pool, every=1000, interval_ms=60000, stats=CommitStats())
+    return listener, pool, consumer, paused, stats
+
+
+def test_revoke_waits_for_in_flight_work_and_commits_it():
+    release = threading.Event()
+    listener, pool, consumer, paused, stats = make_listener(lambda m: release.wait(2))
+    listener.on_partitions_assigned({TP0, TP1})
+    pool.submit(TP0, Msg(5, {}))
+    pool.submit(TP0, Msg(6, {}))
+
+    threading.Timer(0.1, release.set).start()
+    listener.on_partitions_revoked({TP0})
+
+    consumer.commit.assert_called_once()
+    assert consumer.commit.call_args[0][0][TP0].offset == 7
+    assert pool.committable_offsets() == {}      # revoked partition is no longer tracked
+    assert TP0 not in paused
+    snapshot = stats.snapshot()
+    assert snapshot["assigned_partitions"] == ["complaints.v1[1]"]
+    assert snapshot["abandoned_in_flight"] == 0
+    pool.shutdown()
+
+
+def test_revoke_gives_up_after_drain_timeout():
+    release = threading.Event()
+    listener, pool, consumer, paused, stats = make_listener(lambda m: release.wait(2), drain_timeout_ms=50)
+    pool.submit(TP0, Msg(0, {}))
+
+    listener.on_partitions_revoked({TP0})
+
+    consumer.commit.assert_not_called()           # nothing finished, so nothing to hand over
+    assert stats.snapshot()["abandoned_in_flight"] == 1
+    release.set()
+    pool.shutdown()
+
+
+def test_commit_failure_on_revoke_does_not_raise():
+    listener, pool, consumer, _, _ = make_listener(lambda m: None)
+    consumer.commit.side_effect = RuntimeError("rebalance in progress")
+    pool.submit(TP1, Msg(0, {}))
+    pool.drain(timeout=2)
+
+    listener.on_partitions_revoked({TP1})
+    assert pool.committable_offsets() == {}
+    pool.shutdown()
+
+
+def test_stats_track_group_membership_across_reconnects():
+    stats = RebalanceStats()
+    stats.record_joining()
+    assert stats.joined is False
+    stats.record_assigned([])                     # an empty assignment still means the join completed
+    assert stats.snapshot()["joined"] is True
+
+    stats.record_assigned({TP0})
+    stats.record_left()
+    snapshot = stats.snapshot()
+    assert snapshot["joined"] is False and snapshot["assigned_partitions"] == []
+    assert snapshot["rebalances"] == 2
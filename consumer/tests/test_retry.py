@@ -0,0 +1,93 @@
+import time
+from collections import namedtuple
+
+import pytest
+
+from app.retry import RetryRouter, dlq_topic, get_header, parse_delays, retry_due_at, retry_topics
+
+Rec = namedtuple("Rec", "topic partition offset key value headers")
+
+
+class FakeFuture:
+    def __init__(self, error=None):
+        self.error = error
+
+    def get(self, timeout=None):
+        if self.error:
+            raise self.error
+
+
+class FakeProducer:
+    def __init__(self, error=None):
+        self.sent = []
+        self.error = error
+
+    def send(self, topic, value, key=None, headers=None):
+        self.sent.append((topic, value, key, dict(headers)))
+        return FakeFuture(self.error)
+
+
+def make_router(producer, delays="1m,10m"):
+    router = RetryRouter("broker:9092", "complaints.v1", delays=delays)
+    router._producer = producer
+    return router
+
+
+def test_parse_delays_and_topic_names():
+    assert parse_delays("30s, 1m,2h") == [("30s", 30), ("1m", 60), ("2h", 7200)]
+    assert retry_topics("complaints.v1", "1m,10m") == ["complaints.v1.retry.1m", "complaints.v1.retry.10m"]
+    assert dlq_topic("complaints.v1") == "complaints.v1.dlq"
+    with pytest.raises(ValueError):
+        parse_delays("1d")
+
+
+def test_route_walks_tiers_then_dead_letters():
+    producer = FakeProducer()
+    router = make_router(producer)
+    message = Rec("complaints.v1", 2, 40, b"k", {"id": "a"}, [])
+
+    assert router.route(message, RuntimeError("smtp down")) == "complaints.v1.retry.1m"
+    headers = producer.sent[-1][3]
+    assert headers["x-attempt"] == b"1"
+    assert headers["x-origin"] == b"complaints.v1/2/40"
+    assert 55 < retry_due_at(Rec(*message[:5], list(headers.items()))) - time.time() <= 60
+
+    retried = Rec("complaints.v1.retry.1m", 0, 5, b"k", {"id": "a"}, list(headers.items()))
+    assert router.route(retried, RuntimeError("again")) == "complaints.v1.retry.10m"
+    headers = producer.sent[-1][3]
+    assert headers["x-attempt"] == b"2"
+    assert headers["x-origin"] == b"complaints.v1/2/40"
+
+    last = Rec("complaints.v1.retry.10m", 0, 9, b"k", {"id": "a"}, list(headers.items()))
+    assert router.route(last, RuntimeError("still down")) == "complaints.v1.dlq"
+    assert "x-retry-at" not in producer.sent[-1][3]
+    assert producer.sent[-1][1:3] == ({"id": "a"}, b"k")
+    assert router.stats() == {"complaints.v1.retry.1m": 1, "complaints.v1.retry.10m": 1, "complaints.v1.dlq": 1}
+
+
+def test_route_raises_and_drops_producer_when_publish_fails():
+    router = make_router(FakeProducer(error=RuntimeError("broker down")))
+    with pytest.raises(RuntimeError):
+        router.route(Rec("complaints.v1", 0, 1, None, {"id": "a"}, []), RuntimeError("smtp down"))
+    assert router._producer is None
+    assert router.stats() == {}
+
+
+def test_get_header_handles_missing_headers():
+    Plain = namedtuple("Plain", "offset value")
+    assert get_header(Plain(0, {}), "x-attempt") is None
+    assert retry_due_at(Plain(0, {})) is None
+
+
+def test_route_keeps_encoding_headers_and_can_dead_letter_directly():
+    producer = FakeProducer()
+    router = make_router(producer)
+    headers = [("content-type", b"application/msgpack"), ("schema-id", b"1"), ("x-attempt", b"1")]
+    message = Rec("complaints.v1.retry.1m", 0, 3, b"k", b"\x92\xa1a\xc0", headers)
+
+    assert router.route(message, ValueError("bad payload"), dead_letter=True) == "complaints.v1.dlq"
+    topic, value, _, sent_headers = producer.sent[-1]
+    assert value == b"\x92\xa1a\xc0"
+    assert sent_headers["content-type"] == b"application/msgpack"
+    assert sent_headers["schema-id"] == b"1"
+    assert sent_headers["x-attempt"] == b"2"
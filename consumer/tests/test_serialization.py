@@ -0,0 +1,43 @@
+import json
+from collections import namedtuple
+
+import msgpack
+import pytest
+
+from app.serialization import UnsupportedEncoding, decode, decode_value, encoding_headers
+
+Rec = namedtuple("Rec", "value headers")
+
+PAYLOAD = {
+    "id": "0b9f", "submitted_at": 1700000000.5, "email_id": "a@example.com", "first_name": "A",
+    "last_name": "B", "subject": "S", "body": "B", "attachment": None,
+}
+
+
+def test_json_is_the_default_without_headers():
+    assert decode(Rec(json.dumps(PAYLOAD).encode(), None)) == PAYLOAD
+    assert decode(Rec(json.dumps(PAYLOAD).encode(), [("content-type", b"application/json")])) == PAYLOAD
+
+
+def test_msgpack_array_is_mapped_to_schema_fields():
+    values = [PAYLOAD[k] for k in ("id", "submitted_at", "email_id", "first_name", "last_name", "subject", "body", "attachment")]
+    headers = [("content-type", b"application/msgpack"), ("schema-id", b"1")]
+    assert decode_value(msgpack.packb(values), headers) == PAYLOAD
+    assert decode_value(msgpack.packb(values + [{"extra": 1}]), headers) == {**PAYLOAD, "extra": 1}
+
+
+def test_unknown_encodings_are_rejected():
+    with pytest.raises(UnsupportedEncoding):
+        decode_value(b"x", [("content-type", b"application/avro")])
+    with pytest.raises(UnsupportedEncoding):
+        decode_value(msgpack.packb([1]), [("content-type", b"application/msgpack"), ("schema-id", b"99")])
+
+
+def test_decoded_values_and_none_pass_through():
+    assert decode_value({"id": "a"}) == {"id": "a"}
+    assert decode_value(None) is None
+
+
+def test_encoding_headers_picks_only_encoding_headers():
+    message = Rec(b"", [("content-type", b"application/msgpack"), ("x-attempt", b"1"), ("schema-id", b"1")])
+    assert encoding_headers(message) == [("content-type", b"application/msgpack"), ("schema-id", b"1")]
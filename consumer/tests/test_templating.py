@@ -0,0 +1,74 @@
+import os
+import time
+
+import pytest
+
+from app.templating import CompiledTemplate, TemplateError, TemplateStore, subject_variant
+
+VALUES = {"first_name": "Ada", "subject": "Billing issue!", "body": "<b>hi</b>", "ticket_id": "T-1", "email_id": "a@x"}
+
+
+def write(root, relpath, content):
+    path = root / relpath
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def root(tmp_path):
+    write(tmp_path, "en/ack.txt", "Hello $first_name, ticket ${ticket_id}. Costs $$5.\n")
+    write(tmp_path, "en/ack.html", "<p>$body</p>")
+    write(tmp_path, "en/ack.billing-issue.txt", "Subject: [Billing] $subject\n\nBilling team: $ticket_id\n")
+    write(tmp_path, "de/ack.txt", "Hallo $first_name\n")
+    return tmp_path
+
+
+def test_compiled_template_substitutes_and_escapes():
+    assert CompiledTemplate("a $first_name ${ticket_id} $$").render(VALUES) == "a Ada T-1 $"
+    assert CompiledTemplate("<i>$body</i>", escape=True).render(VALUES) == "<i>&lt;b&gt;hi&lt;/b&gt;</i>"
+    with pytest.raises(TemplateError, match="unknown placeholder"):
+        CompiledTemplate("$password")
+
+
+def test_default_template_renders_text_and_html(root):
+    rendered = TemplateStore(str(root)).render("ack", {**VALUES, "subject": "Other"})
+    assert rendered.subject == "Other"
+    assert rendered.text == "Hello Ada, ticket T-1. Costs $5.\n"
+    assert rendered.html == "<p>&lt;b&gt;hi&lt;/b&gt;</p>"
+
+
+def test_subject_variant_and_subject_override(root):
+    assert subject_variant("Billing issue!") == "billing-issue"
+    rendered = TemplateStore(str(root)).render("ack", VALUES)
+    assert rendered.subject == "[Billing] Billing issue!"
+    assert rendered.text == "Billing team: T-1\n"
+    assert rendered.html is None
+
+
+@pytest.mark.parametrize("locale, expected", [("de", "Hallo Ada\n"), ("de_AT", "Hallo Ada\n"), ("fr", "Hello Ada")])
+def test_locale_falls_back_to_language_then_default(root, locale, expected):
+    text = TemplateStore(str(root)).render("ack", {**VALUES, "subject": "x"}, locale=locale).text
+    assert text.startswith(expected)
+
+
+def test_hot_reload_picks_up_edits_and_keeps_last_good_set(root):
+    store = TemplateStore(str(root), reload_seconds=0.01)
+    path = write(root, "de/ack.txt", "Guten Tag $first_name\n")
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10**9))
+    time.sleep(0.02)
+    assert store.render("ack", VALUES, locale="de").text == "Guten Tag Ada\n"
+
+    write(root, "de/ack.txt", "Broken $unknown\n")
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 2 * 10**9))
+    time.sleep(0.02)
+    assert store.render("ack", VALUES, locale="de").text == "Guten Tag Ada\n"
+    with pytest.raises(TemplateError):
+        store.reload(force=True)
+
+
+def test_shipped_templates_compile():
+    store = TemplateStore()
+    rendered = store.render("ack", VALUES)
+    assert "Your reference ticket number is T-1." in rendered.text
+    assert "&lt;b&gt;hi&lt;/b&gt;" in rendered.html
@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import namedtuple
+
+from kafka.structs import TopicPartition
+
+from app.worker_pool import OffsetTracker, WorkerPool
+
+Msg = namedtuple("Msg", "offset value")
+TP = TopicPartition("complaints.v1", 0)
+
+
+def test_offset_tracker_only_advances_over_contiguous_completions():
+    t = OffsetTracker()
+    for off in (10, 11, 12):
+        t.add(off)
+    t.complete(11)
+    assert t.position is None
+    t.complete(10)
+    assert t.position == 12
+    t.complete(12)
+    assert t.position == 13
+    assert t.in_flight == 0
+
+
+def test_offset_tracker_does_not_pass_failed_offset():
+    t = OffsetTracker()
+    for off in (0, 1, 2):
+        t.add(off)
+    t.complete(0)
+    t.fail(1)
+    t.complete(2)
+    assert t.position == 1
+    assert t.first_failed == 1
+    assert t.in_flight == 0
+
+
+def test_pool_runs_messages_concurrently():
+    barrier = threading.Barrier(3, timeout=2)
+    pool = WorkerPool(lambda m: barrier.wait(), workers=3, max_in_flight=10)
+    for off in range(3):
+        pool.submit(TP, Msg(off, {}))
+    assert pool.drain(timeout=2)
+    assert pool.committable_offsets()[TP].offset == 3
+    pool.shutdown()
+
+
+def test_pool_commit_waits_for_slow_earlier_message():
+    release = threading.Event()
+
+    def handler(m):
+        if m.offset == 0:
+            release.wait(2)
+
+    pool = WorkerPool(handler, workers=2, max_in_flight=10)
+    pool.submit(TP, Msg(0, {}))
+    pool.submit(TP, Msg(1, {}))
+    time.sleep(0.1)
+    assert TP not in pool.committable_offsets()
+    release.set()
+    assert pool.drain(timeout=2)
+    assert pool.committable_offsets()[TP].offset == 2
+    pool.shutdown()
+
+
+def test_pool_bounds_in_flight_per_partition():
+    release = threading.Event()
+    pool = WorkerPool(lambda m: release.wait(2), workers=4, max_in_flight=2)
+    pool.submit(TP, Msg(0, {}))
+    pool.submit(TP, Msg(1, {}))
+    submitted = threading.Event()
+    t = threading.Thread(target=lambda: (pool.submit(TP, Msg(2, {})), submitted.set()))
+    t.start()
+    assert not submitted.wait(0.2)
+    assert pool.in_flight() == 2
+    release.set()
+    assert submitted.wait(2)
+    assert pool.drain(timeout=2)
+    pool.shutdown()
+
+
+def test_pool_submit_gives_up_when_stopping():
+    release = threading.Event()
+    stop = threading.Event()
+    pool = WorkerPool(lambda m: release.wait(2), workers=1, max_in_flight=1)
+    pool.submit(TP, Msg(0, {}))
+    stop.set()
+    assert pool.submit(TP, Msg(1, {}), stop=stop) is False
+    release.set()
+    pool.shutdown()
+
+
+def test_pool_failed_message_is_not_committable():
+    def handler(m):
+        if m.offset == 6:
+            raise RuntimeError("smtp down")
+
+    pool = WorkerPool(handler, workers=1, max_in_flight=4)
+    for off in (5, 6, 7):
+        pool.submit(TP, Msg(off, {}))
+    assert pool.drain(timeout=2)
+    assert pool.committable_offsets()[TP].offset == 6
+    assert pool.failed() == {TP: 6}
+    pool.forget([TP])
+    assert pool.failed() == {}
+    pool.shutdown()
+
+
+def test_drain_can_wait_for_selected_partitions_only():
+    release = threading.Event()
+    other = TopicPartition("complaints.v1", 1)
+    pool = WorkerPool(lambda m: release.wait(2) if m.value == "slow" else None, workers=2, max_in_flight=10)
+    pool.submit(TP, Msg(0, "slow"))
+    pool.submit(other, Msg(0, "fast"))
+    assert pool.drain(timeout=2, partitions={other})
+    assert pool.in_flight({TP}) == 1
+    assert not pool.drain(timeout=0.05)
+    release.set()
+    assert pool.drain(timeout=2)
+    pool.shutdown()
+
+
+def test_pool_reports_oldest_in_flight_and_last_completion():
+    release = threading.Event()
+    pool = WorkerPool(lambda m: release.wait(2), workers=1, max_in_flight=10)
+    assert pool.oldest_in_flight_seconds() == 0.0
+    assert pool.last_completed_at is None
+    pool.submit(TP, Msg(0, {}))
+    time.sleep(0.1)
+    assert pool.oldest_in_flight_seconds() >= 0.1
+    release.set()
+    assert pool.drain(timeout=2)
+    assert pool.oldest_in_flight_seconds() == 0.0
+    assert time.time() - pool.last_completed_at < 1
+    pool.shutdown()
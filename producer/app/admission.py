@@ -0,0 +1,184 @@
+"""Admission control and load shedding for POST /submit and /submit/batch.
+
+When Postgres slows down, submissions queue for the DB workers and the
+connection pool until clients time out, so every request fails, and late. The
+controller refuses what it cannot finish in time instead, at once and with a
+Retry-After:
+
+  * 503 past the in-flight limit. The limit starts at SUBMIT_MAX_IN_FLIGHT, is
+    cut by a factor on every save slower than SUBMIT_LATENCY_TARGET_MS and grows
+    back by one on every faster one (AIMD), never below SUBMIT_MIN_IN_FLIGHT,
+    so a few requests keep probing the database while it is slow.
+  * 429 when a client runs out of tokens: per client address, and per
+    submitting email address.
+
+Kafka is not on this path: the outbox relay publishes in the background, so a
+slow broker grows the outbox rather than holding requests.
+"""
+import os
+import math
+import time
+import logging
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Iterable
+
+from . import metrics
+
+logger = logging.getLogger("producer")
+
+SUBMIT_MAX_IN_FLIGHT = int(os.getenv("SUBMIT_MAX_IN_FLIGHT", "100"))
+# Floor of the adaptive limit; about SUBMIT_DB_WORKERS keeps the workers busy
+SUBMIT_MIN_IN_FLIGHT = int(os.getenv("SUBMIT_MIN_IN_FLIGHT", "10"))
+# Saves slower than this, including the wait for a DB worker, lower the limit; 0 keeps it fixed
+SUBMIT_LATENCY_TARGET_MS = float(os.getenv("SUBMIT_LATENCY_TARGET_MS", "1000"))
+SUBMIT_LIMIT_BACKOFF = float(os.getenv("SUBMIT_LIMIT_BACKOFF", "0.9"))
+SUBMIT_RETRY_AFTER_SECONDS = int(os.getenv("SUBMIT_RETRY_AFTER_SECONDS", "1"))
+
+# Token buckets: sustained requests per second and burst; a rate of 0 turns the limit off.
+# Each complaint in a batch costs its address a token; a request costs its client one.
+SUBMIT_RATE_PER_CLIENT = float(os.getenv("SUBMIT_RATE_PER_CLIENT", "50"))
+SUBMIT_BURST_PER_CLIENT = float(os.getenv("SUBMIT_BURST_PER_CLIENT", "100"))
+SUBMIT_RATE_PER_EMAIL = float(os.getenv("SUBMIT_RATE_PER_EMAIL", "0.2"))
+SUBMIT_BURST_PER_EMAIL = float(os.getenv("SUBMIT_BURST_PER_EMAIL", "10"))
+# Buckets kept per limit; the least recently used are dropped (and start full again)
+SUBMIT_RATE_LIMIT_KEYS = int(os.getenv("SUBMIT_RATE_LIMIT_KEYS", "100000"))
+# Behind a proxy, the header it appends the client address to, e.g. X-Forwarded-For
+SUBMIT_CLIENT_IP_HEADER = os.getenv("SUBMIT_CLIENT_IP_HEADER", "")
+
+
+class Shed(Exception):
+    """A submission refused before any work was done; answered with status and Retry-After."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: float, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.message = message
+
+
+def client_address(request) -> str | None:
+    """The submitting client's address: the last hop in SUBMIT_CLIENT_IP_HEADER if set, else the peer."""
+    if SUBMIT_CLIENT_IP_HEADER:
+        forwarded = request.headers.get(SUBMIT_CLIENT_IP_HEADER)
+        if forwarded:
+            # Earlier entries come from the client and can be forged
+            return forwarded.rsplit(",", 1)[-1].strip()
+    return request.client.host if request.client else None
+
+
+class TokenBuckets:
+    """Token buckets by key, the least recently used dropped past maxsize. Event loop only."""
+
+    def __init__(self, rate: float, burst: float, maxsize: int = SUBMIT_RATE_LIMIT_KEYS, clock=time.monotonic):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.maxsize = maxsize
+        self._clock = clock
+        self._buckets: OrderedDict = OrderedDict()   # key -> [tokens, refilled_at]
+
+    def _bucket(self, key: str, now: float) -> list:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def take(self, costs: dict[str, float]) -> float:
+        """Take costs[key] tokens from each key's bucket and return 0.
+
+        If any bucket is short, nothing is taken and the result is the seconds
+        until all of them would have enough. A cost above the burst waits for a
+        full bucket.
+        """
+        if not self.rate:
+            return 0.0
+        now = self._clock()
+        buckets = [(self._bucket(key, now), min(cost, self.burst)) for key, cost in costs.items()]
+        wait = max(((cost - bucket[0]) / self.rate for bucket, cost in buckets), default=0.0)
+        if wait > 0:
+            return wait
+        for bucket, cost in buckets:
+            bucket[0] -= cost
+        return 0.0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class AdmissionController:
+    """In-flight submissions against an adaptive limit, plus per-client rate limits. Event loop only."""
+
+    def __init__(
+        self,
+        max_in_flight: int = SUBMIT_MAX_IN_FLIGHT,
+        min_in_flight: int = SUBMIT_MIN_IN_FLIGHT,
+        latency_target: float = SUBMIT_LATENCY_TARGET_MS / 1000,
+        backoff: float = SUBMIT_LIMIT_BACKOFF,
+        retry_after: float = SUBMIT_RETRY_AFTER_SECONDS,
+        by_client: TokenBuckets | None = None,
+        by_email: TokenBuckets | None = None,
+    ):
+        self.max_in_flight = max_in_flight
+        self.min_in_flight = min(min_in_flight, max_in_flight)
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.retry_after = retry_after
+        if by_client is None:
+            by_client = TokenBuckets(SUBMIT_RATE_PER_CLIENT, SUBMIT_BURST_PER_CLIENT)
+        if by_email is None:
+            by_email = TokenBuckets(SUBMIT_RATE_PER_EMAIL, SUBMIT_BURST_PER_EMAIL)
+        self.by_client = by_client
+        self.by_email = by_email
+        self.limit = float(max_in_flight)
+        self.in_flight = 0
+
+    @contextmanager
+    def admit(self, client: str | None):
+        """Hold an in-flight slot for the with block; Shed if the producer is full or the client over its rate."""
+        if self.in_flight >= int(self.limit):
+            reason = "in_flight" if int(self.limit) >= self.max_in_flight else "latency"
+            self._shed(Shed(503, reason, self.retry_after, "Too many submissions in progress; retry later"))
+        if client is not None:
+            wait = self.by_client.take({client: 1})
+            if wait:
+                self._shed(Shed(429, "client_rate", wait, "Too many submissions from this client; slow down"))
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    def check_senders(self, emails: Iterable[str]) -> None:
+        """Charge each address a token per complaint; Shed, charging none, if any address is out."""
+        wait = self.by_email.take(Counter(emails))
+        if wait:
+            self._shed(Shed(429, "email_rate", wait, "Too many submissions from this email address; slow down"))
+
+    def observe(self, seconds: float) -> None:
+        """Adjust the limit after a save (or a failed one) that took this long."""
+        if not self.latency_target:
+            return
+        if seconds > self.latency_target:
+            if self.limit >= self.max_in_flight:
+                logger.warning("A save took %.0f ms; lowering the in-flight submission limit", seconds * 1000)
+            self.limit = max(self.min_in_flight, self.limit * self.backoff)
+        elif self.limit < self.max_in_flight:
+            self.limit = min(self.max_in_flight, self.limit + 1)
+            if self.limit >= self.max_in_flight:
+                logger.info("Saves are fast again; in-flight submission limit back at %d", self.max_in_flight)
+
+    def _shed(self, shed: Shed):
+        metrics.SUBMISSIONS_SHED.labels(reason=shed.reason).inc()
+        raise shed
+
+
+admission = AdmissionController()
+metrics.SUBMIT_IN_FLIGHT.set_function(lambda: admission.in_flight)
+metrics.SUBMIT_IN_FLIGHT_LIMIT.set_function(lambda: admission.limit)
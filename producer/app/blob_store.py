@@ -0,0 +1,83 @@
+import os
+import re
+import hashlib
+import logging
+import tempfile
+
+logger = logging.getLogger("producer")
+
+# Filesystem stand-in for object storage, shared with the consumer (same path or volume).
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "/data/blobs")
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(25 * 1024 * 1024)))
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class BlobTooLarge(ValueError):
+    pass
+
+
+class BlobWriter:
+    """Streams one blob to a temporary file, hashing as it goes.
+
+    commit() moves the file to its content address; writing the same content
+    twice stores it once.
+    """
+
+    def __init__(self, store: "BlobStore", max_bytes: int):
+        self._store = store
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._hash = hashlib.sha256()
+        os.makedirs(store.tmp_dir, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=store.tmp_dir, prefix="upload-", delete=False)
+
+    def write(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise BlobTooLarge(f"Attachment exceeds {self.max_bytes} bytes")
+        self._hash.update(data)
+        self._file.write(data)
+
+    def commit(self) -> str:
+        """Finish the blob and return its reference ("sha256:<hex>")."""
+        self._file.close()
+        digest = self._hash.hexdigest()
+        final = self._store.path(digest)
+        if os.path.exists(final):
+            os.unlink(self._file.name)
+        else:
+            os.makedirs(os.path.dirname(final), exist_ok=True)
+            os.replace(self._file.name, final)
+        return f"sha256:{digest}"
+
+    def abort(self) -> None:
+        self._file.close()
+        try:
+            os.unlink(self._file.name)
+        except FileNotFoundError:
+            pass
+
+
+class BlobStore:
+    """Content-addressed blobs under root/ab/cd/<sha256>."""
+
+    def __init__(self, root: str = BLOB_STORE_DIR):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+
+    def path(self, digest: str) -> str:
+        if digest.startswith("sha256:"):
+            digest = digest[len("sha256:"):]
+        if not _DIGEST_RE.match(digest):
+            raise ValueError(f"Invalid blob reference: {digest!r}")
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def writer(self, max_bytes: int = ATTACHMENT_MAX_BYTES) -> BlobWriter:
+        return BlobWriter(self, max_bytes)
+
+    def exists(self, ref: str) -> bool:
+        return os.path.exists(self.path(ref))
+
+
+blob_store = BlobStore()
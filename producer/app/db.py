@@ -1,8 +1,13 @@
 
 import os
+import time
 from typing import Generator
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.exc import TimeoutError as SQLAlchemyTimeoutError
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
+from psycopg2.extras import execute_batch
+from . import metrics
 
 # Prefer a full DATABASE_URL if provided; otherwise build it from individual env vars.
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -21,11 +26,56 @@ if not DATABASE_URL:
     # Explicitly specify psycopg2 driver
     DATABASE_URL = f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{database}"
 
-# Create the engine with pre-ping to avoid stale connections
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-)
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in {"1", "true", "yes", "on"}
+
+
+# Pool sizing. Each uvicorn worker has its own pool, so the database sees up to
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Pre-ping costs a round trip on every checkout; recycling usually suffices.
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", "false")
+# Behind PgBouncer in transaction mode: leave pooling to PgBouncer and don't rely
+# on session state such as prepared statements.
+DB_PGBOUNCER = _env_bool("DB_PGBOUNCER", "false")
+DB_PREPARED_STATEMENTS = _env_bool("DB_PREPARED_STATEMENTS", "true") and not DB_PGBOUNCER
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except SQLAlchemyTimeoutError:
+            metrics.DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            metrics.DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+
+
+def _engine_options() -> dict:
+    if DB_PGBOUNCER:
+        return {"poolclass": NullPool, "pool_pre_ping": DB_POOL_PRE_PING}
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+engine = create_engine(DATABASE_URL, **_engine_options())
+
+if isinstance(engine.pool, QueuePool):
+    metrics.DB_POOL_SIZE.set(DB_POOL_SIZE + DB_MAX_OVERFLOW)
+    metrics.DB_POOL_CHECKED_OUT.set_function(engine.pool.checkedout)
 
 # Classic (sync) Session factory for SQLAlchemy 2.0 style
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
@@ -38,3 +88,48 @@ def get_db() -> Generator:
         yield db
     finally:
         db.close()
+
+
+# Server-side prepared statements, created on first use per connection. Parameter
+# types are spelled out so the plan does not depend on the first call's values.
+PREPARED_STATEMENTS = {
+    "insert_email": (
+        "PREPARE insert_email (uuid, text, text, text, text, text, text, text, bigint) AS "
+        "INSERT INTO emails (id, email_id, first_name, last_name, subject, body, attachment_name, attachment_ref, attachment_size) "
+        "VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)"
+    ),
+    "insert_outbox": (
+        "PREPARE insert_outbox (uuid, jsonb) AS "
+        "INSERT INTO outbox (record_id, payload) VALUES ($1, $2)"
+    ),
+    # Affects no row if the key is stored and younger than the cutoff ($4)
+    "claim_idempotency_key": (
+        "PREPARE claim_idempotency_key (text, text, jsonb, timestamptz) AS "
+        "INSERT INTO idempotency_keys (key, fingerprint, response) VALUES ($1, $2, $3) "
+        "ON CONFLICT (key) DO UPDATE SET fingerprint = EXCLUDED.fingerprint, response = EXCLUDED.response, "
+        "created_at = EXCLUDED.created_at WHERE idempotency_keys.created_at <= $4"
+    ),
+}
+
+
+def execute_prepared(db: Session, name: str, rows: list[tuple]) -> int:
+    """Run a prepared statement once per row inside the session's transaction.
+
+    All rows go to the server as one batch of EXECUTE statements: one round trip,
+    and no parsing or planning on the server. The statement is prepared the
+    first time a connection uses it; PREPARE is not undone by a rollback, so
+    this happens once per pooled connection. Returns the number of rows the
+    last EXECUTE affected.
+    """
+    conn = db.connection().connection
+    prepared = conn.info.setdefault("prepared_statements", set())
+    cursor = conn.driver_connection.cursor()
+    try:
+        if name not in prepared:
+            cursor.execute(PREPARED_STATEMENTS[name])
+            prepared.add(name)
+        placeholders = ", ".join(["%s"] * len(rows[0]))
+        execute_batch(cursor, f"EXECUTE {name} ({placeholders})", rows, page_size=len(rows))
+        return cursor.rowcount
+    finally:
+        cursor.close()
@@ -0,0 +1,158 @@
+"""Idempotency-Key support for POST /submit.
+
+A client that retries a submission with the same Idempotency-Key gets the first
+attempt's response back instead of a second complaint and a second email. The
+key is written to idempotency_keys in the same transaction as the complaint, so
+it is recorded exactly when the complaint is. Repeats are answered from an LRU
+in front of the table. Within a process, concurrent duplicates wait on a
+per-key lock for the first one to finish. Across replicas, the unique key makes
+the second insert wait for the first transaction and then replay its response.
+"""
+import os
+import json
+import asyncio
+import hashlib
+import datetime
+import logging
+from contextlib import asynccontextmanager
+from typing import NamedTuple
+
+from sqlalchemy import bindparam, delete, select, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session
+
+from .db import DB_PREPARED_STATEMENTS, SessionLocal, execute_prepared
+from .models import IdempotencyKey
+from .read_cache import TTLCache
+from .schemas import AttachmentRef, SubmitIn
+
+logger = logging.getLogger("producer")
+
+# How long a key is remembered; a retry after that creates a new complaint
+IDEMPOTENCY_KEY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_KEY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+# Without prepared statements; plain SQL, as an ORM upsert is rebuilt and compiled on every call
+_CLAIM = text(
+    "INSERT INTO idempotency_keys (key, fingerprint, response) VALUES (:key, :fingerprint, :response) "
+    "ON CONFLICT (key) DO UPDATE SET fingerprint = EXCLUDED.fingerprint, response = EXCLUDED.response, "
+    "created_at = EXCLUDED.created_at WHERE idempotency_keys.created_at <= :cutoff"
+).bindparams(bindparam("response", type_=JSONB))
+
+
+class KeyTaken(Exception):
+    """Another request stored this key first; replay its response instead."""
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    response: dict
+
+
+def fingerprint(payload: SubmitIn, attachment: AttachmentRef | None = None) -> str:
+    """Digest of a submission, to tell a retry from a different request reusing its key."""
+    request = {"payload": payload.model_dump(mode="json"), "attachment": attachment.model_dump() if attachment else None}
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+class KeyLocks:
+    """asyncio locks by key, dropped once nobody holds or waits for them. Event loop only."""
+
+    def __init__(self):
+        self._locks: dict[str, list] = {}   # key -> [lock, holders and waiters]
+
+    @asynccontextmanager
+    async def hold(self, key: str):
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class IdempotencyStore:
+    """Stored responses by Idempotency-Key: the LRU, then the idempotency_keys table.
+
+    get_cached() is cheap enough for the event loop; lookup() and purge_expired()
+    query the database and run on the DB executor.
+    """
+
+    def __init__(self, session_factory=SessionLocal, cache: TTLCache | None = None,
+                 ttl: float = IDEMPOTENCY_KEY_TTL_SECONDS):
+        self._session_factory = session_factory
+        self.cache = cache if cache is not None else TTLCache(IDEMPOTENCY_CACHE_SIZE)
+        self.ttl = ttl
+        self.locks = KeyLocks()
+
+    def _cutoff(self) -> datetime.datetime:
+        return datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=self.ttl)
+
+    def get_cached(self, key: str) -> StoredResponse | None:
+        return self.cache.get(key)
+
+    def remember(self, key: str, stored: StoredResponse, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if ttl > 0:
+            self.cache.set(key, stored, ttl)
+
+    def lookup(self, key: str) -> StoredResponse | None:
+        """The response stored for key, from the cache or the table; None if it is new or expired."""
+        stored = self.cache.get(key)
+        if stored is not None:
+            return stored
+        db: Session = self._session_factory()
+        try:
+            row = db.execute(
+                select(IdempotencyKey.fingerprint, IdempotencyKey.response, IdempotencyKey.created_at)
+                .where(IdempotencyKey.key == key, IdempotencyKey.created_at > self._cutoff())
+            ).first()
+        finally:
+            db.close()
+        if row is None:
+            return None
+        stored = StoredResponse(row.fingerprint, row.response)
+        # Only for what is left of its TTL, so the cache stops replaying it when the table does
+        age = (datetime.datetime.now(datetime.timezone.utc) - row.created_at).total_seconds()
+        self.remember(key, stored, self.ttl - age)
+        return stored
+
+    def claim(self, db: Session, key: str, stored: StoredResponse) -> None:
+        """Record key in the caller's transaction; KeyTaken if a live entry exists.
+
+        An expired entry is overwritten. If another transaction is inserting the
+        same key, Postgres makes this one wait for it to commit or roll back.
+        """
+        if DB_PREPARED_STATEMENTS:
+            claimed = execute_prepared(db, "claim_idempotency_key", [
+                (key, stored.fingerprint, json.dumps(stored.response), self._cutoff())
+            ])
+        else:
+            claimed = db.execute(_CLAIM, {
+                "key": key, "fingerprint": stored.fingerprint, "response": stored.response, "cutoff": self._cutoff(),
+            }).rowcount
+        if not claimed:
+            raise KeyTaken(key)
+
+    def purge_expired(self) -> int:
+        """Delete expired entries. Returns how many were deleted."""
+        db: Session = self._session_factory()
+        try:
+            deleted = db.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at <= self._cutoff())).rowcount
+            db.commit()
+        finally:
+            db.close()
+        if deleted:
+            logger.info("Purged %d expired idempotency key(s)", deleted)
+        return deleted
+
+
+idempotency = IdempotencyStore()
@@ -1,6 +1,9 @@
-import os, json, time, logging
+import os, time, logging
+from concurrent.futures import Future, wait
 from kafka import KafkaProducer
-from kafka.errors import KafkaError
+from kafka.errors import KafkaTimeoutError
+from . import metrics
+from .serialization import get_serializer
 
 
 logger = logging.getLogger("producer")
@@ -8,22 +11,42 @@ logger = logging.getLogger("producer")
 _broker = os.getenv("KAFKA_BROKER", "kafka:9092")
 _producer = None
 
+# How long publish_many waits for the broker to acknowledge a batch
+KAFKA_SEND_TIMEOUT = float(os.getenv("KAFKA_SEND_TIMEOUT", "10"))
+
+# Batching: messages sent within linger_ms of each other share one produce request,
+# up to batch_size bytes per partition, optionally compressed as a whole.
+KAFKA_LINGER_MS = int(os.getenv("KAFKA_LINGER_MS", "5"))
+KAFKA_BATCH_SIZE = int(os.getenv("KAFKA_BATCH_SIZE", "65536"))
+KAFKA_COMPRESSION = os.getenv("KAFKA_COMPRESSION") or None  # gzip, snappy, lz4 or zstd
+KAFKA_ACKS = os.getenv("KAFKA_ACKS", "1")
+KAFKA_RETRIES = int(os.getenv("KAFKA_RETRIES", "0"))
+
+# Value encoding (KAFKA_MESSAGE_FORMAT=json|msgpack); each message says which in its headers
+_serializer = get_serializer()
+
+# Payload field used as the message key. Messages with the same key land on the same
+# partition, so one recipient's emails stay in order while different recipients spread
+# across partitions (and consumer instances). Empty = no key, round-robin placement.
+KAFKA_PARTITION_KEY = os.getenv("KAFKA_PARTITION_KEY", "email_id")
+
 def _get_producer() -> KafkaProducer:
     global _producer
     if _producer is None:
         logger.info(f"Kafka producer connecting to {_broker}")
         _producer = KafkaProducer(
             bootstrap_servers=_broker,
-            value_serializer=lambda v: json.dumps(v).encode("utf-8"),
-            retries=0,  # we'll handle retries in publish()
+            value_serializer=_serializer.encode,
+            retries=KAFKA_RETRIES,  # 0 by default: the outbox relay retries what was not acknowledged
+            linger_ms=KAFKA_LINGER_MS,
+            batch_size=KAFKA_BATCH_SIZE,
+            compression_type=KAFKA_COMPRESSION,
+            acks=KAFKA_ACKS if KAFKA_ACKS == "all" else int(KAFKA_ACKS),
         )
     return _producer
 
-def publish(payload: dict):
-    """Publish a JSON payload to Kafka with small retry/backoff and logs.
-    Removes the legacy 'email' field if present.
-    Raises the exception if all retries fail so the API can return 500.
-    """
+def _prepare(payload: dict) -> tuple[str, dict]:
+    """Resolve the topic and return a validated copy of the payload without the legacy 'email' field."""
     topic = os.getenv("KAFKA_TOPIC", "complaints.v1")
     payload = dict(payload)  # avoid mutating caller's dict
     payload.pop("email", None)  # ensure old field is not sent
@@ -32,23 +55,75 @@ def publish(payload: dict):
     missing = [k for k in ("email_id", "first_name", "last_name", "subject", "body") if k not in payload or payload[k] is None or (isinstance(payload[k], str) and not payload[k].strip())]
     if missing:
         raise ValueError(f"Missing required fields: {', '.join(missing)}")
+    return topic, payload
+
+def _key(payload: dict) -> bytes | None:
+    value = payload.get(KAFKA_PARTITION_KEY) if KAFKA_PARTITION_KEY else None
+    return str(value).encode("utf-8") if value else None
+
+def send_nowait(payload: dict) -> Future:
+    """Queue a payload on the producer's current batch without waiting for the broker.
+
+    Returns a concurrent.futures.Future that a delivery callback resolves with the
+    record metadata, or fails with the send/validation error.
+    """
+    result = Future()
+    try:
+        topic, payload = _prepare(payload)
+        started = time.perf_counter()
+        record_future = _get_producer().send(topic, payload, key=_key(payload), headers=_serializer.headers)
+    except Exception as e:
+        metrics.KAFKA_SEND_FAILURES.inc()
+        result.set_exception(e)
+        return result
+
+    def _acked(metadata):
+        metrics.KAFKA_SEND_SECONDS.observe(time.perf_counter() - started)
+        result.set_result(metadata)
+
+    def _failed(exc):
+        metrics.KAFKA_SEND_FAILURES.inc()
+        result.set_exception(exc)
+
+    record_future.add_callback(_acked)
+    record_future.add_errback(_failed)
+    return result
+
+def publish_many(payloads: list[dict], timeout: float = KAFKA_SEND_TIMEOUT) -> list[Exception | None]:
+    """Publish a batch of payloads in one pipelined round trip.
+
+    All messages are queued first and then flushed together, so the batch costs
+    one broker round trip per partition instead of one per message. Never raises
+    for individual messages: returns one entry per payload, None on success or
+    the exception that message failed with.
+    """
+    if not payloads:
+        return []
+    futures = [send_nowait(payload) for payload in payloads]
+    deadline = time.monotonic() + timeout
+    try:
+        _get_producer().flush(timeout=timeout)
+    except Exception as e:
+        logger.warning(f"Kafka flush did not complete: {e}")
+    wait(futures, timeout=max(0.0, deadline - time.monotonic()))
 
-    max_attempts = 3
-    for attempt in range(1, max_attempts + 1):
-        try:
-            p = _get_producer()
-            logger.info(f"Publishing to topic='{topic}' (attempt {attempt}/{max_attempts}) for email_id='{payload.get('email_id')}'")
-            # Ensure we wait for the send to complete for stronger delivery guarantees
-            p.send(topic, payload).get(timeout=10)
-            p.flush()
-            logger.info(f"Published successfully to '{topic}' for email_id='{payload.get('email_id')}'")
-            return
-        except (KafkaError, Exception) as e:
-            logger.warning(f"Kafka publish failed on attempt {attempt}: {e}")
-            # If producer instance got into a bad state, drop it so it's recreated next attempt
+    results: list[Exception | None] = []
+    for f in futures:
+        if not f.done():
+            results.append(KafkaTimeoutError(f"Delivery not confirmed within {timeout}s"))
+        else:
+            results.append(f.exception())
+    failed = sum(1 for r in results if r is not None)
+    if failed:
+        logger.warning(f"Kafka batch publish: {failed}/{len(results)} message(s) failed")
+        if failed == len(results):
+            # Nothing got through; close the producer so the next batch reconnects.
             global _producer
-            _producer = None
-            if attempt == max_attempts:
-                logger.error("Kafka publish failed after retries; giving up")
-                raise
-            time.sleep(0.5 * attempt)  # small backoff
+            stale, _producer = _producer, None
+            if stale is not None:
+                try:
+                    # Without this every outage would leak its sender thread and sockets
+                    stale.close(timeout=0)
+                except Exception as e:
+                    logger.warning(f"Closing the Kafka producer failed: {e}")
+    return results
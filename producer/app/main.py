@@ -1,20 +1,41 @@
-import uuid, os
+import uuid, os, json
+from urllib.parse import parse_qsl
 import logging, traceback, time
+import asyncio
 import socket
-from fastapi import FastAPI, HTTPException, Body
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from fastapi import FastAPI, HTTPException, Body, Header, Query
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.requests import Request
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, ValidationError
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import parse_options_header
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from .db import SessionLocal, engine
-from .models import Base, EmailRecord
-from .kafka_producer import publish
-from .schemas import SubmitIn
+from sqlalchemy import text, insert, select
+from .admission import Shed, admission, client_address
+from .db import DB_PREPARED_STATEMENTS, SessionLocal, engine, execute_prepared
+from .models import Base, EmailRecord, OutboxEvent
+from .outbox import ensure_outbox_schema, relay
+from .partitions import ensure_partitions, maintainer, month_bounds
+from .topics import KAFKA_TOPIC_BOOTSTRAP, ensure_topic
+from .schemas import AttachmentRef, ComplaintHit, ComplaintListOut, ComplaintOut, ComplaintSearchOut, SubmitIn, SubmitBatchOut, SUBMIT_BATCH_MAX
+from .search import Cursor, decode_cursor, ensure_search_schema, page_query, search_query, split_page
+from .idempotency import IDEMPOTENCY_KEY_MAX_LENGTH, KeyTaken, StoredResponse, fingerprint, idempotency
+from .read_cache import READ_CACHE_LIST_TTL_SECONDS, READ_CACHE_TTL_SECONDS, CachedResponse, read_cache
+from .blob_store import ATTACHMENT_MAX_BYTES, BlobTooLarge, blob_store
+from .uploads import MultipartSubmission, UploadError
+from . import metrics
 
 
 Base.metadata.create_all(bind=engine)
+ensure_outbox_schema(engine)
+ensure_partitions(engine)
+ensure_search_schema(engine)
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
@@ -23,8 +44,52 @@ logger = logging.getLogger("producer")
 
 
 
-KAFKA_MAX_RETRIES = 3
-RETRY_DELAY_SECONDS = 2
+OUTBOX_RELAY_ENABLED = os.getenv("OUTBOX_RELAY_ENABLED", "true").lower() in {"1", "true", "yes", "on"}
+PARTITION_MAINTENANCE_ENABLED = os.getenv("PARTITION_MAINTENANCE_ENABLED", "true").lower() in {"1", "true", "yes", "on"}
+
+# Blocking DB work from async endpoints runs here so the event loop stays free.
+# Keep this at or below the SQLAlchemy pool size (pool_size + max_overflow).
+SUBMIT_DB_WORKERS = int(os.getenv("SUBMIT_DB_WORKERS", "10"))
+_db_executor = ThreadPoolExecutor(max_workers=SUBMIT_DB_WORKERS, thread_name_prefix="submit-db")
+
+# Expired Idempotency-Keys are deleted this often
+IDEMPOTENCY_PURGE_INTERVAL = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", "3600"))
+
+# Page size of GET /complaints and /complaints/search, and the largest `limit` accepted
+COMPLAINTS_PAGE_SIZE = int(os.getenv("COMPLAINTS_PAGE_SIZE", "50"))
+COMPLAINTS_LIST_MAX = int(os.getenv("COMPLAINTS_LIST_MAX", "100"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the Kafka topic if needed, then run the outbox relay and partition maintenance for the lifetime of the app."""
+    if KAFKA_TOPIC_BOOTSTRAP:
+        # Before the relay starts, so the first publish does not auto-create a one-partition topic
+        try:
+            await asyncio.to_thread(ensure_topic)
+        except Exception as e:
+            logger.warning("Kafka topic bootstrap failed, continuing with the existing topic: %s", e)
+    if OUTBOX_RELAY_ENABLED:
+        relay.start()
+    if PARTITION_MAINTENANCE_ENABLED:
+        maintainer.start()
+    purge = asyncio.create_task(_purge_idempotency_keys())
+    yield
+    purge.cancel()
+    maintainer.stop()
+    relay.stop()
+
+
+async def _purge_idempotency_keys():
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(_db_executor, idempotency.purge_expired)
+        except Exception as e:
+            logger.warning("Could not purge expired idempotency keys: %s", e)
+        await asyncio.sleep(IDEMPOTENCY_PURGE_INTERVAL)
+
+
 app = FastAPI(
     title="Producer API",
     version="1.0.0",
@@ -36,6 +101,7 @@ app = FastAPI(
     license_info={"name": "Proprietary"},
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 # Enable CORS for Angular dev server
@@ -48,6 +114,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 # Global exception handler to ensure endpoints never break
@@ -56,6 +123,14 @@ async def unhandled_exc_handler(request: Request, exc: Exception):
     logger.exception("Unhandled exception on %s %s: %s", request.method, request.url.path, exc)
     return JSONResponse(status_code=500, content={"detail": "Internal server error"})
 
+
+@app.exception_handler(Shed)
+async def shed_handler(request: Request, exc: Shed):
+    return JSONResponse(
+        status_code=exc.status_code, content={"detail": {"message": exc.message}},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 class SubmitOut(BaseModel):
     id: str
     status: str
@@ -132,6 +207,23 @@ def readiness():
     )
 
 
+@app.get(
+    "/metrics",
+    tags=["Health"],
+    summary="Prometheus metrics",
+    description="Request, database, Kafka and outbox metrics in the Prometheus text format.",
+    response_class=Response,
+)
+async def prometheus_metrics():
+    loop = asyncio.get_running_loop()
+    try:
+        metrics.OUTBOX_PENDING.set(await loop.run_in_executor(_db_executor, relay.pending))
+    except Exception as e:
+        logger.warning("Could not sample outbox backlog: %s", e)
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
 @app.post(
     "/submit",
     response_model=SubmitOut,
@@ -139,77 +231,433 @@ def readiness():
     tags=["Submissions"],
     summary="Create a new complaint record",
     description=(
-        "Accepts a complaint payload, stores it in the database, and queues a minimal message to Kafka.\n"
-        "Returns the new record id and a status."
+        "Accepts a complaint payload and stores it in the database together with an outbox entry;\n"
+        "the outbox relay delivers the message to Kafka in the background.\n"
+        "Send JSON or a form; multipart/form-data may add an optional `attachment` file.\n"
+        f"Attachments (up to {ATTACHMENT_MAX_BYTES} bytes) are streamed to the blob store and only a\n"
+        "reference is stored and published.\n"
+        "Returns the new record id and a status.\n"
+        "Retries that send the same `Idempotency-Key` get the first response back (with\n"
+        "`Idempotent-Replayed: true`) instead of creating another complaint."
     ),
     responses={
+        400: {"description": "Malformed multipart upload."},
+        413: {"description": "Attachment too large."},
+        422: {"description": "Invalid payload, or an Idempotency-Key already used for a different one."},
         500: {"description": "Database error. Please try again later."}
     },
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"$ref": "#/components/schemas/SubmitIn"},
+                    "examples": {
+                        "basic": {
+                            "summary": "Minimum happy-path",
+                            "value": {
+                                "email_id": "asha@example.com",
+                                "first_name": "Asha",
+                                "last_name": "K",
+                                "subject": "Login issue",
+                                "body": "I cannot log in to the portal after password reset."
+                            }
+                        }
+                    },
+                },
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["email_id", "first_name", "last_name", "subject", "body"],
+                        "properties": {
+                            "email_id": {"type": "string", "format": "email"},
+                            "first_name": {"type": "string"},
+                            "last_name": {"type": "string"},
+                            "subject": {"type": "string"},
+                            "body": {"type": "string"},
+                            "attachment": {"type": "string", "format": "binary"},
+                        },
+                    }
+                },
+            },
+        }
+    },
 )
 async def submit(
-    payload: SubmitIn = Body(
-        ..., 
-        examples={
-            "basic": {
-                "summary": "Minimum happy-path",
-                "value": {
-                    "email_id": "asha@example.com",
-                    "first_name": "Asha",
-                    "last_name": "K",
-                    "subject": "Login issue",
-                    "body": "I cannot log in to the portal after password reset."
-                }
-            }
-        }
-    )
+    request: Request,
+    idempotency_key: str | None = Header(
+        None, alias="Idempotency-Key", min_length=1, max_length=IDEMPOTENCY_KEY_MAX_LENGTH,
+        description="Client-chosen unique key, e.g. a UUID; repeats of it within a day are not stored again",
+    ),
 ):
-    logger.info("Received submission payload for %s", payload.email_id)
+    with admission.admit(client_address(request)):
+        attachment = None
+        content_type = request.headers.get("content-type", "")
+        if content_type.startswith("multipart/form-data"):
+            payload, attachment = await _receive_multipart(request)
+        elif content_type.startswith("application/x-www-form-urlencoded"):
+            payload = _validate_submission(dict(parse_qsl((await request.body()).decode("utf-8", "replace"))))
+        else:
+            payload = _validate_submission(await request.body(), json_body=True)
+        logger.debug("Received submission payload for %s", payload.email_id)
+        if idempotency_key is None:
+            return await _submit_one(payload, attachment)
+        request_fingerprint = fingerprint(payload, attachment)
+        stored = idempotency.get_cached(idempotency_key)
+        if stored is None:
+            # Duplicates arriving together wait here, then find the first one's response in the cache
+            async with idempotency.locks.hold(idempotency_key):
+                stored = idempotency.get_cached(idempotency_key)
+                if stored is None:
+                    try:
+                        return await _submit_one(payload, attachment, idempotency_key, request_fingerprint)
+                    except KeyTaken:
+                        # Stored before this process cached it: by another replica, or before a restart
+                        loop = asyncio.get_running_loop()
+                        stored = await loop.run_in_executor(_db_executor, idempotency.lookup, idempotency_key)
+        if stored is None:
+            raise HTTPException(status_code=409, detail={"message": "Idempotency-Key is being reused; retry"})
+        if stored.fingerprint != request_fingerprint:
+            metrics.IDEMPOTENCY_CONFLICTS.inc()
+            raise HTTPException(
+                status_code=422, detail={"message": "Idempotency-Key was already used for a different request"}
+            )
+        metrics.IDEMPOTENT_REPLAYS.inc()
+        return JSONResponse(status_code=201, content=stored.response, headers={"Idempotent-Replayed": "true"})
+
+
+async def _submit_one(
+    payload: SubmitIn, attachment: AttachmentRef | None,
+    idempotency_key: str | None = None, request_fingerprint: str = "",
+) -> dict:
+    """Store one submission, and the response under its Idempotency-Key if it has one."""
+    admission.check_senders([str(payload.email_id)])
     rec_id = str(uuid.uuid4())
+    response = {"id": rec_id, "status": "saved", "warning": None}
+    claim = (idempotency_key, StoredResponse(request_fingerprint, response)) if idempotency_key else None
+    await _save([(rec_id, payload)], {rec_id: attachment} if attachment else None, claim)
+    if claim:
+        idempotency.remember(*claim)
+    metrics.SUBMISSIONS.labels(endpoint="submit").inc()
+    relay.wake()
+    return response
+
+
+@app.get(
+    "/complaints/search",
+    response_model=ComplaintSearchOut,
+    tags=["Complaints"],
+    summary="Full-text search over complaint subjects and bodies",
+    description=(
+        "Web-search syntax: words, \"quoted phrases\", OR, and -word to exclude. Matching and ranking run in\n"
+        "Postgres on an indexed tsvector; subject matches rank above body matches. Pages continue from\n"
+        "`next_cursor`."
+    ),
+    responses={400: {"description": "Invalid cursor."}},
+)
+async def search_complaints(
+    q: str = Query(..., min_length=1, max_length=200, description="Search terms"),
+    limit: int = Query(COMPLAINTS_PAGE_SIZE, ge=1, le=COMPLAINTS_LIST_MAX),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+):
+    after = _parse_cursor(cursor, search=True)
+    loop = asyncio.get_running_loop()
+    body = await loop.run_in_executor(_db_executor, _search_complaints, q, limit, after)
+    return Response(content=body, media_type="application/json")
+
+
+@app.get(
+    "/complaints/{complaint_id}",
+    response_model=ComplaintOut,
+    tags=["Complaints"],
+    summary="Fetch a complaint by id",
+    description=(
+        "Returns the complaint stored under the id that /submit returned. Responses carry an ETag;\n"
+        "send it back in If-None-Match to get 304 Not Modified. Served from the read cache when possible.\n"
+        "Complaints are stored by month: pass `submitted_at` when known to read only that month."
+    ),
+    responses={304: {"description": "Not modified."}, 404: {"description": "No complaint with this id."}},
+)
+async def get_complaint(
+    complaint_id: uuid.UUID,
+    request: Request,
+    submitted_at: datetime.datetime | None = Query(None, description="When the complaint was submitted, if known"),
+):
+    load = partial(_load_complaint, complaint_id, submitted_at)
+    entry = await _cached(f"id:{complaint_id}", load, READ_CACHE_TTL_SECONDS)
+    if entry is None:
+        raise HTTPException(status_code=404, detail={"message": "Complaint not found"})
+    return _etag_response(request, entry)
+
+
+@app.get(
+    "/complaints",
+    response_model=ComplaintListOut,
+    tags=["Complaints"],
+    summary="List complaints, newest first",
+    description=(
+        "All complaints, or those submitted from `email_id`, most recent first, with an ETag as for\n"
+        "GET /complaints/{id}. Pages continue from `next_cursor`. An address's first page is served from the\n"
+        "read cache; a new submission from the address refreshes it."
+    ),
+    responses={304: {"description": "Not modified."}, 400: {"description": "Invalid cursor."}},
+)
+async def list_complaints(
+    request: Request,
+    email_id: EmailStr | None = Query(None, description="Submitter's email address"),
+    limit: int = Query(COMPLAINTS_PAGE_SIZE, ge=1, le=COMPLAINTS_LIST_MAX),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+):
+    after = _parse_cursor(cursor)
+    load = partial(_load_complaints_page, str(email_id) if email_id else None, limit, after)
+    if email_id is not None and after is None and limit == COMPLAINTS_PAGE_SIZE:
+        entry = await _cached(f"email:{email_id}", load, READ_CACHE_LIST_TTL_SECONDS)
+    else:
+        loop = asyncio.get_running_loop()
+        entry = CachedResponse.of(await loop.run_in_executor(_db_executor, load))
+    return _etag_response(request, entry)
+
+
+def _parse_cursor(cursor: str | None, search: bool = False) -> Cursor | None:
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor, search=search)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e)})
+
+
+async def _cached(key: str, loader, ttl: float) -> CachedResponse | None:
+    """The cached response for key; on a local miss, the shared tier or loader() run on the DB pool."""
+    entry = read_cache.get_local(key)
+    if entry is None:
+        loop = asyncio.get_running_loop()
+        entry = await loop.run_in_executor(_db_executor, read_cache.load, key, loader, ttl)
+    return entry
+
+
+def _etag_response(request: Request, entry: CachedResponse) -> Response:
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if any(tag.strip() in ("*", entry.etag, f"W/{entry.etag}") for tag in if_none_match.split(",")):
+        metrics.NOT_MODIFIED.inc()
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+# Everything but the legacy inline attachment bytes
+_COMPLAINT_COLUMNS = (
+    EmailRecord.id, EmailRecord.email_id, EmailRecord.first_name, EmailRecord.last_name, EmailRecord.subject,
+    EmailRecord.body, EmailRecord.attachment_name, EmailRecord.attachment_ref, EmailRecord.attachment_size,
+    EmailRecord.submitted_at,
+)
+
+
+def _read(stmt, one: bool = False):
+    """Run a read query on its own session. Runs on the submit-db pool."""
     db: Session = SessionLocal()
+    started = time.perf_counter()
+    try:
+        result = db.execute(stmt)
+        return result.first() if one else result.all()
+    finally:
+        db.close()
+        metrics.DB_READ_SECONDS.observe(time.perf_counter() - started)
+
+
+def _load_complaint(complaint_id: uuid.UUID, submitted_at: datetime.datetime | None = None) -> bytes | None:
+    """The encoded complaint, or None if there is none.
+
+    By id alone this probes every monthly partition; submitted_at narrows it to
+    one, and a hint in the wrong month falls back to the full lookup.
+    """
+    stmt = select(*_COMPLAINT_COLUMNS).where(EmailRecord.id == complaint_id)
+    row = None
+    if submitted_at is not None:
+        lower, upper = month_bounds(submitted_at)
+        row = _read(stmt.where(EmailRecord.submitted_at >= lower, EmailRecord.submitted_at < upper), one=True)
+    if row is None:
+        row = _read(stmt, one=True)
+    return ComplaintOut.model_validate(row).model_dump_json().encode() if row is not None else None
+
+
+def _load_complaints_page(email_id: str | None, limit: int, after: Cursor | None) -> bytes:
+    rows, next_cursor = split_page(_read(page_query(_COMPLAINT_COLUMNS, limit, email_id, after)), limit)
+    return ComplaintListOut(
+        items=[ComplaintOut.model_validate(row) for row in rows], next_cursor=next_cursor
+    ).model_dump_json().encode()
+
+
+def _search_complaints(q: str, limit: int, after: Cursor | None) -> bytes:
+    rows, next_cursor = split_page(_read(search_query(_COMPLAINT_COLUMNS, q, limit, after)), limit, search=True)
+    return ComplaintSearchOut(
+        items=[ComplaintHit.model_validate(row) for row in rows], next_cursor=next_cursor
+    ).model_dump_json().encode()
+
+
+def _validate_submission(data, json_body: bool = False) -> SubmitIn:
+    """Validate a submission the way a SubmitIn body parameter would, including the 422 shape."""
     try:
-        rec = EmailRecord(
-            id=rec_id,
-            email_id=payload.email_id,
-            first_name=payload.first_name,
-            last_name=payload.last_name,
-            subject=payload.subject,
-            body=payload.body,
-            attachment_name=None,
-            attachment_data=None,
+        if json_body:
+            return SubmitIn.model_validate_json(data)
+        return SubmitIn.model_validate(data)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)]
         )
-        db.add(rec)
+
+
+async def _receive_multipart(request: Request) -> tuple[SubmitIn, AttachmentRef | None]:
+    """Stream a multipart submission: the attachment goes to the blob store chunk by chunk.
+
+    Parsing and file writes run off the event loop, one chunk at a time, so
+    memory stays flat whatever the attachment size.
+    """
+    _, options = parse_options_header(request.headers["content-type"])
+    boundary = options.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status_code=400, detail={"message": "Missing multipart boundary"})
+    upload = MultipartSubmission(boundary, blob_store, ATTACHMENT_MAX_BYTES)
+    try:
+        async for chunk in request.stream():
+            await asyncio.to_thread(upload.write, chunk)
+        await asyncio.to_thread(upload.finish)
+    except BlobTooLarge as e:
+        raise HTTPException(status_code=413, detail={"message": str(e)})
+    except (UploadError, MultipartParseError) as e:
+        raise HTTPException(status_code=400, detail={"message": f"Malformed upload: {e}"})
+    finally:
+        upload.abort()
+    return _validate_submission(upload.fields), upload.attachment
+
+
+@app.post(
+    "/submit/batch",
+    response_model=SubmitBatchOut,
+    status_code=201,
+    tags=["Submissions"],
+    summary="Create complaint records in bulk",
+    description=(
+        f"Accepts a JSON array of up to {SUBMIT_BATCH_MAX} complaint payloads. All records and their outbox entries\n"
+        "are written with one multi-row insert per table in a single transaction, and the relay publishes them\n"
+        "to Kafka as a batch. Returns one id and status per item, in request order. If any item is invalid\n"
+        "the whole request is rejected with 422 and nothing is stored."
+    ),
+    responses={
+        500: {"description": "Database error. Please try again later."}
+    },
+)
+async def submit_batch(
+    request: Request,
+    payload: list[SubmitIn] = Body(..., min_length=1, max_length=SUBMIT_BATCH_MAX),
+):
+    logger.debug("Received batch submission of %d item(s)", len(payload))
+    with admission.admit(client_address(request)):
+        admission.check_senders(str(item.email_id) for item in payload)
+        items = [(str(uuid.uuid4()), item) for item in payload]
+        await _save(items)
+    metrics.SUBMISSIONS.labels(endpoint="submit_batch").inc(len(items))
+    relay.wake()
+    return {"items": [{"id": rec_id, "status": "saved", "warning": None} for rec_id, _ in items]}
+
+
+async def _save(*args) -> None:
+    """_save_records on the DB pool. Its time, including the wait for a worker, feeds admission control."""
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        await loop.run_in_executor(_db_executor, _save_records, *args)
+    finally:
+        admission.observe(time.perf_counter() - started)
+
+
+def _kafka_message(rec_id: str, payload: SubmitIn, attachment: AttachmentRef | None = None) -> dict:
+    message = {
+        "id": rec_id,
+        # Lets the consumer measure submit-to-email lag
+        "submitted_at": time.time(),
+        "email_id": str(payload.email_id),
+        "first_name": payload.first_name,
+        "last_name": payload.last_name,
+        "subject": payload.subject,
+        "body": payload.body,
+    }
+    if attachment is not None:
+        message["attachment"] = attachment.model_dump()
+    return message
+
+
+def _attachment_columns(attachment: AttachmentRef | None) -> dict:
+    # Order matches the trailing parameters of the insert_email prepared statement
+    return {
+        "attachment_name": attachment.name if attachment else None,
+        "attachment_ref": attachment.ref if attachment else None,
+        "attachment_size": attachment.size if attachment else None,
+    }
+
+
+def _save_records(
+    items: list[tuple[str, SubmitIn]], attachments: dict[str, AttachmentRef] | None = None,
+    claim: tuple[str, StoredResponse] | None = None,
+) -> None:
+    """Insert submission rows and their outbox entries in one transaction.
+
+    Each table costs one round trip however many items there are: a batch of
+    EXECUTEs of a prepared INSERT, or a multi-row INSERT when prepared statements
+    are off (DB_PREPARED_STATEMENTS=false or DB_PGBOUNCER=true).
+    Attachments, keyed by record id, are already in the blob store; only their
+    references are stored. An Idempotency-Key is claimed first, in the same
+    transaction; KeyTaken if it is already stored, and then nothing is written.
+    Runs on the submit-db pool, never on the event loop.
+    """
+    attachments = attachments or {}
+    db: Session = SessionLocal()
+    started = time.perf_counter()
+    try:
+        if claim is not None:
+            idempotency.claim(db, *claim)
+        if DB_PREPARED_STATEMENTS:
+            execute_prepared(db, "insert_email", [
+                (rec_id, str(payload.email_id), payload.first_name, payload.last_name,
+                 payload.subject, payload.body, *_attachment_columns(attachments.get(rec_id)).values())
+                for rec_id, payload in items
+            ])
+            execute_prepared(db, "insert_outbox", [
+                (rec_id, json.dumps(_kafka_message(rec_id, payload, attachments.get(rec_id))))
+                for rec_id, payload in items
+            ])
+        else:
+            db.execute(insert(EmailRecord), [
+                {
+                    "id": uuid.UUID(rec_id),
+                    "email_id": str(payload.email_id),
+                    "first_name": payload.first_name,
+                    "last_name": payload.last_name,
+                    "subject": payload.subject,
+                    "body": payload.body,
+                    **_attachment_columns(attachments.get(rec_id)),
+                }
+                for rec_id, payload in items
+            ])
+            db.execute(insert(OutboxEvent), [
+                {"record_id": uuid.UUID(rec_id), "payload": _kafka_message(rec_id, payload, attachments.get(rec_id))}
+                for rec_id, payload in items
+            ])
         db.commit()
-        logger.info("Saved record %s to database for %s", rec_id, payload.email_id)
+        metrics.DB_INSERT_SECONDS.observe(time.perf_counter() - started)
+        # The submitters' cached lists no longer include everything they sent
+        read_cache.invalidate({f"email:{payload.email_id}" for _, payload in items})
+        if len(items) == 1:
+            logger.debug("Saved record %s to database for %s", items[0][0], items[0][1].email_id)
+        else:
+            logger.debug("Saved %d records to database", len(items))
+    except KeyTaken:
+        db.rollback()
+        raise
     except Exception:
         db.rollback()
+        metrics.DB_INSERT_FAILURES.inc()
         logger.error("Database error while saving record: %s", traceback.format_exc())
         raise HTTPException(status_code=500, detail={"message": "Database error. Please try again later."})
     finally:
         db.close()
-
-    warning = None
-    last_err = None
-    for attempt in range(1, KAFKA_MAX_RETRIES + 1):
-        try:
-            publish({
-                "id": rec_id,
-                "email_id": str(payload.email_id),
-                "first_name": payload.first_name,
-                "last_name": payload.last_name,
-                "subject": payload.subject,
-                "body": payload.body,
-            })
-            logger.info("Published record %s to Kafka (attempt %d)", rec_id, attempt)
-            last_err = None
-            break
-        except Exception as e:
-            last_err = e
-            logger.error("Kafka publish failed for %s (attempt %d/%d): %s", rec_id, attempt, KAFKA_MAX_RETRIES, e)
-            traceback.print_exc()
-            if attempt < KAFKA_MAX_RETRIES:
-                time.sleep(RETRY_DELAY_SECONDS)
-    if last_err is not None:
-        warning = "Message not queued to Kafka."
-        logger.error("All Kafka publish attempts failed for %s", rec_id)
-
-    return {"id": rec_id, "status": "saved", "warning": warning}
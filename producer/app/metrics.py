@@ -0,0 +1,127 @@
+"""Prometheus metrics for the producer, served at GET /metrics."""
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Buckets span sub-millisecond local inserts up to multi-second broker stalls.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+SUBMISSIONS = Counter(
+    "producer_submissions_total",
+    "Complaints accepted, by endpoint",
+    ["endpoint"],
+)
+DB_INSERT_SECONDS = Histogram(
+    "producer_db_insert_seconds",
+    "Time to insert a submission (records and outbox rows) and commit",
+    buckets=LATENCY_BUCKETS,
+)
+DB_INSERT_FAILURES = Counter(
+    "producer_db_insert_failures_total",
+    "Submission inserts that were rolled back",
+)
+KAFKA_SEND_SECONDS = Histogram(
+    "producer_kafka_send_seconds",
+    "Time from send() to broker acknowledgement, per message",
+    buckets=LATENCY_BUCKETS,
+)
+KAFKA_SEND_FAILURES = Counter(
+    "producer_kafka_send_failures_total",
+    "Messages Kafka did not acknowledge",
+)
+OUTBOX_PUBLISHED = Counter(
+    "producer_outbox_published_total",
+    "Outbox rows delivered to Kafka and deleted",
+)
+OUTBOX_FAILURES = Counter(
+    "producer_outbox_failures_total",
+    "Outbox rows left in place after a failed publish",
+)
+OUTBOX_PARKED = Counter(
+    "producer_outbox_parked_total",
+    "Outbox rows set aside after OUTBOX_MAX_ATTEMPTS failed publishes; see outbox.failed_at",
+)
+OUTBOX_PENDING = Gauge(
+    "producer_outbox_pending",
+    "Outbox rows waiting to be published, sampled when /metrics is scraped",
+)
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "producer_db_pool_checkout_seconds",
+    "Time spent waiting for a pooled database connection",
+    buckets=LATENCY_BUCKETS,
+)
+DB_POOL_TIMEOUTS = Counter(
+    "producer_db_pool_timeouts_total",
+    "Checkouts that gave up after DB_POOL_TIMEOUT",
+)
+DB_POOL_SIZE = Gauge(
+    "producer_db_pool_max_connections",
+    "Connections the pool may open (pool size plus overflow)",
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "producer_db_pool_checked_out",
+    "Pooled connections currently in use; divide by producer_db_pool_max_connections for utilization",
+)
+
+READ_CACHE_LOOKUPS = Counter(
+    "producer_read_cache_lookups_total",
+    "Complaint read lookups, by where they were answered (local_hit, shared_hit, miss)",
+    ["result"],
+)
+READ_CACHE_ENTRIES = Gauge(
+    "producer_read_cache_entries",
+    "Responses held in this process's read cache",
+)
+DB_READ_SECONDS = Histogram(
+    "producer_db_read_seconds",
+    "Time to load a complaint or a list of complaints on a read cache miss",
+    buckets=LATENCY_BUCKETS,
+)
+NOT_MODIFIED = Counter(
+    "producer_read_not_modified_total",
+    "Complaint reads answered 304 because the client's ETag still matched",
+)
+
+IDEMPOTENT_REPLAYS = Counter(
+    "producer_idempotent_replays_total",
+    "Submissions answered with a stored response because their Idempotency-Key was already used",
+)
+IDEMPOTENCY_CONFLICTS = Counter(
+    "producer_idempotency_conflicts_total",
+    "Submissions refused because their Idempotency-Key was used for a different request",
+)
+
+SUBMISSIONS_SHED = Counter(
+    "producer_submissions_shed_total",
+    "Submission requests refused by admission control, by reason (in_flight, latency, client_rate, email_rate)",
+    ["reason"],
+)
+SUBMIT_IN_FLIGHT = Gauge(
+    "producer_submit_in_flight",
+    "Submission requests currently being processed",
+)
+SUBMIT_IN_FLIGHT_LIMIT = Gauge(
+    "producer_submit_in_flight_limit",
+    "Current in-flight submission limit, lowered while saves are slow",
+)
+
+PARTITIONS_CREATED = Counter(
+    "producer_partitions_created_total",
+    "Monthly emails partitions created ahead of time",
+)
+PARTITIONS_ARCHIVED = Counter(
+    "producer_partitions_archived_total",
+    "Monthly emails partitions written to the archive directory and dropped",
+)
+PARTITION_ARCHIVED_ROWS = Counter(
+    "producer_partition_archived_rows_total",
+    "Complaint rows moved from Postgres to archive files",
+)
+PARTITION_MAINTENANCE_FAILURES = Counter(
+    "producer_partition_maintenance_failures_total",
+    "Partition maintenance passes that failed and will be retried",
+)
+
+
+def render() -> tuple[bytes, str]:
+    """Current metrics in the Prometheus text format, with its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
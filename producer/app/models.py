@@ -1,11 +1,16 @@
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import Text, LargeBinary, TIMESTAMP, text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import DDL, Text, LargeBinary, TIMESTAMP, BigInteger, Integer, Computed, Index, event, text
+from sqlalchemy.dialects.postgresql import UUID, JSONB, TSVECTOR
 import uuid
 import datetime
 
 class Base(DeclarativeBase): pass
 
+# Full-text document for GET /complaints/search; subject matches rank above body matches
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('english', subject), 'A') || setweight(to_tsvector('english', body), 'B')"
+)
+
 class EmailRecord(Base):
     __tablename__ = "emails"
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -15,5 +20,60 @@ class EmailRecord(Base):
     subject: Mapped[str] = mapped_column(Text, nullable=False)
     body: Mapped[str] = mapped_column(Text, nullable=False)
     attachment_name: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Legacy inline attachments; new ones live in the blob store and only the reference is kept here
     attachment_data: Mapped[bytes | None] = mapped_column(LargeBinary(length=10 * 1024 * 1024), nullable=True)
-    submitted_at: Mapped[datetime.datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=text("NOW()"))
+    attachment_ref: Mapped[str | None] = mapped_column(Text, nullable=True)
+    attachment_size: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    # Partition key, so part of the table's primary key; set by Postgres on insert
+    submitted_at: Mapped[datetime.datetime] = mapped_column(
+        TIMESTAMP(timezone=True), primary_key=True, server_default=text("NOW()")
+    )
+    # Maintained by Postgres from subject and body; never written, and not loaded unless asked for
+    search_vector: Mapped[str | None] = mapped_column(
+        TSVECTOR, Computed(SEARCH_VECTOR_SQL, persisted=True), deferred=True
+    )
+
+    __table_args__ = (
+        # Keyset pagination on (submitted_at, id), newest first: all complaints, or one address's
+        Index("idx_emails_submitted_at_id", "submitted_at", "id"),
+        Index("idx_emails_email_id_submitted_at", "email_id", "submitted_at", "id"),
+        Index("idx_emails_search_vector", "search_vector", postgresql_using="gin"),
+        # One partition per month (emails_pYYYYMM), managed by app.partitions
+        {"postgresql_partition_by": "RANGE (submitted_at)"},
+    )
+    # Random UUIDs, unique in practice though the database only enforces (id, submitted_at) per
+    # partition; the ORM keeps identifying rows (and session.get()) by id alone
+    __mapper_args__ = {"primary_key": [id]}
+
+# Rows outside every monthly partition land here instead of failing the insert
+event.listen(
+    EmailRecord.__table__, "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS emails_default PARTITION OF emails DEFAULT"),
+)
+
+class OutboxEvent(Base):
+    """Kafka message waiting to be relayed; written in the same transaction as its EmailRecord."""
+    __tablename__ = "outbox"
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    record_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    payload: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default=text("0"))
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime.datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=text("NOW()"))
+    # A failed row waits until then for its next attempt
+    next_attempt_at: Mapped[datetime.datetime | None] = mapped_column(TIMESTAMP(timezone=True), nullable=True)
+    # Set once the row is parked after OUTBOX_MAX_ATTEMPTS; the relay no longer picks it up
+    failed_at: Mapped[datetime.datetime | None] = mapped_column(TIMESTAMP(timezone=True), nullable=True)
+
+class IdempotencyKey(Base):
+    """Response to a POST /submit sent with an Idempotency-Key; written with the complaint it created."""
+    __tablename__ = "idempotency_keys"
+    key: Mapped[str] = mapped_column(Text, primary_key=True)
+    # sha256 of the request, so reusing a key for a different complaint is refused
+    fingerprint: Mapped[str] = mapped_column(Text, nullable=False)
+    response: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=text("NOW()")
+    )
+
+    __table_args__ = (Index("idx_idempotency_keys_created_at", "created_at"),)
@@ -0,0 +1,172 @@
+import os
+import logging
+import datetime
+import threading
+from typing import Callable
+from kafka import errors as kafka_errors
+from sqlalchemy import func, or_, select, text
+from .db import SessionLocal
+from .models import OutboxEvent
+from .kafka_producer import publish_many
+from . import metrics
+
+logger = logging.getLogger("producer")
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))
+# A failed row waits OUTBOX_RETRY_DELAY seconds, doubling per attempt up to OUTBOX_RETRY_MAX_DELAY
+OUTBOX_RETRY_DELAY = float(os.getenv("OUTBOX_RETRY_DELAY", "1.0"))
+OUTBOX_RETRY_MAX_DELAY = float(os.getenv("OUTBOX_RETRY_MAX_DELAY", "60"))
+# Rows failing this often with an error that won't go away on its own are parked; 0 never parks
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+
+
+def ensure_outbox_schema(engine) -> None:
+    """Add the retry columns to an outbox table created before them (see sql/migrations/003)."""
+    with engine.begin() as conn:
+        present = set(conn.execute(text(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = 'outbox'"
+        )).scalars())
+        # Checked first, as ALTER TABLE locks out the relays of running replicas even when there is nothing to add
+        for column in ("next_attempt_at", "failed_at"):
+            if column not in present:
+                conn.execute(text(f"ALTER TABLE outbox ADD COLUMN IF NOT EXISTS {column} TIMESTAMPTZ"))
+
+
+# The message's own fault: invalid or unserializable payloads, and records the broker won't take
+_PERMANENT_ERRORS = (ValueError, TypeError, kafka_errors.MessageSizeTooLargeError, kafka_errors.RecordListTooLargeError)
+
+
+def _permanent(error: Exception) -> bool:
+    """Whether retrying error can't help. Timeouts and broker errors never park a row, however long they last."""
+    return isinstance(error, _PERMANENT_ERRORS)
+
+
+class OutboxRelay:
+    """Background thread that drains the outbox table to Kafka in batches.
+
+    Rows are claimed with FOR UPDATE SKIP LOCKED, so several producer replicas can
+    relay concurrently without publishing the same row twice. Each claimed batch is
+    handed to publish_many() as one pipelined send. A row is deleted only after
+    Kafka acknowledged it; a failed row stays in place with attempts and
+    last_error updated and is retried after an exponential backoff. A row that
+    fails max_attempts times with a permanent error (see _permanent) is parked:
+    failed_at is set and it is left for an operator instead of holding a slot in
+    every batch.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        publisher: Callable[[list[dict]], list[Exception | None]] = publish_many,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+        retry_delay: float = OUTBOX_RETRY_DELAY,
+        retry_max_delay: float = OUTBOX_RETRY_MAX_DELAY,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+    ):
+        self._session_factory = session_factory
+        self._publish = publisher
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.retry_max_delay = retry_max_delay
+        self.max_attempts = max_attempts
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def drain_once(self) -> int:
+        """Publish up to batch_size pending rows. Returns how many were published."""
+        db = self._session_factory()
+        try:
+            rows = db.execute(
+                select(OutboxEvent)
+                .where(OutboxEvent.failed_at.is_(None))
+                .where(or_(OutboxEvent.next_attempt_at.is_(None), OutboxEvent.next_attempt_at <= func.now()))
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).scalars().all()
+            if not rows:
+                return 0
+            # The publisher failing as a whole (e.g. no broker) is not any row's fault
+            may_park = True
+            try:
+                results = self._publish([row.payload for row in rows])
+            except Exception as e:
+                results, may_park = [e] * len(rows), False
+            published = parked = 0
+            for row, error in zip(rows, results):
+                if error is None:
+                    db.delete(row)
+                    published += 1
+                    continue
+                row.attempts += 1
+                row.last_error = str(error)[:1000]
+                if may_park and self.max_attempts and row.attempts >= self.max_attempts and _permanent(error):
+                    row.failed_at = func.now()
+                    parked += 1
+                    logger.error("Outbox relay parked record %s after %d attempts: %s", row.record_id, row.attempts, error)
+                    continue
+                delay = min(self.retry_max_delay, self.retry_delay * 2 ** (row.attempts - 1))
+                # On the database clock, which the drain query compares against
+                row.next_attempt_at = func.now() + datetime.timedelta(seconds=delay)
+                logger.warning("Outbox relay failed to publish record %s (attempt %d, retrying in %.0fs): %s",
+                               row.record_id, row.attempts, delay, error)
+            db.commit()
+            metrics.OUTBOX_PUBLISHED.inc(published)
+            metrics.OUTBOX_FAILURES.inc(len(rows) - published)
+            metrics.OUTBOX_PARKED.inc(parked)
+            if published:
+                logger.info("Outbox relay published %d message(s)", published)
+            return published
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def pending(self) -> int:
+        """Number of rows waiting in the outbox, not counting parked ones."""
+        db = self._session_factory()
+        try:
+            return db.execute(
+                select(func.count()).select_from(OutboxEvent).where(OutboxEvent.failed_at.is_(None))
+            ).scalar_one()
+        finally:
+            db.close()
+
+    def wake(self) -> None:
+        """Ask the relay to drain now instead of waiting for the next poll. Safe from any thread."""
+        self._wake.set()
+
+    def run(self) -> None:
+        logger.info("Outbox relay started (batch_size=%d, poll_interval=%.1fs)", self.batch_size, self.poll_interval)
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                drained = self.drain_once()
+            except Exception as e:
+                logger.error("Outbox relay pass failed: %s", e)
+                drained = 0
+            # A full batch means there is probably more waiting, so go again immediately.
+            if drained < self.batch_size:
+                self._wake.wait(self.poll_interval)
+        logger.info("Outbox relay stopped")
+
+    def start(self) -> threading.Thread:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True, name="OutboxRelay")
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: float = 10) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+
+
+relay = OutboxRelay()
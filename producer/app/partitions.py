@@ -0,0 +1,321 @@
+"""Monthly partitions of the emails table, and their retention.
+
+emails is range-partitioned on submitted_at into one table per calendar month
+(UTC), emails_pYYYYMM, plus emails_default for rows outside all of them. Inserts
+are unchanged: Postgres routes each row to its month. PartitionMaintainer keeps
+PARTITION_PRECREATE_MONTHS months ahead of the clock, so the default partition
+normally stays empty; a row that lands there anyway (a clock far off, a gap in
+maintenance) gets its month's partition on the next pass. With
+PARTITION_RETENTION_MONTHS set, it also detaches older months, writes each to
+PARTITION_ARCHIVE_DIR/emails_pYYYYMM.csv.gz and drops it: a month leaves in one
+cheap DROP instead of a DELETE and the vacuum that follows, and vacuum, index
+builds and backups only ever see live months.
+
+Postgres requires the partition key in every unique constraint, so the table's
+primary key is (id, submitted_at), and each partition has its own key index.
+A lookup by id alone therefore probes the key index of every partition: one
+index descent per month kept. Callers that know roughly when a row was
+submitted bound submitted_at with month_bounds() to read one partition. For the
+same reason nothing enforces that an id is unique across partitions; ids are
+random UUIDs, and only the ORM mapper identifies rows by id alone.
+
+Run `python -m app.partitions` to convert or maintain the table by hand.
+"""
+import os
+import re
+import gzip
+import logging
+import datetime
+import threading
+
+from sqlalchemy import text
+
+from .db import engine as default_engine
+from .models import EmailRecord
+from . import metrics
+
+logger = logging.getLogger("producer")
+
+# Months created ahead of the current one
+PARTITION_PRECREATE_MONTHS = int(os.getenv("PARTITION_PRECREATE_MONTHS", "3"))
+# Months kept in the database, counting the current one; older ones are archived. 0 keeps everything
+PARTITION_RETENTION_MONTHS = int(os.getenv("PARTITION_RETENTION_MONTHS", "0"))
+PARTITION_ARCHIVE_DIR = os.getenv("PARTITION_ARCHIVE_DIR", "/data/archive")
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "3600"))
+
+# Advisory lock held while partitions are changed, so only one replica does it at a time
+_LOCK_ID = 0x656D61696C73
+_MONTH_RE = re.compile(r"^emails_p(\d{4})(\d{2})$")
+# Everything but generated columns, which Postgres recomputes on insert
+_COLUMNS = [column.name for column in EmailRecord.__table__.columns if column.computed is None]
+
+
+def _utc_today() -> datetime.date:
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+
+def month_start(day: datetime.date) -> datetime.date:
+    return day.replace(day=1)
+
+
+def add_months(month: datetime.date, n: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + n
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def month_bounds(moment: datetime.datetime) -> tuple[datetime.datetime, datetime.datetime]:
+    """The bounds of the partition holding moment, for a submitted_at range. Naive times count as UTC."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    month = month_start(moment.astimezone(datetime.timezone.utc).date())
+    return tuple(
+        datetime.datetime.combine(m, datetime.time(), datetime.timezone.utc) for m in (month, add_months(month, 1))
+    )
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"emails_p{month:%Y%m}"
+
+
+def _bound(month: datetime.date) -> str:
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def _month_of(name: str) -> datetime.date | None:
+    match = _MONTH_RE.match(name)
+    return datetime.date(int(match[1]), int(match[2]), 1) if match else None
+
+
+def month_partitions(conn) -> dict[datetime.date, str]:
+    """Monthly partitions attached to emails, by month."""
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass('emails')"
+    )).scalars()
+    return {month: name for name in names if (month := _month_of(name)) is not None}
+
+
+def _detached_partitions(conn) -> dict[datetime.date, str]:
+    """Months detached by an archive pass that did not get to drop them."""
+    names = conn.execute(text(
+        "SELECT relname FROM pg_class WHERE relnamespace = to_regnamespace(current_schema()) "
+        "AND relkind = 'r' AND NOT relispartition AND relname LIKE 'emails\\_p%'"
+    )).scalars()
+    return {month: name for name in names if (month := _month_of(name)) is not None}
+
+
+def _default_months(conn) -> list[datetime.date]:
+    """Months with rows in the default partition, oldest first."""
+    firsts = conn.execute(text(
+        "SELECT DISTINCT date_trunc('month', submitted_at AT TIME ZONE 'UTC') FROM emails_default ORDER BY 1"
+    )).scalars()
+    return [first.date() for first in firsts]
+
+
+def create_partition(conn, month: datetime.date) -> bool:
+    """Create the partition for month unless it exists; True if it was created.
+
+    Rows for that month already in the default partition, written while the
+    partition was missing, are moved into it; Postgres refuses to create a
+    partition that overlaps rows in the default one.
+    """
+    name = partition_name(month)
+    if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+        return False
+    lower, upper = _bound(month), _bound(add_months(month, 1))
+    in_default = f"FROM emails_default WHERE submitted_at >= {lower} AND submitted_at < {upper}"
+    stranded = conn.exec_driver_sql(f"SELECT count(*) {in_default}").scalar()
+    if stranded:
+        conn.exec_driver_sql("ALTER TABLE emails DETACH PARTITION emails_default")
+    conn.exec_driver_sql(f"CREATE TABLE {name} PARTITION OF emails FOR VALUES FROM ({lower}) TO ({upper})")
+    if stranded:
+        columns = ", ".join(_COLUMNS)
+        conn.exec_driver_sql(
+            f"WITH moved AS (DELETE {in_default} RETURNING {columns}) "
+            f"INSERT INTO emails ({columns}) SELECT {columns} FROM moved"
+        )
+        conn.exec_driver_sql("ALTER TABLE emails ATTACH PARTITION emails_default DEFAULT")
+        logger.warning("Moved %d row(s) from emails_default into %s", stranded, name)
+    metrics.PARTITIONS_CREATED.inc()
+    logger.info("Created partition %s", name)
+    return True
+
+
+def _convert(conn, current: datetime.date) -> None:
+    """Replace a plain emails table with a partitioned one holding the same rows."""
+    logger.warning("Converting emails to a partitioned table; this copies every row once")
+    conn.exec_driver_sql("ALTER TABLE emails RENAME TO emails_unpartitioned")
+    # Free the names of its key and indexes for the new table; the old one is dropped below
+    conn.exec_driver_sql("ALTER TABLE emails_unpartitioned DROP CONSTRAINT IF EXISTS emails_pkey")
+    for index in EmailRecord.__table__.indexes:
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index.name}")
+    EmailRecord.__table__.create(conn)
+    first = conn.exec_driver_sql("SELECT min(submitted_at) FROM emails_unpartitioned").scalar()
+    month = month_start(first.astimezone(datetime.timezone.utc).date()) if first else current
+    while month < current:
+        create_partition(conn, month)
+        month = add_months(month, 1)
+    existing = set(conn.execute(text(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = 'emails_unpartitioned'"
+    )).scalars())
+    columns = [column for column in _COLUMNS if column in existing]
+    # The partition key can't be NULL; the old column could
+    values = ["COALESCE(submitted_at, NOW())" if column == "submitted_at" else column for column in columns]
+    copied = conn.exec_driver_sql(
+        f"INSERT INTO emails ({', '.join(columns)}) SELECT {', '.join(values)} FROM emails_unpartitioned"
+    ).rowcount
+    conn.exec_driver_sql("DROP TABLE emails_unpartitioned")
+    logger.warning("Copied %d row(s) into the partitioned emails table", copied)
+
+
+def ensure_partitions(engine, today: datetime.date | None = None,
+                      precreate_months: int = PARTITION_PRECREATE_MONTHS) -> None:
+    """Make emails partitioned, with partitions for this month and the next precreate_months.
+
+    A table created before partitioning is converted in one transaction that
+    blocks writes while it copies every row, so on a large table run
+    `python -m app.partitions` in a maintenance window first.
+    """
+    current = month_start(today or _utc_today())
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": _LOCK_ID})
+        kind = conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('emails')")).scalar()
+        if kind is None:
+            EmailRecord.__table__.create(conn)
+        elif kind == "r":
+            _convert(conn, current)
+        conn.exec_driver_sql("CREATE TABLE IF NOT EXISTS emails_default PARTITION OF emails DEFAULT")
+        for n in range(precreate_months + 1):
+            create_partition(conn, add_months(current, n))
+
+
+class PartitionMaintainer:
+    """Background thread that creates upcoming partitions and archives expired ones.
+
+    Each pass also gives every month found in emails_default its partition, so
+    stranded rows are archived with their month instead of staying behind.
+
+    A pass runs at start and then every `interval` seconds. It holds the
+    advisory lock, so with several producer replicas one of them does the work
+    and the others skip the pass.
+    """
+
+    def __init__(
+        self,
+        engine=default_engine,
+        archive_dir: str = PARTITION_ARCHIVE_DIR,
+        precreate_months: int = PARTITION_PRECREATE_MONTHS,
+        retention_months: int = PARTITION_RETENTION_MONTHS,
+        interval: float = PARTITION_MAINTENANCE_INTERVAL,
+        today=_utc_today,
+    ):
+        self._engine = engine
+        self.archive_dir = archive_dir
+        self.precreate_months = precreate_months
+        self.retention_months = retention_months
+        self.interval = interval
+        self._today = today
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def maintain_once(self) -> dict | None:
+        """One pass. Returns the partitions created and the archive files written, or None if
+        another replica holds the lock."""
+        with self._engine.connect() as conn:
+            locked = conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": _LOCK_ID}).scalar()
+            conn.commit()
+            if not locked:
+                return None
+            try:
+                current = month_start(self._today())
+                created = []
+                with conn.begin():
+                    # Months with stranded rows too, which moves them out of the default partition
+                    months = [add_months(current, n) for n in range(self.precreate_months + 1)]
+                    for month in sorted(set(months + _default_months(conn))):
+                        if create_partition(conn, month):
+                            created.append(partition_name(month))
+                archived = []
+                if self.retention_months > 0:
+                    cutoff = add_months(current, 1 - self.retention_months)
+                    attached = month_partitions(conn)
+                    expired = {**_detached_partitions(conn), **attached}
+                    conn.commit()
+                    for month in sorted(m for m in expired if m < cutoff):
+                        archived.append(self.archive(conn, expired[month], attached=month in attached))
+                return {"created": created, "archived": archived}
+            finally:
+                conn.rollback()
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _LOCK_ID})
+                conn.commit()
+
+    def archive(self, conn, name: str, attached: bool = True) -> str:
+        """Detach a month, write its rows to <archive_dir>/<name>.csv.gz and drop it. Returns the file.
+
+        Every step commits before the next one starts. A month detached but not
+        dropped is archived again by the next pass, so a crash in between loses
+        nothing.
+        """
+        if attached:
+            with conn.begin():
+                conn.exec_driver_sql(f"ALTER TABLE emails DETACH PARTITION {name}")
+            logger.info("Detached partition %s", name)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"{name}.csv.gz")
+        with conn.begin():
+            expected = conn.exec_driver_sql(f"SELECT count(*) FROM {name}").scalar()
+            query = f"SELECT {', '.join(_COLUMNS)} FROM {name} ORDER BY submitted_at, id"
+            cursor = conn.connection.driver_connection.cursor()
+            try:
+                with open(path + ".partial", "wb") as raw:
+                    with gzip.GzipFile(filename=f"{name}.csv", mode="wb", fileobj=raw) as out:
+                        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", out)
+                    raw.flush()
+                    os.fsync(raw.fileno())
+                written = cursor.rowcount
+            finally:
+                cursor.close()
+            if written != expected:
+                raise RuntimeError(f"Archived {written} of {expected} rows of {name}; keeping the table")
+            os.replace(path + ".partial", path)
+            conn.exec_driver_sql(f"DROP TABLE {name}")
+        metrics.PARTITIONS_ARCHIVED.inc()
+        metrics.PARTITION_ARCHIVED_ROWS.inc(written)
+        logger.info("Archived %d row(s) of %s to %s and dropped it", written, name, path)
+        return path
+
+    def run(self) -> None:
+        logger.info(
+            "Partition maintainer started (precreate=%d months, retention=%s, interval=%.0fs)",
+            self.precreate_months, f"{self.retention_months} months" if self.retention_months else "unlimited",
+            self.interval,
+        )
+        while not self._stop.is_set():
+            try:
+                self.maintain_once()
+            except Exception as e:
+                metrics.PARTITION_MAINTENANCE_FAILURES.inc()
+                logger.error("Partition maintenance pass failed: %s", e)
+            self._stop.wait(self.interval)
+        logger.info("Partition maintainer stopped")
+
+    def start(self) -> threading.Thread:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True, name="PartitionMaintainer")
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: float = 10) -> None:
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+
+
+maintainer = PartitionMaintainer()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    ensure_partitions(default_engine)
+    logger.info("Maintenance pass: %s", maintainer.maintain_once())
@@ -0,0 +1,164 @@
+"""Cache in front of the complaint read endpoints (GET /complaints...).
+
+Lookups try an in-process LRU first, then, if READ_CACHE_REDIS_URL is set, a
+Redis-compatible store shared by all replicas, and only then Postgres. Entries
+hold the encoded response body and its ETag, so a hit costs neither a query nor
+serialization. Complaints don't change once stored. The per-address lists do:
+a submit drops them here and in the shared store, and other replicas' copies
+expire after READ_CACHE_LIST_TTL_SECONDS.
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, NamedTuple
+
+from . import metrics
+
+logger = logging.getLogger("producer")
+
+READ_CACHE_SIZE = int(os.getenv("READ_CACHE_SIZE", "10000"))
+READ_CACHE_TTL_SECONDS = float(os.getenv("READ_CACHE_TTL_SECONDS", "300"))
+READ_CACHE_LIST_TTL_SECONDS = float(os.getenv("READ_CACHE_LIST_TTL_SECONDS", "30"))
+# e.g. redis://redis:6379/0; unset keeps the cache per process
+READ_CACHE_REDIS_URL = os.getenv("READ_CACHE_REDIS_URL")
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+
+    @classmethod
+    def of(cls, body: bytes) -> "CachedResponse":
+        return cls(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+
+class TTLCache:
+    """Thread-safe LRU whose entries also expire after their TTL."""
+
+    def __init__(self, maxsize: int = READ_CACHE_SIZE, clock=time.monotonic):
+        self.maxsize = maxsize
+        self._clock = clock
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SharedCache:
+    """Shared tier over a Redis-compatible client (get, set with ex=, delete).
+
+    Failures are logged and count as a miss, so an unreachable cache only costs
+    a database read.
+    """
+
+    def __init__(self, client, prefix: str = "producer:read:"):
+        self._client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> CachedResponse | None:
+        try:
+            raw = self._client.get(self.prefix + key)
+        except Exception as e:
+            logger.warning("Shared read cache get failed: %s", e)
+            return None
+        if raw is None:
+            return None
+        etag, _, body = bytes(raw).partition(b"\n")
+        return CachedResponse(body, etag.decode())
+
+    def set(self, key: str, value: CachedResponse, ttl: float) -> None:
+        try:
+            self._client.set(self.prefix + key, value.etag.encode() + b"\n" + value.body, ex=max(1, round(ttl)))
+        except Exception as e:
+            logger.warning("Shared read cache set failed: %s", e)
+
+    def delete(self, key: str) -> None:
+        try:
+            self._client.delete(self.prefix + key)
+        except Exception as e:
+            logger.warning("Shared read cache delete failed: %s", e)
+
+
+class ReadCache:
+    """The local LRU plus the optional shared tier.
+
+    get_local() is cheap enough for the event loop; load() and invalidate() may
+    talk to the shared store, so they run on the DB executor.
+    """
+
+    def __init__(self, local: TTLCache, shared: SharedCache | None = None):
+        self.local = local
+        self.shared = shared
+
+    def get_local(self, key: str) -> CachedResponse | None:
+        value = self.local.get(key)
+        if value is not None:
+            metrics.READ_CACHE_LOOKUPS.labels(result="local_hit").inc()
+        return value
+
+    def load(self, key: str, loader: Callable[[], bytes | None], ttl: float) -> CachedResponse | None:
+        """Fill the local tier from the shared one, or from loader() (None: not found, not cached)."""
+        value = self.shared.get(key) if self.shared is not None else None
+        if value is not None:
+            metrics.READ_CACHE_LOOKUPS.labels(result="shared_hit").inc()
+        else:
+            metrics.READ_CACHE_LOOKUPS.labels(result="miss").inc()
+            body = loader()
+            if body is None:
+                return None
+            value = CachedResponse.of(body)
+            if self.shared is not None:
+                self.shared.set(key, value, ttl)
+        self.local.set(key, value, ttl)
+        return value
+
+    def invalidate(self, keys) -> None:
+        for key in keys:
+            self.local.delete(key)
+            if self.shared is not None:
+                self.shared.delete(key)
+
+    def stats(self) -> dict:
+        return {"entries": len(self.local), "max_entries": self.local.maxsize, "shared": self.shared is not None}
+
+
+def _shared_cache() -> SharedCache | None:
+    if not READ_CACHE_REDIS_URL:
+        return None
+    import redis  # only needed with READ_CACHE_REDIS_URL
+    return SharedCache(redis.Redis.from_url(READ_CACHE_REDIS_URL, socket_timeout=0.5))
+
+
+read_cache = ReadCache(TTLCache(), _shared_cache())
+metrics.READ_CACHE_ENTRIES.set_function(lambda: len(read_cache.local))
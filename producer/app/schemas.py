@@ -1,5 +1,10 @@
+import os
+import uuid
+import datetime
 from pydantic import BaseModel, EmailStr, Field
 
+SUBMIT_BATCH_MAX = int(os.getenv("SUBMIT_BATCH_MAX", "500"))
+
 class SubmitIn(BaseModel):
     email_id: EmailStr = Field(..., description="Email address identifier")
     first_name: str = Field(..., min_length=1, max_length=100)
@@ -22,4 +27,40 @@ class SubmitIn(BaseModel):
 class SubmitOut(BaseModel):
     id: str
     status: str
-    warning: str | None = None
\ No newline at end of file
+    warning: str | None = None
+
+class SubmitBatchOut(BaseModel):
+    items: list[SubmitOut] = Field(..., description="One entry per submitted item, in request order")
+
+class AttachmentRef(BaseModel):
+    """Attachment kept in the blob store; this is all that travels through Kafka."""
+    ref: str = Field(..., description="Content address, sha256:<hex>")
+    name: str
+    size: int
+    content_type: str = "application/octet-stream"
+
+class ComplaintOut(BaseModel):
+    """A stored complaint; inline attachment bytes are never returned."""
+    id: uuid.UUID
+    email_id: str
+    first_name: str
+    last_name: str
+    subject: str
+    body: str
+    attachment_name: str | None = None
+    attachment_ref: str | None = None
+    attachment_size: int | None = None
+    submitted_at: datetime.datetime | None = None
+
+    model_config = {"from_attributes": True}
+
+class ComplaintListOut(BaseModel):
+    items: list[ComplaintOut] = Field(..., description="Most recent first")
+    next_cursor: str | None = Field(None, description="Pass as `cursor` for the next page; null on the last page")
+
+class ComplaintHit(ComplaintOut):
+    rank: float = Field(..., description="Relevance; subject matches weigh more than body matches")
+
+class ComplaintSearchOut(BaseModel):
+    items: list[ComplaintHit] = Field(..., description="Most relevant first")
+    next_cursor: str | None = Field(None, description="Pass as `cursor` for the next page; null on the last page")
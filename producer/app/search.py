@@ -0,0 +1,117 @@
+"""Listing and full-text search over emails, paged by keyset cursors.
+
+Pages continue from the last row of the previous one, (submitted_at, id) or
+(rank, submitted_at, id) for search, instead of an OFFSET, so page 1000 costs
+the same index range scan as page 1. Matching and relevance ranking run in
+Postgres over the generated search_vector column and its GIN index.
+"""
+import os
+import json
+import uuid
+import base64
+import logging
+import datetime
+from typing import NamedTuple
+
+from sqlalchemy import Float, Select, func, literal_column, select, text, tuple_
+
+from .models import SEARCH_VECTOR_SQL, EmailRecord
+
+logger = logging.getLogger("producer")
+
+# Searches rank at most this many matches, the most recent ones; 0 ranks every match
+SEARCH_RANK_WINDOW = int(os.getenv("SEARCH_RANK_WINDOW", "1000"))
+
+# Must match the configuration in SEARCH_VECTOR_SQL, or the GIN index can't be used
+_TS_CONFIG = literal_column("'english'::regconfig")
+
+
+class Cursor(NamedTuple):
+    """Sort key of the last row on a page; rank is only set for search pages."""
+    submitted_at: datetime.datetime
+    id: uuid.UUID
+    rank: float | None = None
+
+
+def encode_cursor(row, rank: float | None = None) -> str:
+    key = [row.submitted_at.isoformat(), str(row.id)] + ([rank] if rank is not None else [])
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, search: bool = False) -> Cursor:
+    """Parse a cursor from a previous page; ValueError if it is malformed or from the other endpoint."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if len(key) != (3 if search else 2):
+            raise ValueError("wrong length")
+        return Cursor(datetime.datetime.fromisoformat(key[0]), uuid.UUID(key[1]), float(key[2]) if search else None)
+    except (TypeError, ValueError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}") from None
+
+
+def page_query(columns, limit: int, email_id: str | None = None, after: Cursor | None = None) -> Select:
+    """Newest complaints first, optionally for one address; fetches limit + 1 rows to detect a next page."""
+    stmt = select(*columns)
+    if email_id is not None:
+        stmt = stmt.where(EmailRecord.email_id == email_id)
+    if after is not None:
+        stmt = stmt.where(tuple_(EmailRecord.submitted_at, EmailRecord.id) < tuple_(after.submitted_at, after.id))
+    return stmt.order_by(EmailRecord.submitted_at.desc(), EmailRecord.id.desc()).limit(limit + 1)
+
+
+def search_query(columns, q: str, limit: int, after: Cursor | None = None,
+                 window: int = SEARCH_RANK_WINDOW) -> Select:
+    """Complaints matching q (web search syntax: words, "phrases", OR, -word), most relevant first.
+
+    Ranking has to read every match it orders, so only the `window` most recent
+    matches are ranked (0 ranks them all). Postgres finds those through the GIN
+    index for rare terms, or by walking the (submitted_at, id) index for common
+    ones, so a search costs about the same whether it matches 50 rows or millions.
+    """
+    tsquery = func.websearch_to_tsquery(_TS_CONFIG, q)
+    keys = {column.key for column in columns}
+    sort_key = [column for column in (EmailRecord.submitted_at, EmailRecord.id) if column.key not in keys]
+    matches = select(*columns, *sort_key, EmailRecord.search_vector).where(
+        EmailRecord.search_vector.op("@@")(tsquery)
+    )
+    if window:
+        matches = matches.order_by(EmailRecord.submitted_at.desc(), EmailRecord.id.desc()).limit(window)
+    matches = matches.subquery("matches")
+    # float8, as the rank round-trips through the cursor; compared as float4 a tie could be skipped
+    rank = func.ts_rank_cd(matches.c.search_vector, tsquery).cast(Float(53))
+    stmt = select(*(matches.c[column.key] for column in columns), rank.label("rank"))
+    if after is not None:
+        stmt = stmt.where(
+            tuple_(rank, matches.c.submitted_at, matches.c.id) < tuple_(after.rank, after.submitted_at, after.id)
+        )
+    return stmt.order_by(rank.desc(), matches.c.submitted_at.desc(), matches.c.id.desc()).limit(limit + 1)
+
+
+def split_page(rows: list, limit: int, search: bool = False) -> tuple[list, str | None]:
+    """The rows to return and the cursor for the next page (None on the last page)."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1], rows[-1].rank if search else None)
+
+
+def ensure_search_schema(engine) -> None:
+    """Bring an emails table created before search existed up to date.
+
+    create_all() only creates missing tables. Adding the stored column rewrites
+    the table and building the indexes locks out writes for as long as it takes,
+    so on a large table apply sql/init.sql in a maintenance window first.
+    """
+    with engine.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = 'emails' AND column_name = 'search_vector'"
+        )).first()
+        if exists is None:
+            logger.warning("Adding emails.search_vector; this rewrites the emails table once")
+            conn.execute(text(
+                f"ALTER TABLE emails ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                f"GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED"
+            ))
+        for index in EmailRecord.__table__.indexes:
+            index.create(conn, checkfirst=True)
@@ -0,0 +1,66 @@
+"""Kafka value encodings for complaint messages.
+
+Every message carries a content-type header naming its encoding, so consumers
+pick the decoder per message and formats can be switched without a flag day:
+
+  * application/json     the original format; also assumed when the header is missing
+  * application/msgpack  the payload as a msgpack array in the field order of the
+                         schema named by the schema-id header: no field names on
+                         the wire, and a C decoder on the consumer side
+"""
+import os
+import json
+
+import msgpack
+
+KAFKA_MESSAGE_FORMAT = os.getenv("KAFKA_MESSAGE_FORMAT", "json")
+
+CONTENT_TYPE_HEADER = "content-type"
+SCHEMA_ID_HEADER = "schema-id"
+
+# Field order per schema id. Only ever append new schema ids; consumers must know
+# an id before producers start using it.
+SCHEMAS = {
+    1: ("id", "submitted_at", "email_id", "first_name", "last_name", "subject", "body", "attachment"),
+}
+CURRENT_SCHEMA_ID = 1
+
+
+class JsonSerializer:
+    content_type = "application/json"
+
+    def __init__(self):
+        self.headers = [(CONTENT_TYPE_HEADER, self.content_type.encode())]
+
+    def encode(self, payload: dict) -> bytes:
+        return json.dumps(payload).encode("utf-8")
+
+
+class MsgpackSerializer:
+    """Positional msgpack encoding; keys outside the schema travel in a trailing map."""
+
+    content_type = "application/msgpack"
+
+    def __init__(self, schema_id: int = CURRENT_SCHEMA_ID):
+        self.fields = SCHEMAS[schema_id]
+        self.headers = [
+            (CONTENT_TYPE_HEADER, self.content_type.encode()),
+            (SCHEMA_ID_HEADER, str(schema_id).encode()),
+        ]
+
+    def encode(self, payload: dict) -> bytes:
+        values = [payload.get(field) for field in self.fields]
+        extras = {k: v for k, v in payload.items() if k not in self.fields}
+        if extras:
+            values.append(extras)
+        return msgpack.packb(values, use_bin_type=True)
+
+
+_SERIALIZERS = {"json": JsonSerializer, "msgpack": MsgpackSerializer}
+
+
+def get_serializer(name: str = KAFKA_MESSAGE_FORMAT):
+    try:
+        return _SERIALIZERS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown KAFKA_MESSAGE_FORMAT '{name}'; expected one of {sorted(_SERIALIZERS)}")
@@ -0,0 +1,53 @@
+import os
+import logging
+from kafka.admin import KafkaAdminClient, NewPartitions, NewTopic
+from kafka.errors import TopicAlreadyExistsError
+
+logger = logging.getLogger("producer")
+
+# The partition count caps how many consumer instances in a group can do work at once.
+KAFKA_TOPIC_BOOTSTRAP = os.getenv("KAFKA_TOPIC_BOOTSTRAP", "true").lower() in {"1", "true", "yes", "on"}
+KAFKA_TOPIC_PARTITIONS = int(os.getenv("KAFKA_TOPIC_PARTITIONS", "6"))
+KAFKA_TOPIC_REPLICATION_FACTOR = int(os.getenv("KAFKA_TOPIC_REPLICATION_FACTOR", "1"))
+
+
+def _partition_count(admin: KafkaAdminClient, topic: str) -> int:
+    for meta in admin.describe_topics([topic]):
+        if meta["topic"] == topic and meta["error_code"] == 0:
+            return len(meta["partitions"])
+    return 0
+
+
+def ensure_topic(
+    topic: str | None = None,
+    partitions: int = KAFKA_TOPIC_PARTITIONS,
+    replication_factor: int = KAFKA_TOPIC_REPLICATION_FACTOR,
+    broker: str | None = None,
+    admin_factory=KafkaAdminClient,
+) -> int:
+    """Create the complaints topic with at least `partitions` partitions.
+
+    An existing topic with fewer partitions (for example one auto-created by the
+    broker on first publish) is grown; partitions are never removed. Growing a
+    topic moves some keys to new partitions, so per-recipient ordering is only
+    guaranteed from that point on. Returns the resulting partition count.
+    """
+    topic = topic or os.getenv("KAFKA_TOPIC", "complaints.v1")
+    broker = broker or os.getenv("KAFKA_BROKER", "kafka:9092")
+    admin = admin_factory(bootstrap_servers=broker, client_id="producer-topic-bootstrap")
+    try:
+        try:
+            admin.create_topics([NewTopic(topic, num_partitions=partitions, replication_factor=replication_factor)])
+            logger.info("Created topic '%s' with %d partition(s)", topic, partitions)
+            return partitions
+        except TopicAlreadyExistsError:
+            pass
+        current = _partition_count(admin, topic)
+        if current < partitions:
+            admin.create_partitions({topic: NewPartitions(total_count=partitions)})
+            logger.info("Grew topic '%s' from %d to %d partition(s)", topic, current, partitions)
+            return partitions
+        logger.info("Topic '%s' already has %d partition(s)", topic, current)
+        return current
+    finally:
+        admin.close()
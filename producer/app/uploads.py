@@ -0,0 +1,105 @@
+import os
+from multipart.multipart import MultipartParser, parse_options_header
+from .blob_store import ATTACHMENT_MAX_BYTES, BlobStore, BlobWriter
+from .schemas import AttachmentRef
+
+# Text fields are buffered in memory, so each is capped; only the attachment may be large.
+SUBMIT_MAX_FIELD_BYTES = int(os.getenv("SUBMIT_MAX_FIELD_BYTES", str(1024 * 1024)))
+ATTACHMENT_FIELD = "attachment"
+
+
+class UploadError(ValueError):
+    pass
+
+
+class MultipartSubmission:
+    """Incremental multipart/form-data parser for POST /submit.
+
+    Feed the raw request body to write() chunk by chunk. Text parts are collected
+    into `fields`; the attachment part is written straight to the blob store as
+    it arrives, so memory use does not grow with the attachment size.
+    """
+
+    def __init__(self, boundary: bytes, store: BlobStore, max_attachment_bytes: int = ATTACHMENT_MAX_BYTES):
+        self._store = store
+        self._max_attachment_bytes = max_attachment_bytes
+        self.fields: dict[str, str] = {}
+        self.attachment: AttachmentRef | None = None
+        self._writer: BlobWriter | None = None
+        self._reset_part()
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._reset_part,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _reset_part(self):
+        self._headers: dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._name = None
+        self._filename = None
+        self._content_type = None
+        self._buffer = bytearray()
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field, self._header_value = b"", b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        if self._name == ATTACHMENT_FIELD and filename:
+            self._filename = os.path.basename(filename.decode("utf-8", "replace"))
+            self._content_type = self._headers.get(b"content-type", b"application/octet-stream").decode("latin-1")
+            self._writer = self._store.writer(self._max_attachment_bytes)
+
+    def _on_part_data(self, data, start, end):
+        if self._writer is not None:
+            self._writer.write(data[start:end])
+        elif self._filename is None and self._name != ATTACHMENT_FIELD:
+            self._buffer += data[start:end]
+            if len(self._buffer) > SUBMIT_MAX_FIELD_BYTES:
+                raise UploadError(f"Field '{self._name}' exceeds {SUBMIT_MAX_FIELD_BYTES} bytes")
+
+    def _on_part_end(self):
+        if self._writer is not None:
+            writer, self._writer = self._writer, None
+            if self.attachment is not None:
+                writer.abort()
+                raise UploadError("Only one attachment is supported")
+            size = writer.size
+            self.attachment = AttachmentRef(
+                ref=writer.commit(), name=self._filename, size=size, content_type=self._content_type
+            )
+        elif self._name and self._name != ATTACHMENT_FIELD:
+            self.fields[self._name] = self._buffer.decode("utf-8", "replace")
+
+    def write(self, chunk: bytes) -> None:
+        try:
+            self._parser.write(chunk)
+        except Exception:
+            self.abort()
+            raise
+
+    def finish(self) -> None:
+        self._parser.finalize()
+        if self._writer is not None:
+            self.abort()
+            raise UploadError("Request body ended inside the attachment")
+
+    def abort(self) -> None:
+        if self._writer is not None:
+            self._writer.abort()
+            self._writer = None
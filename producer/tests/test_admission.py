@@ -0,0 +1,101 @@
+import pytest
+from types import SimpleNamespace
+from app import admission as admission_module
+from app.admission import AdmissionController, Shed, TokenBuckets, client_address
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _controller(**kwargs):
+    clock = FakeClock()
+    defaults = {
+        "max_in_flight": 4, "min_in_flight": 2, "latency_target": 1.0, "backoff": 0.5,
+        "by_client": TokenBuckets(0, 1, clock=clock), "by_email": TokenBuckets(0, 1, clock=clock),
+    }
+    return AdmissionController(**{**defaults, **kwargs}), clock
+
+
+def test_token_buckets_refill_and_take_all_or_nothing():
+    clock = FakeClock()
+    buckets = TokenBuckets(rate=2, burst=3, clock=clock)
+    assert buckets.take({"a": 3}) == 0
+    assert buckets.take({"a": 1}) == pytest.approx(0.5)
+    clock.now = 0.5
+    # b could pay, but a can't; neither is charged
+    assert buckets.take({"a": 2, "b": 3}) == pytest.approx(0.5)
+    assert buckets.take({"b": 3}) == 0
+    # More than the burst waits for a full bucket instead of forever
+    clock.now = 10
+    assert buckets.take({"a": 50}) == 0 and buckets.take({"a": 1}) == pytest.approx(0.5)
+
+
+def test_token_buckets_drop_the_least_recently_used_key():
+    buckets = TokenBuckets(rate=1, burst=1, maxsize=2, clock=FakeClock())
+    buckets.take({"a": 1})
+    buckets.take({"b": 1})
+    buckets.take({"c": 1})
+    assert len(buckets) == 2
+    assert buckets.take({"a": 1}) == 0      # forgotten, so full again
+    assert buckets.take({"c": 1}) == pytest.approx(1)
+
+
+def test_admit_sheds_past_the_in_flight_limit():
+    controller, _ = _controller()
+    with controller.admit("10.0.0.1"), controller.admit("10.0.0.2"), controller.admit(None), controller.admit(None):
+        with pytest.raises(Shed) as shed:
+            with controller.admit(None):
+                pass
+        assert (shed.value.status_code, shed.value.reason, shed.value.retry_after) == (503, "in_flight", 1)
+        assert controller.in_flight == 4
+    assert controller.in_flight == 0
+
+
+def test_slow_saves_lower_the_limit_and_fast_ones_raise_it():
+    controller, _ = _controller()
+    for _ in range(3):
+        controller.observe(5.0)
+    assert controller.limit == 2            # not below the floor
+    with controller.admit(None), controller.admit(None):
+        with pytest.raises(Shed) as shed:
+            with controller.admit(None):
+                pass
+    assert shed.value.reason == "latency"
+    controller.observe(0.1)
+    controller.observe(0.1)
+    assert controller.limit == 4
+    controller.observe(0.1)
+    assert controller.limit == 4
+
+
+def test_client_and_email_rates_answer_429_with_retry_after():
+    clock = FakeClock()
+    controller, _ = _controller(
+        by_client=TokenBuckets(rate=0.5, burst=1, clock=clock), by_email=TokenBuckets(rate=0.1, burst=2, clock=clock),
+    )
+    with controller.admit("10.0.0.1"):
+        pass
+    with pytest.raises(Shed) as shed:
+        with controller.admit("10.0.0.1"):
+            pass
+    assert (shed.value.status_code, shed.value.reason, shed.value.retry_after) == (429, "client_rate", 2)
+    assert controller.in_flight == 0
+    with controller.admit("10.0.0.2"):
+        controller.check_senders(["a@example.com", "b@example.com"])
+        with pytest.raises(Shed) as shed:
+            controller.check_senders(["a@example.com", "a@example.com"])
+        assert (shed.value.reason, shed.value.retry_after) == ("email_rate", 10)
+
+
+def test_client_address_uses_the_last_forwarded_hop(monkeypatch):
+    request = SimpleNamespace(
+        headers={"X-Forwarded-For": "1.2.3.4, 10.0.0.9"}, client=SimpleNamespace(host="172.16.0.2"),
+    )
+    assert client_address(request) == "172.16.0.2"
+    monkeypatch.setattr(admission_module, "SUBMIT_CLIENT_IP_HEADER", "X-Forwarded-For")
+    assert client_address(request) == "10.0.0.9"
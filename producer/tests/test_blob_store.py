@@ -0,0 +1,83 @@
+import hashlib
+import os
+import tracemalloc
+
+import pytest
+
+from app.blob_store import BlobStore, BlobTooLarge
+from app.uploads import MultipartSubmission, UploadError
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path))
+
+
+def test_writer_stores_content_addressed_and_dedupes(store):
+    data = b"hello attachment" * 1000
+    refs = []
+    for _ in range(2):
+        writer = store.writer(max_bytes=1 << 20)
+        for i in range(0, len(data), 4096):
+            writer.write(data[i:i + 4096])
+        refs.append(writer.commit())
+    digest = hashlib.sha256(data).hexdigest()
+    assert refs == [f"sha256:{digest}"] * 2
+    with open(store.path(refs[0]), "rb") as f:
+        assert f.read() == data
+    assert store.path(refs[0]).endswith(os.path.join(digest[:2], digest[2:4], digest))
+    assert os.listdir(store.tmp_dir) == []
+
+
+def test_writer_enforces_max_bytes(store):
+    writer = store.writer(max_bytes=10)
+    writer.write(b"12345")
+    with pytest.raises(BlobTooLarge):
+        writer.write(b"678901")
+    writer.abort()
+    assert os.listdir(store.tmp_dir) == []
+
+
+def test_path_rejects_invalid_refs(store):
+    with pytest.raises(ValueError):
+        store.path("sha256:../../etc/passwd")
+
+
+def _multipart(boundary, fields, file_chunks, filename="report.pdf"):
+    for name, value in fields.items():
+        yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n").encode()
+    yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"attachment\"; filename=\"{filename}\"\r\n"
+           "Content-Type: application/pdf\r\n\r\n").encode()
+    yield from file_chunks
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def test_multipart_submission_streams_attachment_with_flat_memory(store):
+    chunk = os.urandom(64 * 1024)
+    n_chunks = 16    # 1 MiB; tracemalloc makes the parser slow, so keep it small
+    digest = hashlib.sha256(chunk * n_chunks).hexdigest()
+    upload = MultipartSubmission(b"XyZ", store, max_attachment_bytes=64 << 20)
+
+    tracemalloc.start()
+    for part in _multipart("XyZ", {"email_id": "a@example.com", "subject": "Hi"}, (chunk for _ in range(n_chunks))):
+        upload.write(part)
+    upload.finish()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert peak < 512 * 1024          # never holds the whole attachment
+    assert upload.fields == {"email_id": "a@example.com", "subject": "Hi"}
+    assert upload.attachment.ref == f"sha256:{digest}"
+    assert upload.attachment.size == len(chunk) * n_chunks
+    assert upload.attachment.name == "report.pdf"
+    assert upload.attachment.content_type == "application/pdf"
+
+
+def test_multipart_submission_truncated_body_is_rejected(store):
+    upload = MultipartSubmission(b"XyZ", store)
+    parts = list(_multipart("XyZ", {}, [b"partial data"]))
+    for part in parts[:-1]:
+        upload.write(part)
+    with pytest.raises(UploadError):
+        upload.finish()
+    assert os.listdir(store.tmp_dir) == []
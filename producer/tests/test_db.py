@@ -61,3 +61,39 @@ def test_get_db_handles_incomplete_env(monkeypatch):
         import importlib
         import app.db
         importlib.reload(app.db)
+
+
+def test_engine_uses_timed_queue_pool():
+    from app.db import DB_MAX_OVERFLOW, DB_POOL_SIZE, TimedQueuePool
+    assert isinstance(engine.pool, TimedQueuePool)
+    assert engine.pool.size() == DB_POOL_SIZE
+    assert engine.pool._max_overflow == DB_MAX_OVERFLOW
+
+
+def test_pool_checkout_is_measured():
+    from app.metrics import DB_POOL_CHECKOUT_SECONDS
+
+    def count():
+        return next(s.value for m in DB_POOL_CHECKOUT_SECONDS.collect() for s in m.samples
+                    if s.name.endswith("_count"))
+
+    before = count()
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    assert count() == before + 1
+
+
+def test_execute_prepared_prepares_once_per_connection():
+    import uuid
+    from app.db import SessionLocal, execute_prepared
+
+    db = SessionLocal()
+    try:
+        ids = [str(uuid.uuid4()) for _ in range(3)]
+        execute_prepared(db, "insert_email", [(i, "p@example.com", "P", "S", "Subj", "Body", None, None, None) for i in ids[:2]])
+        execute_prepared(db, "insert_email", [(ids[2], "p@example.com", "P", "S", "Subj", "Body", None, None, None)])
+        assert db.execute(text("SELECT count(*) FROM pg_prepared_statements WHERE name = 'insert_email'")).scalar() == 1
+        assert db.execute(text("SELECT count(*) FROM emails WHERE id = ANY(CAST(:ids AS uuid[]))"), {"ids": ids}).scalar() == 3
+    finally:
+        db.rollback()
+        db.close()
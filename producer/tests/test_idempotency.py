@@ -0,0 +1,108 @@
+import asyncio
+import datetime
+import uuid
+import pytest
+from sqlalchemy import delete, update
+from app.db import SessionLocal
+from app.idempotency import IdempotencyStore, KeyLocks, KeyTaken, StoredResponse, fingerprint
+from app.models import IdempotencyKey
+from app.read_cache import TTLCache
+from app.schemas import AttachmentRef, SubmitIn
+
+PAYLOAD = SubmitIn(email_id="idem@example.com", first_name="Id", last_name="Em", subject="Once", body="Only once")
+
+
+@pytest.fixture
+def store():
+    key = f"test-{uuid.uuid4()}"
+    yield IdempotencyStore(cache=TTLCache(10), ttl=60), key
+    with SessionLocal() as db:
+        db.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+        db.commit()
+
+
+def _claim(store, key, stored):
+    with SessionLocal() as db:
+        store.claim(db, key, stored)
+        db.commit()
+
+
+def test_fingerprint_tells_requests_apart():
+    attachment = AttachmentRef(ref="sha256:" + "0" * 64, name="a.txt", size=1)
+    assert fingerprint(PAYLOAD) == fingerprint(SubmitIn(**PAYLOAD.model_dump()))
+    assert fingerprint(PAYLOAD) != fingerprint(PAYLOAD.model_copy(update={"body": "Twice"}))
+    assert fingerprint(PAYLOAD) != fingerprint(PAYLOAD, attachment)
+
+
+@pytest.mark.parametrize("prepared", [True, False])
+def test_claim_then_lookup_and_conflict(store, monkeypatch, prepared):
+    from app import idempotency
+    monkeypatch.setattr(idempotency, "DB_PREPARED_STATEMENTS", prepared)
+    store, key = store
+    stored = StoredResponse("f1", {"id": "1", "status": "saved", "warning": None})
+    assert store.lookup(key) is None
+    _claim(store, key, stored)
+    with pytest.raises(KeyTaken):
+        _claim(store, key, StoredResponse("f2", {"id": "2"}))
+    store.cache.clear()
+    assert store.lookup(key) == stored
+    assert store.get_cached(key) == stored
+
+
+def test_expired_key_is_reusable_and_purged(store):
+    store, key = store
+    _claim(store, key, StoredResponse("f1", {"id": "1"}))
+    with SessionLocal() as db:
+        db.execute(update(IdempotencyKey).where(IdempotencyKey.key == key)
+                   .values(created_at=datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=5)))
+        db.commit()
+    assert store.lookup(key) is None
+    _claim(store, key, StoredResponse("f2", {"id": "2"}))
+    assert store.lookup(key).response == {"id": "2"}
+    with SessionLocal() as db:
+        db.execute(update(IdempotencyKey).where(IdempotencyKey.key == key)
+                   .values(created_at=datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=5)))
+        db.commit()
+    assert store.purge_expired() >= 1
+    with SessionLocal() as db:
+        assert db.get(IdempotencyKey, key) is None
+
+
+def test_key_locks_serialize_one_key_and_clean_up():
+    locks = KeyLocks()
+    order = []
+
+    async def worker(key, n):
+        async with locks.hold(key):
+            order.append((key, n, "in"))
+            await asyncio.sleep(0.01)
+            order.append((key, n, "out"))
+
+    async def main():
+        await asyncio.gather(worker("a", 1), worker("a", 2), worker("b", 3))
+
+    asyncio.run(main())
+    a = [event for event in order if event[0] == "a"]
+    assert a == [("a", 1, "in"), ("a", 1, "out"), ("a", 2, "in"), ("a", 2, "out")]
+    # b did not wait for a
+    assert order.index(("b", 3, "in")) < order.index(("a", 1, "out"))
+    assert len(locks) == 0
+
+
+def test_lookup_caches_a_stored_key_only_until_it_expires(store):
+    _, key = store
+    now = [1000.0]
+    store = IdempotencyStore(cache=TTLCache(10, clock=lambda: now[0]), ttl=60)
+    stored = StoredResponse("f1", {"id": "1"})
+    _claim(store, key, stored)
+    store.cache.clear()
+    with SessionLocal() as db:
+        db.execute(update(IdempotencyKey).where(IdempotencyKey.key == key)
+                   .values(created_at=datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=50)))
+        db.commit()
+    assert store.lookup(key) == stored
+    now[0] += 8
+    assert store.get_cached(key) == stored
+    # Ten seconds were left of its minute in the table, not another whole minute
+    now[0] += 4
+    assert store.get_cached(key) is None
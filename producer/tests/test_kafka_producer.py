@@ -12,15 +12,7 @@ def valid_payload():
         "body": "This is a test message."
     }
 
-def test_publish_success(valid_payload):
-    with patch("app.kafka_producer._get_producer") as mock_get_producer:
-        mock_producer = MagicMock()
-        mock_get_producer.return_value = mock_producer
-        kafka_producer.publish(valid_payload)
-        mock_producer.send.assert_called_once()
-        mock_producer.flush.assert_called_once()
-
-def test_publish_missing_fields():
+def test_send_nowait_rejects_missing_fields():
     invalid_payload = {
         "email_id": "abc123",
         "first_name": "Harika",
@@ -28,39 +20,116 @@ def test_publish_missing_fields():
         "body": "This is a test message."
     }
     with pytest.raises(ValueError) as exc_info:
-        kafka_producer.publish(invalid_payload)
+        kafka_producer.send_nowait(invalid_payload).result(timeout=1)
     assert "Missing required fields" in str(exc_info.value)
 
-def test_publish_retries_on_failure(valid_payload):
-    with patch("app.kafka_producer._get_producer") as mock_get_producer:
-        mock_producer = MagicMock()
-        mock_producer.send.side_effect = Exception("Kafka is down")
-        mock_get_producer.return_value = mock_producer
-        with pytest.raises(Exception):
-            kafka_producer.publish(valid_payload)
 
-
-def test_publish_empty_payload():
-    empty_payload = {}
+def test_send_nowait_empty_payload():
     with pytest.raises(ValueError) as exc_info:
-        kafka_producer.publish(empty_payload)
+        kafka_producer.send_nowait({}).result(timeout=1)
     assert "Missing required fields" in str(exc_info.value)
 
 
-def test_publish_correct_topic(valid_payload):
+def test_send_nowait_sends_payload_to_topic(valid_payload):
     with patch("app.kafka_producer._get_producer") as mock_get_producer:
         mock_producer = MagicMock()
         mock_get_producer.return_value = mock_producer
-        kafka_producer.publish(valid_payload)
+        kafka_producer.send_nowait({**valid_payload, "email": "legacy@example.com"})
         args, kwargs = mock_producer.send.call_args
         assert args[0] == "complaints.v1"
+        assert args[1] == valid_payload
+        mock_producer.flush.assert_not_called()
 
 
-def test_publish_calls_send_with_correct_payload(valid_payload):
+def test_publish_many_pipelines_then_flushes_once(valid_payload):
+    from kafka.future import Future
     with patch("app.kafka_producer._get_producer") as mock_get_producer:
         mock_producer = MagicMock()
+        mock_producer.send.side_effect = lambda *a, **kw: Future().success("metadata")
         mock_get_producer.return_value = mock_producer
-        kafka_producer.publish(valid_payload)
-        args, kwargs = mock_producer.send.call_args
-        assert args[0] == "complaints.v1"
-        assert args[1] == valid_payload
+        results = kafka_producer.publish_many([valid_payload] * 5)
+        assert results == [None] * 5
+        assert mock_producer.send.call_count == 5
+        mock_producer.flush.assert_called_once()
+        mock_producer.send.return_value.get.assert_not_called()
+
+
+def test_publish_many_reports_per_message_errors(valid_payload):
+    from kafka.future import Future
+    from kafka.errors import KafkaTimeoutError
+    outcomes = iter([Future().success("md"), Future().failure(KafkaTimeoutError("slow")), Future()])
+    with patch("app.kafka_producer._get_producer") as mock_get_producer:
+        mock_producer = MagicMock()
+        mock_producer.send.side_effect = lambda *a, **kw: next(outcomes)
+        mock_get_producer.return_value = mock_producer
+        results = kafka_producer.publish_many([valid_payload, valid_payload, valid_payload], timeout=0.1)
+    assert results[0] is None
+    assert isinstance(results[1], KafkaTimeoutError)
+    assert isinstance(results[2], KafkaTimeoutError)  # never acknowledged
+
+
+def test_publish_many_closes_the_producer_when_nothing_got_through(valid_payload, monkeypatch):
+    from kafka.future import Future
+    from kafka.errors import KafkaTimeoutError
+    stale = MagicMock()
+    stale.send.side_effect = lambda *a, **kw: Future().failure(KafkaTimeoutError("down"))
+    stale.close.side_effect = RuntimeError("already closed")
+    monkeypatch.setattr(kafka_producer, "_producer", stale)
+    results = kafka_producer.publish_many([valid_payload, valid_payload], timeout=0.1)
+    assert all(isinstance(r, KafkaTimeoutError) for r in results)
+    stale.close.assert_called_once_with(timeout=0)
+    assert kafka_producer._producer is None
+
+
+def test_publish_many_invalid_payload_does_not_fail_batch(valid_payload):
+    from kafka.future import Future
+    with patch("app.kafka_producer._get_producer") as mock_get_producer:
+        mock_producer = MagicMock()
+        mock_producer.send.side_effect = lambda *a, **kw: Future().success("md")
+        mock_get_producer.return_value = mock_producer
+        results = kafka_producer.publish_many([valid_payload, {"email_id": "x"}])
+    assert results[0] is None
+    assert isinstance(results[1], ValueError)
+
+
+def test_send_nowait_resolves_future(valid_payload):
+    from kafka.future import Future
+    record_future = Future()
+    with patch("app.kafka_producer._get_producer") as mock_get_producer:
+        mock_get_producer.return_value.send.return_value = record_future
+        fut = kafka_producer.send_nowait(valid_payload)
+        assert not fut.done()
+        record_future.success("metadata")
+        assert fut.result(timeout=1) == "metadata"
+
+
+def test_send_nowait_records_latency_and_failures(valid_payload):
+    from kafka.future import Future
+    from app.metrics import KAFKA_SEND_FAILURES, KAFKA_SEND_SECONDS
+
+    def sample(metric, name):
+        return next(s.value for m in metric.collect() for s in m.samples if s.name == name)
+
+    sent_before = sample(KAFKA_SEND_SECONDS, "producer_kafka_send_seconds_count")
+    failed_before = sample(KAFKA_SEND_FAILURES, "producer_kafka_send_failures_total")
+    ok, bad = Future(), Future()
+    with patch("app.kafka_producer._get_producer") as mock_get_producer:
+        mock_get_producer.return_value.send.side_effect = [ok, bad]
+        kafka_producer.send_nowait(valid_payload)
+        kafka_producer.send_nowait(valid_payload)
+    ok.success("md")
+    bad.failure(RuntimeError("broker down"))
+    assert sample(KAFKA_SEND_SECONDS, "producer_kafka_send_seconds_count") == sent_before + 1
+    assert sample(KAFKA_SEND_FAILURES, "producer_kafka_send_failures_total") == failed_before + 1
+
+
+def test_messages_are_keyed_by_email_id(valid_payload, monkeypatch):
+    with patch("app.kafka_producer._get_producer") as mock_get_producer:
+        mock_producer = MagicMock()
+        mock_get_producer.return_value = mock_producer
+        kafka_producer.send_nowait(valid_payload)
+        assert mock_producer.send.call_args.kwargs["key"] == b"abc123"
+
+        monkeypatch.setattr(kafka_producer, "KAFKA_PARTITION_KEY", "")
+        kafka_producer.send_nowait(valid_payload)
+        assert mock_producer.send.call_args.kwargs["key"] is None
@@ -1,3 +1,7 @@
+import asyncio
+import os
+import uuid
+import pytest
 from fastapi.testclient import TestClient
 from app.main import app  # Ensure this path matches your actual app structure
 
@@ -152,33 +156,34 @@ def test_readiness_failure(monkeypatch):
     assert response.json()["detail"]["ok"] is False
 
 
-# Kafka retry logic in /submit
-def test_submit_kafka_retry(monkeypatch):
-    from app import main
-    attempt_counter = {"count": 0}
-
-    def dummy_publish(msg):
-        if attempt_counter["count"] < 1:
-            attempt_counter["count"] += 1
-            raise Exception("Simulated failure")
-        return True
-
-    monkeypatch.setattr(main, "publish", dummy_publish)
+# /submit writes the record and its outbox entry together and does not touch Kafka
+def test_submit_writes_outbox_entry():
+    from app.db import SessionLocal
+    from app.models import OutboxEvent
 
     payload = {
-        "email_id": "retry@example.com",
-        "first_name": "Retry",
-        "last_name": "Case",
-        "subject": "Kafka Retry",
-        "body": "This should pass after one failure"
+        "email_id": "outbox@example.com",
+        "first_name": "Out",
+        "last_name": "Box",
+        "subject": "Outbox",
+        "body": "Queued via the outbox"
     }
-
     response = client.post("/submit", json=payload)
     assert response.status_code == 201
-    assert response.json()["status"] == "saved"
-
-
+    data = response.json()
+    assert data["status"] == "saved"
+    assert data.get("warning") is None
 
+    db = SessionLocal()
+    try:
+        event = db.query(OutboxEvent).filter(OutboxEvent.payload["id"].astext == data["id"]).one()
+        assert str(event.record_id) == data["id"]
+        assert event.payload["email_id"] == "outbox@example.com"
+        assert isinstance(event.payload["submitted_at"], float)
+        db.delete(event)
+        db.commit()
+    finally:
+        db.close()
 
 
 # Test /health when DB connection fails (simulate SessionLocal.execute raising)
@@ -232,23 +237,6 @@ def test_readiness_db_ok_kafka_fails(monkeypatch):
     assert data["detail"]["kafka_ok"] is False
 
 
-# Test /submit when Kafka publish fails all retries
-def test_submit_kafka_fails_all_retries(monkeypatch):
-    from app import main
-    def always_fail_publish(msg): raise Exception("Kafka always fails")
-    monkeypatch.setattr(main, "publish", always_fail_publish)
-    payload = {
-        "email_id": "failkafka@example.com",
-        "first_name": "Fail",
-        "last_name": "Kafka",
-        "subject": "Kafka Failure",
-        "body": "Kafka should fail all retries"
-    }
-    response = client.post("/submit", json=payload)
-    assert response.status_code == 201
-    data = response.json()
-    assert data["status"] == "saved"
-    assert data.get("warning") == "Message not queued to Kafka."
 # Simulate DB failure during commit in /submit
 def test_submit_db_commit_failure(monkeypatch):
     from app import main
@@ -274,4 +262,416 @@ def test_submit_db_commit_failure(monkeypatch):
     assert response.status_code == 500
     data = response.json()
     assert "detail" in data
-    assert data["detail"].get("message") == "Database error. Please try again later."
\ No newline at end of file
+    assert data["detail"].get("message") == "Database error. Please try again later."
+
+def _batch_item(i):
+    return {
+        "email_id": f"batch{i}@example.com",
+        "first_name": "Batch",
+        "last_name": "Item",
+        "subject": f"Batch subject {i}",
+        "body": "Submitted in bulk"
+    }
+
+
+# Bulk submission: one multi-row INSERT per table, one id/status per item
+def test_submit_batch_success(monkeypatch):
+    from sqlalchemy import event
+    from app import main
+    from app.db import SessionLocal, engine
+    from app.models import EmailRecord, OutboxEvent
+
+    monkeypatch.setattr(main, "DB_PREPARED_STATEMENTS", False)
+
+    statements = []
+    def capture(conn, cursor, statement, params, context, executemany):
+        if statement.lstrip().upper().startswith("INSERT"):
+            statements.append(statement)
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        response = client.post("/submit/batch", json=[_batch_item(i) for i in range(25)])
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    assert response.status_code == 201
+    items = response.json()["items"]
+    assert len(items) == 25
+    assert all(item["status"] == "saved" for item in items)
+    assert len({item["id"] for item in items}) == 25
+    assert sum("INSERT INTO emails" in s for s in statements) == 1
+    assert sum("INSERT INTO outbox" in s for s in statements) == 1
+
+    db = SessionLocal()
+    try:
+        ids = [item["id"] for item in items]
+        rows = {str(r.id): r for r in db.query(EmailRecord).filter(EmailRecord.id.in_(ids)).all()}
+        assert rows[ids[3]].email_id == "batch3@example.com"
+        events = db.query(OutboxEvent).filter(OutboxEvent.record_id.in_(ids)).all()
+        assert len(events) == 25
+        for e in events:
+            db.delete(e)
+        db.commit()
+    finally:
+        db.close()
+
+
+# Same, through the prepared INSERT statements
+def test_submit_batch_prepared_statements(monkeypatch):
+    from app import main
+    from app.db import SessionLocal
+    from app.models import EmailRecord, OutboxEvent
+
+    monkeypatch.setattr(main, "DB_PREPARED_STATEMENTS", True)
+    response = client.post("/submit/batch", json=[_batch_item(i) for i in range(5)])
+    assert response.status_code == 201
+    ids = [item["id"] for item in response.json()["items"]]
+
+    db = SessionLocal()
+    try:
+        rows = {str(r.id): r for r in db.query(EmailRecord).filter(EmailRecord.id.in_(ids)).all()}
+        assert rows[ids[2]].email_id == "batch2@example.com"
+        assert rows[ids[2]].attachment_data is None
+        events = db.query(OutboxEvent).filter(OutboxEvent.record_id.in_(ids)).all()
+        assert sorted(e.payload["id"] for e in events) == sorted(ids)
+        for e in events:
+            db.delete(e)
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_submit_batch_rejects_invalid_item():
+    batch = [_batch_item(0), {**_batch_item(1), "email_id": "not-an-email"}]
+    response = client.post("/submit/batch", json=batch)
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"][:2] == ["body", 1]
+
+
+def test_submit_batch_rejects_empty_and_oversized():
+    from app.schemas import SUBMIT_BATCH_MAX
+    assert client.post("/submit/batch", json=[]).status_code == 422
+    too_many = [_batch_item(i) for i in range(SUBMIT_BATCH_MAX + 1)]
+    assert client.post("/submit/batch", json=too_many).status_code == 422
+
+
+def test_submit_batch_db_failure(monkeypatch):
+    from app import main
+    class DummySessionFail:
+        def execute(self, *a, **kw): raise Exception("Simulated DB failure")
+        def commit(self): pass
+        def close(self): pass
+        def rollback(self): pass
+    monkeypatch.setattr(main, "SessionLocal", lambda: DummySessionFail())
+    response = client.post("/submit/batch", json=[_batch_item(0), _batch_item(1)])
+    assert response.status_code == 500
+    assert response.json()["detail"]["message"] == "Database error. Please try again later."
+
+
+def test_metrics_endpoint_reports_submissions():
+    payload = {
+        "email_id": "metrics@example.com",
+        "first_name": "Met",
+        "last_name": "Rics",
+        "subject": "Metrics",
+        "body": "Counted"
+    }
+    assert client.post("/submit", json=payload).status_code == 201
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert 'producer_submissions_total{endpoint="submit"}' in text
+    assert "producer_db_insert_seconds_count" in text
+    assert "producer_outbox_pending" in text
+
+
+# Multipart /submit: the attachment is streamed to the blob store and only referenced
+def _multipart_fields():
+    return {
+        "email_id": "upload@example.com",
+        "first_name": "Up",
+        "last_name": "Load",
+        "subject": "With attachment",
+        "body": "See attached",
+    }
+
+
+@pytest.mark.parametrize("prepared", [True, False])
+def test_submit_multipart_with_attachment(monkeypatch, tmp_path, prepared):
+    import hashlib
+    from app import main
+    from app.blob_store import BlobStore
+    from app.db import SessionLocal
+    from app.models import EmailRecord, OutboxEvent
+
+    monkeypatch.setattr(main, "blob_store", BlobStore(str(tmp_path)))
+    monkeypatch.setattr(main, "DB_PREPARED_STATEMENTS", prepared)
+    content = b"%PDF-1.4 fake" * 5000
+    response = client.post(
+        "/submit",
+        data=_multipart_fields(),
+        files={"attachment": ("report.pdf", content, "application/pdf")},
+    )
+    assert response.status_code == 201
+    rec_id = response.json()["id"]
+    ref = "sha256:" + hashlib.sha256(content).hexdigest()
+
+    db = SessionLocal()
+    try:
+        record = db.get(EmailRecord, uuid.UUID(rec_id))
+        assert (record.attachment_name, record.attachment_ref, record.attachment_size) == ("report.pdf", ref, len(content))
+        assert record.attachment_data is None
+        event = db.query(OutboxEvent).filter(OutboxEvent.record_id == uuid.UUID(rec_id)).one()
+        assert event.payload["attachment"] == {
+            "ref": ref, "name": "report.pdf", "size": len(content), "content_type": "application/pdf"
+        }
+        db.delete(event)
+        db.commit()
+    finally:
+        db.close()
+    with open(main.blob_store.path(ref), "rb") as f:
+        assert f.read() == content
+
+
+def test_submit_multipart_without_attachment(monkeypatch, tmp_path):
+    from app import main
+    from app.blob_store import BlobStore
+
+    monkeypatch.setattr(main, "blob_store", BlobStore(str(tmp_path)))
+    response = client.post("/submit", data=_multipart_fields())
+    assert response.status_code == 201
+
+
+def test_submit_multipart_invalid_field(monkeypatch, tmp_path):
+    from app import main
+    from app.blob_store import BlobStore
+
+    monkeypatch.setattr(main, "blob_store", BlobStore(str(tmp_path)))
+    response = client.post("/submit", data={**_multipart_fields(), "email_id": "nope"})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "email_id"]
+
+
+def test_submit_multipart_attachment_too_large(monkeypatch, tmp_path):
+    from app import main
+    from app.blob_store import BlobStore
+
+    monkeypatch.setattr(main, "blob_store", BlobStore(str(tmp_path)))
+    monkeypatch.setattr(main, "ATTACHMENT_MAX_BYTES", 1000)
+    response = client.post(
+        "/submit",
+        data=_multipart_fields(),
+        files={"attachment": ("big.bin", b"x" * 5000, "application/octet-stream")},
+    )
+    assert response.status_code == 413
+    assert os.listdir(os.path.join(tmp_path, "tmp")) == []
+
+
+def _submit(email_id, subject="Read me", body="Body"):
+    response = client.post("/submit", json={
+        "email_id": email_id, "first_name": "Ada", "last_name": "L", "subject": subject, "body": body,
+    })
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+def test_get_complaint_by_id_with_etag_and_cache(monkeypatch):
+    from app import main
+    rec_id = _submit(f"reader-{uuid.uuid4().hex[:8]}@example.com")
+
+    response = client.get(f"/complaints/{rec_id}")
+    assert response.status_code == 200
+    assert response.json()["id"] == rec_id and response.json()["subject"] == "Read me"
+    etag = response.headers["etag"]
+
+    # Cached now: served without a database session
+    monkeypatch.setattr(main, "SessionLocal", lambda: pytest.fail("hit the database"))
+    again = client.get(f"/complaints/{rec_id}", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.headers["etag"] == etag and again.content == b""
+    assert client.get(f"/complaints/{rec_id}").json() == response.json()
+
+
+def test_get_complaint_with_a_submitted_at_hint(monkeypatch):
+    from app import main
+    rec_id = _submit(f"hinted-{uuid.uuid4().hex[:8]}@example.com")
+    submitted_at = client.get(f"/complaints/{rec_id}").json()["submitted_at"]
+    main.read_cache.invalidate([f"id:{rec_id}"])
+    reads, read = [], main._read
+    monkeypatch.setattr(main, "_read", lambda stmt, one=False: reads.append(str(stmt)) or read(stmt, one))
+
+    assert client.get(f"/complaints/{rec_id}", params={"submitted_at": submitted_at}).json()["id"] == rec_id
+    assert len(reads) == 1 and "emails.submitted_at >= " in reads[0]
+    # A hint in the wrong month still finds it, with a second lookup by id alone
+    main.read_cache.invalidate([f"id:{rec_id}"])
+    reads.clear()
+    assert client.get(f"/complaints/{rec_id}", params={"submitted_at": "2001-01-01T00:00:00Z"}).status_code == 200
+    assert len(reads) == 2 and "submitted_at" not in reads[1].split("WHERE")[1]
+
+
+def test_get_complaint_unknown_and_malformed_id():
+    assert client.get(f"/complaints/{uuid.uuid4()}").status_code == 404
+    assert client.get("/complaints/not-a-uuid").status_code == 422
+
+
+def test_list_complaints_by_email_refreshes_after_submit():
+    email = f"lister-{uuid.uuid4().hex[:8]}@example.com"
+    first = _submit(email, subject="First")
+    response = client.get("/complaints", params={"email_id": email})
+    assert [item["id"] for item in response.json()["items"]] == [first]
+    etag = response.headers["etag"]
+
+    second = _submit(email, subject="Second")
+    response = client.get("/complaints", params={"email_id": email}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert [item["id"] for item in response.json()["items"]] == [second, first]
+
+    assert client.get("/complaints", params={"email_id": "not-an-email"}).status_code == 422
+
+
+def test_search_ranks_subject_matches_first_and_pages_by_cursor():
+    word = f"zq{uuid.uuid4().hex[:10]}"
+    body_hit = _submit(f"s1-{word}@example.com", subject="Billing", body=f"Charged twice for {word}")
+    _submit(f"s2-{word}@example.com", subject=f"Problem with {word}")
+
+    first = client.get("/complaints/search", params={"q": word, "limit": 1}).json()
+    assert first["items"][0]["subject"] == f"Problem with {word}"
+    second = client.get("/complaints/search", params={"q": word, "limit": 1, "cursor": first["next_cursor"]}).json()
+    assert [item["id"] for item in second["items"]] == [body_hit]
+    assert second["items"][0]["rank"] < first["items"][0]["rank"]
+    assert second["next_cursor"] is None
+
+    assert client.get("/complaints/search", params={"q": f"{word} -problem"}).json()["items"][0]["id"] == body_hit
+    assert client.get("/complaints/search", params={"q": word, "cursor": "bogus"}).status_code == 400
+
+
+def test_search_pages_through_rank_ties_without_gaps():
+    word = f"zq{uuid.uuid4().hex[:10]}"
+    # Identical documents rank the same, at a value float4 can't represent exactly
+    ids = {_submit(f"tie{i}-{word}@example.com", subject="Refund", body=f"Charged twice for {word}") for i in range(5)}
+
+    seen, ranks, cursor = [], set(), None
+    while True:
+        params = {"q": word, "limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/complaints/search", params=params).json()
+        seen += [item["id"] for item in page["items"]]
+        ranks |= {item["rank"] for item in page["items"]}
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(ranks) == 1
+    assert len(seen) == len(ids) and set(seen) == ids
+
+
+def test_list_complaints_pages_newest_first_without_gaps():
+    email = f"pager-{uuid.uuid4().hex[:8]}@example.com"
+    ids = [_submit(email, subject=f"Page {i}") for i in range(5)]
+
+    seen, cursor = [], None
+    while True:
+        params = {"email_id": email, "limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/complaints", params=params).json()
+        seen += [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == ids[::-1]
+
+    recent = client.get("/complaints", params={"limit": 1}).json()
+    assert recent["items"][0]["id"] == ids[-1] and recent["next_cursor"]
+
+
+def _idempotent_payload(email):
+    return {"email_id": email, "first_name": "Re", "last_name": "Try", "subject": "Timeout", "body": "Sent twice"}
+
+
+def _stored_rows(email):
+    from sqlalchemy import func, select
+    from app.db import SessionLocal
+    from app.models import EmailRecord, OutboxEvent
+    with SessionLocal() as db:
+        return (
+            db.scalar(select(func.count()).select_from(EmailRecord).where(EmailRecord.email_id == email)),
+            db.scalar(select(func.count()).select_from(OutboxEvent).where(OutboxEvent.payload["email_id"].astext == email)),
+        )
+
+
+def test_submit_idempotency_key_replays_the_first_response(monkeypatch):
+    from app import main
+    email = f"retry-{uuid.uuid4().hex[:8]}@example.com"
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    first = client.post("/submit", json=_idempotent_payload(email), headers=headers)
+    assert first.status_code == 201 and "Idempotent-Replayed" not in first.headers
+
+    replay = client.post("/submit", json=_idempotent_payload(email), headers=headers)
+    assert replay.status_code == 201
+    assert replay.json() == first.json() and replay.headers["Idempotent-Replayed"] == "true"
+    # From the table too, not only the in-process cache
+    main.idempotency.cache.clear()
+    assert client.post("/submit", json=_idempotent_payload(email), headers=headers).json() == first.json()
+    assert _stored_rows(email) == (1, 1)
+
+    other = client.post("/submit", json={**_idempotent_payload(email), "body": "Changed"}, headers=headers)
+    assert other.status_code == 422 and "different request" in other.json()["detail"]["message"]
+    assert client.post("/submit", json=_idempotent_payload(email), headers={"Idempotency-Key": "x" * 256}).status_code == 422
+
+
+def test_submit_collapses_concurrent_duplicates():
+    import httpx
+    from app import main
+    email = f"burst-{uuid.uuid4().hex[:8]}@example.com"
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+
+    async def burst():
+        async with httpx.AsyncClient(app=main.app, base_url="http://test") as http:
+            return await asyncio.gather(*[
+                http.post("/submit", json=_idempotent_payload(email), headers=headers) for _ in range(5)
+            ])
+
+    responses = asyncio.run(burst())
+    assert {r.status_code for r in responses} == {201}
+    assert len({r.json()["id"] for r in responses}) == 1
+    assert sum("Idempotent-Replayed" in r.headers for r in responses) == 4
+    assert _stored_rows(email) == (1, 1)
+    assert len(main.idempotency.locks) == 0
+
+
+def test_save_records_refuses_a_key_stored_by_another_replica():
+    from app import main
+    from app.idempotency import KeyTaken, StoredResponse
+    from app.schemas import SubmitIn
+    email = f"replica-{uuid.uuid4().hex[:8]}@example.com"
+    key = str(uuid.uuid4())
+    payload = SubmitIn(**_idempotent_payload(email))
+    main._save_records([(str(uuid.uuid4()), payload)], claim=(key, StoredResponse("f", {"id": "1"})))
+    with pytest.raises(KeyTaken):
+        main._save_records([(str(uuid.uuid4()), payload)], claim=(key, StoredResponse("f", {"id": "2"})))
+    assert _stored_rows(email) == (1, 1)
+
+
+def test_submit_sheds_load_with_retry_after(monkeypatch):
+    from app import main
+    from app.admission import AdmissionController, TokenBuckets
+    monkeypatch.setattr(main, "admission", AdmissionController(
+        max_in_flight=0, by_client=TokenBuckets(0, 1), by_email=TokenBuckets(0, 1),
+    ))
+    response = client.post("/submit", json=_idempotent_payload("shed@example.com"))
+    assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+    assert "in progress" in response.json()["detail"]["message"]
+    assert 'producer_submissions_shed_total{reason="in_flight"}' in client.get("/metrics").text
+
+
+def test_submit_rate_limits_each_email_address(monkeypatch):
+    from app import main
+    from app.admission import AdmissionController, TokenBuckets
+    monkeypatch.setattr(main, "admission", AdmissionController(
+        by_client=TokenBuckets(0, 1), by_email=TokenBuckets(rate=0.01, burst=2),
+    ))
+    email = f"flood-{uuid.uuid4().hex[:8]}@example.com"
+    assert client.post("/submit", json=_idempotent_payload(email)).status_code == 201
+    batch = client.post("/submit/batch", json=[_idempotent_payload(email), _idempotent_payload(email), _batch_item(1)])
+    assert batch.status_code == 429 and int(batch.headers["Retry-After"]) == 100
+    assert client.post("/submit", json=_idempotent_payload(email)).status_code == 201
+    limited = client.post("/submit", json=_idempotent_payload(email))
+    assert limited.status_code == 429 and "email address" in limited.json()["detail"]["message"]
+    assert _stored_rows(email) == (2, 2)
+    assert main.admission.in_flight == 0
@@ -0,0 +1,140 @@
+import uuid
+import pytest
+from sqlalchemy import delete
+from app.db import SessionLocal
+from app.models import OutboxEvent
+from app.outbox import OutboxRelay
+
+
+@pytest.fixture
+def clean_outbox():
+    db = SessionLocal()
+    db.execute(delete(OutboxEvent))
+    db.commit()
+    yield db
+    db.execute(delete(OutboxEvent))
+    db.commit()
+    db.close()
+
+
+def _add_events(db, n):
+    ids = []
+    for i in range(n):
+        rec_id = uuid.uuid4()
+        db.add(OutboxEvent(record_id=rec_id, payload={
+            "id": str(rec_id),
+            "email_id": f"user{i}@example.com",
+            "first_name": "Out",
+            "last_name": "Box",
+            "subject": f"Subject {i}",
+            "body": "Body",
+        }))
+        ids.append(str(rec_id))
+    db.commit()
+    return ids
+
+
+def _recorder(sent):
+    def publish_many(payloads):
+        sent.extend(payloads)
+        return [None] * len(payloads)
+    return publish_many
+
+
+def test_drain_once_publishes_in_order_and_deletes(clean_outbox):
+    ids = _add_events(clean_outbox, 3)
+    sent = []
+    relay = OutboxRelay(publisher=_recorder(sent), batch_size=10)
+    assert relay.drain_once() == 3
+    assert [m["id"] for m in sent] == ids
+    assert clean_outbox.query(OutboxEvent).count() == 0
+
+
+def test_drain_once_respects_batch_size(clean_outbox):
+    _add_events(clean_outbox, 5)
+    sent = []
+    relay = OutboxRelay(publisher=_recorder(sent), batch_size=2)
+    assert relay.pending() == 5
+    assert relay.drain_once() == 2
+    assert relay.drain_once() == 2
+    assert relay.drain_once() == 1
+    assert relay.drain_once() == 0
+    assert len(sent) == 5
+
+
+def test_drain_once_keeps_failed_rows(clean_outbox):
+    ids = _add_events(clean_outbox, 3)
+
+    def partial(payloads):
+        return [None, RuntimeError("broker down"), None]
+
+    relay = OutboxRelay(publisher=partial, batch_size=10)
+    assert relay.drain_once() == 2
+    clean_outbox.expire_all()
+    rows = clean_outbox.query(OutboxEvent).all()
+    assert [str(r.record_id) for r in rows] == [ids[1]]
+    assert rows[0].attempts == 1
+    assert "broker down" in rows[0].last_error
+
+
+def test_drain_once_publisher_exception_fails_whole_batch(clean_outbox):
+    _add_events(clean_outbox, 2)
+
+    def boom(payloads):
+        raise RuntimeError("no producer")
+
+    relay = OutboxRelay(publisher=boom, batch_size=10)
+    assert relay.drain_once() == 0
+    clean_outbox.expire_all()
+    assert [r.attempts for r in clean_outbox.query(OutboxEvent).all()] == [1, 1]
+
+
+def test_failed_rows_back_off_and_permanent_failures_are_parked(clean_outbox):
+    from kafka.errors import KafkaTimeoutError
+    ids = _add_events(clean_outbox, 3)
+    attempts = []
+
+    def poison(payloads):
+        attempts.append([m["id"] for m in payloads])
+        return [ValueError("payload too large") if m["id"] == ids[0] else
+                KafkaTimeoutError("slow broker") if m["id"] == ids[1] else None for m in payloads]
+
+    relay = OutboxRelay(publisher=poison, batch_size=10, retry_delay=0, max_attempts=2)
+    assert relay.drain_once() == 1
+    assert relay.drain_once() == 0
+    assert relay.drain_once() == 0
+    # The poison row is parked after two attempts; the retriable failure never is
+    assert attempts == [ids, ids[:2], ids[1:2]]
+    clean_outbox.expire_all()
+    rows = {str(r.record_id): r for r in clean_outbox.query(OutboxEvent).all()}
+    assert rows[ids[0]].failed_at is not None and rows[ids[0]].attempts == 2
+    assert rows[ids[1]].failed_at is None and rows[ids[1]].attempts == 3
+    assert relay.pending() == 1
+
+    # Until its backoff is over, a failed row is skipped
+    relay = OutboxRelay(publisher=poison, batch_size=10, retry_delay=60, max_attempts=0)
+    del attempts[:]
+    assert relay.drain_once() == 0
+    assert relay.drain_once() == 0
+    assert attempts == [ids[1:2]]
+
+
+def test_relay_thread_drains_on_wake(clean_outbox):
+    import threading
+    sent = []
+    done = threading.Event()
+
+    def record(payloads):
+        sent.extend(payloads)
+        done.set()
+        return [None] * len(payloads)
+
+    relay = OutboxRelay(publisher=record, batch_size=10, poll_interval=30)
+    relay.start()
+    try:
+        _add_events(clean_outbox, 1)
+        relay.wake()
+        assert done.wait(5)
+    finally:
+        relay.stop()
+    assert len(sent) == 1
@@ -0,0 +1,156 @@
+import csv
+import gzip
+import uuid
+import datetime
+import pytest
+from sqlalchemy import create_engine, text
+from app.db import DATABASE_URL
+from app.partitions import (
+    PartitionMaintainer, add_months, create_partition, ensure_partitions, month_bounds, month_partitions,
+    partition_name,
+)
+
+TODAY = datetime.date(2026, 10, 17)
+
+
+@pytest.fixture
+def scratch():
+    """An engine whose emails table lives in an empty schema of its own."""
+    admin = create_engine(DATABASE_URL)
+    with admin.begin() as conn:
+        conn.execute(text("DROP SCHEMA IF EXISTS test_partitions CASCADE"))
+        conn.execute(text("CREATE SCHEMA test_partitions"))
+    engine = create_engine(DATABASE_URL, connect_args={"options": "-csearch_path=test_partitions"})
+    yield engine
+    engine.dispose()
+    with admin.begin() as conn:
+        conn.execute(text("DROP SCHEMA test_partitions CASCADE"))
+    admin.dispose()
+
+
+def _insert(conn, submitted_at, body="Body"):
+    conn.execute(text(
+        "INSERT INTO emails (id, email_id, first_name, last_name, subject, body, attachment_name, attachment_data, "
+        "submitted_at) VALUES (:id, 'p@example.com', 'Part', 'Ition', 'Refund please', :body, 'a.bin', :data, :at)"
+    ), {"id": uuid.uuid4(), "body": body, "data": b"\x00\x01,\n", "at": submitted_at})
+
+
+def _at(year, month, day=15):
+    return datetime.datetime(year, month, day, 12, tzinfo=datetime.timezone.utc)
+
+
+def test_month_arithmetic():
+    assert add_months(datetime.date(2024, 11, 1), 3) == datetime.date(2025, 2, 1)
+    assert add_months(datetime.date(2024, 1, 1), -1) == datetime.date(2023, 12, 1)
+    assert partition_name(datetime.date(2025, 2, 1)) == "emails_p202502"
+    february = (_at(2025, 2, 1).replace(hour=0), _at(2025, 3, 1).replace(hour=0))
+    assert month_bounds(datetime.datetime(2025, 2, 28, 23, 30)) == february
+    # 1 March in UTC+2 is still February in UTC
+    east = datetime.timezone(datetime.timedelta(hours=2))
+    assert month_bounds(datetime.datetime(2025, 3, 1, 1, tzinfo=east)) == february
+
+
+def test_ensure_partitions_converts_a_plain_table(scratch):
+    with scratch.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE emails (id UUID PRIMARY KEY, email_id TEXT NOT NULL, first_name TEXT NOT NULL, "
+            "last_name TEXT NOT NULL, subject TEXT NOT NULL, body TEXT NOT NULL, attachment_name TEXT, "
+            "attachment_data BYTEA, submitted_at TIMESTAMPTZ DEFAULT NOW())"
+        ))
+        _insert(conn, _at(2026, 8))
+        _insert(conn, _at(2026, 10, 2))
+    ensure_partitions(scratch, today=TODAY, precreate_months=1)
+    ensure_partitions(scratch, today=TODAY, precreate_months=1)   # nothing left to do
+    with scratch.begin() as conn:
+        assert conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('emails')")).scalar() == "p"
+        assert sorted(month_partitions(conn).values()) == [
+            "emails_p202608", "emails_p202609", "emails_p202610", "emails_p202611",
+        ]
+        assert conn.execute(text("SELECT count(*) FROM emails_p202608")).scalar() == 1
+        assert conn.execute(text("SELECT count(*) FROM emails_default")).scalar() == 0
+        # The generated search column is filled in for copied rows
+        assert conn.execute(text(
+            "SELECT count(*) FROM emails WHERE search_vector @@ websearch_to_tsquery('english', 'refund')"
+        )).scalar() == 2
+
+
+def test_create_partition_moves_rows_out_of_the_default_partition(scratch):
+    ensure_partitions(scratch, today=TODAY, precreate_months=0)
+    with scratch.begin() as conn:
+        _insert(conn, _at(2030, 5))
+        assert conn.execute(text("SELECT count(*) FROM emails_default")).scalar() == 1
+        assert create_partition(conn, datetime.date(2030, 5, 1))
+        assert not create_partition(conn, datetime.date(2030, 5, 1))
+        assert conn.execute(text("SELECT count(*) FROM emails_default")).scalar() == 0
+        assert conn.execute(text("SELECT count(*) FROM emails_p203005")).scalar() == 1
+
+
+def test_maintainer_precreates_and_archives_expired_months(scratch, tmp_path):
+    ensure_partitions(scratch, today=TODAY, precreate_months=0)
+    with scratch.begin() as conn:
+        create_partition(conn, datetime.date(2026, 6, 1))
+        _insert(conn, _at(2026, 6), body='Line one\nline "two", three')
+        _insert(conn, _at(2026, 6, 20))
+        _insert(conn, _at(2026, 10))
+    maintainer = PartitionMaintainer(
+        scratch, archive_dir=str(tmp_path), precreate_months=2, retention_months=3, today=lambda: TODAY,
+    )
+    result = maintainer.maintain_once()
+    assert result == {
+        "created": ["emails_p202611", "emails_p202612"],
+        "archived": [str(tmp_path / "emails_p202606.csv.gz")],
+    }
+    with gzip.open(tmp_path / "emails_p202606.csv.gz", "rt", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["body"] for row in rows] == ['Line one\nline "two", three', "Body"]
+    assert rows[0]["attachment_data"] == "\\x00012c0a"
+    assert "search_vector" not in rows[0]
+    assert list(tmp_path.iterdir()) == [tmp_path / "emails_p202606.csv.gz"]
+    with scratch.begin() as conn:
+        assert conn.execute(text("SELECT to_regclass('emails_p202606')")).scalar() is None
+        assert conn.execute(text("SELECT count(*) FROM emails")).scalar() == 1
+    assert maintainer.maintain_once() == {"created": [], "archived": []}
+
+
+def test_maintainer_moves_default_rows_into_their_months(scratch, tmp_path):
+    ensure_partitions(scratch, today=TODAY, precreate_months=0)
+    with scratch.begin() as conn:
+        _insert(conn, _at(2025, 3))      # before retention: archived in the same pass
+        _insert(conn, _at(2026, 9))      # kept, in a month that was never created
+    maintainer = PartitionMaintainer(
+        scratch, archive_dir=str(tmp_path), precreate_months=0, retention_months=3, today=lambda: TODAY,
+    )
+    assert maintainer.maintain_once() == {
+        "created": ["emails_p202503", "emails_p202609"],
+        "archived": [str(tmp_path / "emails_p202503.csv.gz")],
+    }
+    with gzip.open(tmp_path / "emails_p202503.csv.gz", "rt", newline="") as f:
+        assert len(list(csv.DictReader(f))) == 1
+    with scratch.begin() as conn:
+        assert conn.execute(text("SELECT count(*) FROM emails_default")).scalar() == 0
+        assert conn.execute(text("SELECT count(*) FROM emails_p202609")).scalar() == 1
+
+
+def test_maintainer_finishes_a_detached_month(scratch, tmp_path):
+    ensure_partitions(scratch, today=TODAY, precreate_months=0)
+    with scratch.begin() as conn:
+        create_partition(conn, datetime.date(2025, 1, 1))
+        _insert(conn, _at(2025, 1))
+        # As left by a pass that stopped between detaching and dropping
+        conn.execute(text("ALTER TABLE emails DETACH PARTITION emails_p202501"))
+    maintainer = PartitionMaintainer(
+        scratch, archive_dir=str(tmp_path), precreate_months=0, retention_months=12, today=lambda: TODAY,
+    )
+    assert maintainer.maintain_once()["archived"] == [str(tmp_path / "emails_p202501.csv.gz")]
+    with scratch.begin() as conn:
+        assert conn.execute(text("SELECT to_regclass('emails_p202501')")).scalar() is None
+
+
+def test_maintainer_skips_the_pass_while_another_replica_holds_the_lock(scratch, tmp_path):
+    ensure_partitions(scratch, today=TODAY, precreate_months=0)
+    maintainer = PartitionMaintainer(scratch, archive_dir=str(tmp_path), precreate_months=1, today=lambda: TODAY)
+    with scratch.connect() as other:
+        other.execute(text("SELECT pg_advisory_lock(:id)"), {"id": 0x656D61696C73})
+        assert maintainer.maintain_once() is None
+        other.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": 0x656D61696C73})
+    assert maintainer.maintain_once() == {"created": ["emails_p202611"], "archived": []}
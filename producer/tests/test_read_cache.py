@@ -0,0 +1,73 @@
+from app.read_cache import CachedResponse, ReadCache, SharedCache, TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """Redis stand-in: get, set with ex=, delete"""
+
+    def __init__(self):
+        self.data, self.fail = {}, False
+
+    def get(self, key):
+        if self.fail:
+            raise ConnectionError("redis down")
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        if self.fail:
+            raise ConnectionError("redis down")
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+def test_ttl_cache_expires_and_evicts_least_recently_used():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=2, clock=clock)
+    cache.set("a", 1, ttl=10)
+    cache.set("b", 2, ttl=10)
+    assert cache.get("a") == 1          # a is now the most recently used
+    cache.set("c", 3, ttl=10)
+    assert cache.get("b") is None and cache.get("a") == 1
+
+    clock.now = 10
+    assert cache.get("a") is None and len(cache) == 1
+
+
+def test_read_cache_fills_both_tiers_and_invalidates_them():
+    redis = FakeRedis()
+    cache = ReadCache(TTLCache(), SharedCache(redis))
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return b'{"id": 1}'
+
+    first = cache.load("id:1", loader, ttl=60)
+    assert first == CachedResponse.of(b'{"id": 1}')
+    assert cache.get_local("id:1") == first
+
+    other_replica = ReadCache(TTLCache(), SharedCache(redis))
+    assert other_replica.load("id:1", loader, ttl=60) == first
+    assert len(loads) == 1
+
+    cache.invalidate(["id:1"])
+    assert cache.get_local("id:1") is None and redis.data == {}
+    assert cache.load("missing", lambda: None, ttl=60) is None
+    assert cache.get_local("missing") is None
+
+
+def test_shared_tier_failures_fall_back_to_the_loader():
+    redis = FakeRedis()
+    redis.fail = True
+    cache = ReadCache(TTLCache(), SharedCache(redis))
+    assert cache.load("id:2", lambda: b"{}", ttl=60).body == b"{}"
+    assert cache.get_local("id:2").body == b"{}"
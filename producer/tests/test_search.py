@@ -0,0 +1,45 @@
+import uuid
+import datetime
+from collections import namedtuple
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.search import Cursor, decode_cursor, encode_cursor, page_query, search_query, split_page
+from app.models import EmailRecord
+
+Row = namedtuple("Row", "id submitted_at rank")
+
+
+def test_cursor_round_trip():
+    row = Row(uuid.uuid4(), datetime.datetime(2026, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc), 0.1 / 3)
+    assert decode_cursor(encode_cursor(row)) == Cursor(row.submitted_at, row.id)
+    assert decode_cursor(encode_cursor(row, row.rank), search=True) == Cursor(row.submitted_at, row.id, row.rank)
+
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", "WzFd", encode_cursor(Row(uuid.uuid4(), datetime.datetime.now(), None))])
+def test_malformed_or_mismatched_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, search=True)
+
+
+def test_split_page_only_returns_a_cursor_when_there_is_more():
+    now = datetime.datetime.now(datetime.timezone.utc)
+    rows = [Row(uuid.uuid4(), now, 1.0) for _ in range(3)]
+    assert split_page(rows, 3) == (rows, None)
+    page, cursor = split_page(rows, 2)
+    assert page == rows[:2] and decode_cursor(cursor).id == rows[1].id
+
+
+def test_queries_page_by_key_instead_of_offset():
+    after = Cursor(datetime.datetime.now(datetime.timezone.utc), uuid.uuid4(), 0.5)
+    listing = str(page_query([EmailRecord.id], 50, "a@example.com", after).compile(dialect=postgresql.dialect()))
+    assert "(emails.submitted_at, emails.id) <" in listing and "OFFSET" not in listing
+    search = str(search_query([EmailRecord.id], "refund", 50, after).compile(dialect=postgresql.dialect()))
+    assert "emails.search_vector @@ websearch_to_tsquery('english'::regconfig" in search
+    assert "ORDER BY CAST(ts_rank_cd" in search and "(CAST(ts_rank_cd(matches.search_vector" in search
+    assert "AS FLOAT(53)), matches.submitted_at, matches.id) <" in search
+    assert "ORDER BY emails.submitted_at DESC, emails.id DESC \n LIMIT" in search
+    assert "ORDER BY emails.submitted_at" not in str(
+        search_query([EmailRecord.id], "refund", 50, window=0).compile(dialect=postgresql.dialect())
+    )
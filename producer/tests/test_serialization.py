@@ -0,0 +1,37 @@
+import json
+
+import msgpack
+import pytest
+
+from app.serialization import SCHEMAS, JsonSerializer, MsgpackSerializer, get_serializer
+
+PAYLOAD = {
+    "id": "0b9f", "submitted_at": 1700000000.5, "email_id": "a@example.com", "first_name": "A",
+    "last_name": "B", "subject": "S", "body": "B", "attachment": None,
+}
+
+
+def test_json_serializer_matches_original_format():
+    serializer = JsonSerializer()
+    assert json.loads(serializer.encode(PAYLOAD)) == PAYLOAD
+    assert serializer.headers == [("content-type", b"application/json")]
+
+
+def test_msgpack_serializer_is_positional_and_smaller():
+    serializer = MsgpackSerializer()
+    encoded = serializer.encode(PAYLOAD)
+    assert msgpack.unpackb(encoded) == [PAYLOAD[k] for k in SCHEMAS[1]]
+    assert len(encoded) < len(JsonSerializer().encode(PAYLOAD)) / 2
+    assert dict(serializer.headers) == {"content-type": b"application/msgpack", "schema-id": b"1"}
+
+
+def test_msgpack_serializer_keeps_unknown_keys_in_trailing_map():
+    values = msgpack.unpackb(MsgpackSerializer().encode({**PAYLOAD, "trace_id": "t1"}))
+    assert len(values) == len(SCHEMAS[1]) + 1
+    assert values[-1] == {"trace_id": "t1"}
+
+
+def test_get_serializer_rejects_unknown_format():
+    assert isinstance(get_serializer("msgpack"), MsgpackSerializer)
+    with pytest.raises(ValueError, match="KAFKA_MESSAGE_FORMAT"):
+        get_serializer("avro")
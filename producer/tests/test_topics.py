@@ -0,0 +1,44 @@
+import pytest
+from kafka.errors import TopicAlreadyExistsError
+
+from app.topics import ensure_topic
+
+
+class FakeAdmin:
+    def __init__(self, existing=None):
+        self.existing = existing
+        self.created = []
+        self.grown = {}
+        self.closed = False
+
+    def __call__(self, **config):
+        return self
+
+    def create_topics(self, topics):
+        if self.existing is not None:
+            raise TopicAlreadyExistsError()
+        self.created.extend((t.name, t.num_partitions) for t in topics)
+
+    def describe_topics(self, topics):
+        return [{"topic": t, "error_code": 0, "partitions": [{}] * self.existing} for t in topics]
+
+    def create_partitions(self, partitions):
+        self.grown.update({t: p.total_count for t, p in partitions.items()})
+
+    def close(self):
+        self.closed = True
+
+
+def test_creates_missing_topic():
+    admin = FakeAdmin()
+    assert ensure_topic("complaints.v1", partitions=6, broker="b:9092", admin_factory=admin) == 6
+    assert admin.created == [("complaints.v1", 6)]
+    assert admin.closed
+
+
+@pytest.mark.parametrize("existing, expected, grown", [(1, 6, {"complaints.v1": 6}), (12, 12, {})])
+def test_grows_but_never_shrinks_existing_topic(existing, expected, grown):
+    admin = FakeAdmin(existing=existing)
+    assert ensure_topic("complaints.v1", partitions=6, broker="b:9092", admin_factory=admin) == expected
+    assert admin.grown == grown
+    assert admin.closed
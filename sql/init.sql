@@ -1,15 +1,62 @@
 CREATE EXTENSION IF NOT EXISTS pgcrypto;
 
+-- Range-partitioned by month on submitted_at (emails_pYYYYMM). The producer creates the
+-- monthly partitions ahead of time and archives expired ones (producer/app/partitions.py);
+-- rows outside every month go to emails_default. The primary key has to include the
+-- partition key. An existing unpartitioned table is converted by `python -m app.partitions`.
 CREATE TABLE IF NOT EXISTS emails (
-  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  id UUID NOT NULL DEFAULT gen_random_uuid(),
   email_id TEXT NOT NULL,
   first_name TEXT NOT NULL,
   last_name TEXT NOT NULL,
   subject TEXT NOT NULL,
   body TEXT NOT NULL,
   attachment_name TEXT,
-  attachment_data BYTEA,
-  submitted_at TIMESTAMPTZ DEFAULT NOW()
+  attachment_data BYTEA,            -- legacy inline attachments
+  attachment_ref TEXT,              -- sha256:<hex> in the blob store
+  attachment_size BIGINT,
+  submitted_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (id, submitted_at)
+) PARTITION BY RANGE (submitted_at);
+
+CREATE TABLE IF NOT EXISTS emails_default PARTITION OF emails DEFAULT;
+
+-- Full-text document for GET /complaints/search; subject matches rank above body matches.
+-- Keep the expression in step with SEARCH_VECTOR_SQL in producer/app/models.py.
+ALTER TABLE emails ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+  setweight(to_tsvector('english', subject), 'A') || setweight(to_tsvector('english', body), 'B')
+) STORED;
+
+-- Keyset pagination (newest first) for GET /complaints, over all complaints or one address's
+CREATE INDEX IF NOT EXISTS idx_emails_submitted_at_id ON emails(submitted_at, id);
+CREATE INDEX IF NOT EXISTS idx_emails_email_id_submitted_at ON emails(email_id, submitted_at, id);
+CREATE INDEX IF NOT EXISTS idx_emails_search_vector ON emails USING GIN (search_vector);
+
+-- Transactional outbox: rows are inserted alongside emails and drained to Kafka by the producer's relay.
+CREATE TABLE IF NOT EXISTS outbox (
+  id BIGSERIAL PRIMARY KEY,
+  record_id UUID NOT NULL,
+  payload JSONB NOT NULL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  last_error TEXT,
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  next_attempt_at TIMESTAMPTZ,
+  failed_at TIMESTAMPTZ
 );
 
-CREATE INDEX IF NOT EXISTS idx_emails_email_id ON emails(email_id);
+-- Complaint ids the consumer has emailed; checked before every send so redeliveries are skipped.
+CREATE TABLE IF NOT EXISTS sent_emails (
+  id TEXT PRIMARY KEY,
+  status TEXT NOT NULL,
+  sent_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Responses to POST /submit requests sent with an Idempotency-Key, written in the same
+-- transaction as the complaint; a retry with the same key replays the stored response.
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+  key TEXT PRIMARY KEY,
+  fingerprint TEXT NOT NULL,        -- sha256 of the request
+  response JSONB NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at ON idempotency_keys(created_at);
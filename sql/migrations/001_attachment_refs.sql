@@ -0,0 +1,4 @@
+-- Attachments move out of the emails row into the blob store; only a reference is kept.
+-- init.sql already creates these columns; run this on databases created before the change.
+ALTER TABLE emails ADD COLUMN IF NOT EXISTS attachment_ref TEXT;
+ALTER TABLE emails ADD COLUMN IF NOT EXISTS attachment_size BIGINT;
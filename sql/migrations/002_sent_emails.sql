@@ -0,0 +1,7 @@
+-- Consumer dedup store. init.sql already creates it, and the consumer creates it on startup
+-- if missing; run this to create it ahead of a consumer deploy on existing databases.
+CREATE TABLE IF NOT EXISTS sent_emails (
+  id TEXT PRIMARY KEY,
+  status TEXT NOT NULL,
+  sent_at TIMESTAMPTZ DEFAULT NOW()
+);
@@ -0,0 +1,5 @@
+-- Outbox rows that keep failing back off and are eventually parked instead of retried forever.
+-- init.sql already creates these columns and the producer adds them on startup if missing;
+-- both are nullable without a default, so adding them does not rewrite the table.
+ALTER TABLE outbox ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMPTZ;
+ALTER TABLE outbox ADD COLUMN IF NOT EXISTS failed_at TIMESTAMPTZ;